@@ -1,8 +1,26 @@
 import warnings
 import builtins
 import struct       # used for reading the PEAK chunk, as it contains floating point values in the bytestring
+import mmap
+import functools
+import types
+import io
+import concurrent.futures
+import threading
+import math
+import time
+import datetime
+import collections
+import weakref
+import os
+import collections.abc
 
 builtin_open = builtins.open
+builtin_mmap = mmap.mmap
+
+# NumPy is an optional dependency. It is only imported by the functions that need it (see _import_numpy()),
+# so that the module stays importable (and quick to import) without it.
+numpy = None
 
 # bti(bytes_: bytes) -> int
 #     Converts bytes to int (little endian)
@@ -21,11 +39,11 @@ clstr = lambda bytes_: bytes_.decode().replace('\x00','')
 # I think this may be moved into the class now. However, not sure if required for other stuff if we externalize the chunk parsing for instance.
 WAVE_FORMAT_UNKNOWN         = 0x0000      # unknown, unsupported
 WAVE_FORMAT_PCM             = 0x0001      # uncompressed, supported
-WAVE_FORMAT_ADPCM           = 0x0002      # compressed, unsupported
+WAVE_FORMAT_ADPCM           = 0x0002      # compressed, decoded by read_frames()
 WAVE_FORMAT_IEEE_FLOAT      = 0x0003      # uncompressed, supported
-WAVE_FORMAT_ALAW            = 0x0006      # compressed, unsupported
-WAVE_FORMAT_MULAW           = 0x0007      # compressed, unsupported
-WAVE_FORMAT_DVI_ADPCM       = 0x0011      # compressed, unsupported
+WAVE_FORMAT_ALAW            = 0x0006      # compressed, decoded by read_frames()
+WAVE_FORMAT_MULAW           = 0x0007      # compressed, decoded by read_frames()
+WAVE_FORMAT_DVI_ADPCM       = 0x0011      # compressed, decoded by read_frames()
 WAVE_FORMAT_G723_ADPCM      = 0x0014      # compressed, unsupported
 WAVE_FORMAT_GSM610          = 0x0031      # compressed, unsupported
 WAVE_FORMAT_MPEG            = 0x0050      # compressed, unsupported
@@ -57,17 +75,19 @@ class PCMWAVEFORMAT(WAVEFORMAT):
 
 class WAVEFORMATEX(PCMWAVEFORMAT):
     cbSize = 0
+    Extra = b""             # the <cbSize> format specific bytes after the structure, e.g. the ADPCM coefficients
 
     def __init__(self, data = None):
         if data:
-            assert type(data) == bytes and len(data) == 18, "expected a data stream of 18 bytes"
+            assert type(data) == bytes and len(data) >= 18, "expected a data stream of at least 18 bytes"
             self.FormatTag      = bti(data[:2])
             self.Channels       = bti(data[2:4])
             self.SamplesPerSec  = bti(data[4:8])
             self.AvgBytesPerSec = bti(data[8:12])
             self.BlockAlign     = bti(data[12:14])
             self.BitsPerSample  = bti(data[14:16])
-            self.cbSize         = bti(data[16:])
+            self.cbSize         = bti(data[16:18])
+            self.Extra          = data[18:18 + self.cbSize]
 
 
 class WAVEFORMATEXTENSIBLE(WAVEFORMATEX):
@@ -112,10 +132,389 @@ class PyWaveWarning(UserWarning):
     pass
 
 
+# _import_numpy(required: bool = True) -> module
+#     Imports NumPy on first use. Raises a PyWaveError if it is not installed,
+#     or returns None in that case if it isn't `required`.
+def _import_numpy(required = True):
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as numpy_module
+        except ImportError:
+            if required:
+                raise PyWaveError("this function requires NumPy, which is not installed (pip install numpy).")
+            return None
+        numpy = numpy_module
+    return numpy
+
+
+# _numpy_dtype(sample_format: int, bits_per_sample: int) -> str
+#     Returns the NumPy dtype that stores a single sample of the given format in the file,
+#     or None if there is no such type (e.g. packed 24 bit samples or compressed formats).
+def _numpy_dtype(sample_format, bits_per_sample):
+    if sample_format == WAVE_FORMAT_PCM:
+        return {8: "u1", 16: "<i2", 32: "<i4", 64: "<i8"}.get(bits_per_sample)
+    if sample_format == WAVE_FORMAT_IEEE_FLOAT:
+        return {32: "<f4", 64: "<f8"}.get(bits_per_sample)
+    return None
+
+
+# _decode_frames(data: bytes, channels: int, sample_format: int, bits_per_sample: int, valid_bits_per_sample: int, dtype = None) -> numpy.ndarray
+#     Converts interleaved sample data to a (frames, channels) NumPy array without looping over the samples in Python.
+#     <dtype> can be "float32", "float64", "int16", "int32" or None / "native".
+#     Integers are scaled to the full range of the requested type, floats are in the range [-1.0, 1.0).
+#     The "native" type keeps float samples as they are, and returns integer samples at their valid bit depth
+#     (e.g. 24 bit samples, packed or in a 32 bit container, are returned as int32 in the range [-2**23, 2**23)).
+#     8 bit samples are unsigned and are returned as uint8 by "native".
+def _decode_frames(data, channels, sample_format, bits_per_sample, valid_bits_per_sample, dtype = None):
+    np = _import_numpy()
+    if dtype in (None, "native"):
+        dtype = None
+    else:
+        dtype = np.dtype(dtype)
+        assert dtype.name in ("float32", "float64", "int16", "int32"), "dtype has to be 'float32', 'float64', 'int16', 'int32' or 'native'"
+
+    bytes_per_sample = (bits_per_sample + 7) // 8
+    frames = len(data) // (bytes_per_sample * channels)
+    count = frames * channels
+
+    if sample_format == WAVE_FORMAT_IEEE_FLOAT:
+        native = _numpy_dtype(sample_format, bits_per_sample)
+        if native is None:
+            raise PyWaveError("cannot decode {} bit float samples.".format(bits_per_sample))
+        samples = np.frombuffer(data, dtype = native, count = count)
+        if dtype is None:
+            pass
+        elif dtype.kind == "f":
+            samples = samples.astype(dtype)
+        else:
+            full_scale = 2 ** (dtype.itemsize * 8 - 1)
+            samples = np.clip(np.rint(samples * float(full_scale)), -full_scale, full_scale - 1).astype(dtype)
+        return samples.reshape(frames, channels)
+
+    if sample_format in (WAVE_FORMAT_ALAW, WAVE_FORMAT_MULAW):
+        # G.711 samples are 8 bit codes of 16 bit samples, decoded with a lookup table
+        samples = _g711_table(sample_format)[np.frombuffer(data, dtype = "u1", count = count)]
+        return _convert_samples(samples, 16, dtype).reshape(frames, channels)
+
+    if sample_format != WAVE_FORMAT_PCM:
+        raise PyWaveError("cannot decode samples of wave format {:#06x}.".format(sample_format))
+
+    if bytes_per_sample == 1:
+        if dtype is None:
+            return np.frombuffer(data, dtype = "u1", count = count).reshape(frames, channels)
+        samples = np.frombuffer(data, dtype = "u1", count = count).astype("<i2") - 128
+        bits = 8
+    elif bytes_per_sample == 3:
+        # Packed 24 bit samples: copy the 3 bytes of every sample into the upper 3 bytes of an int32,
+        # then shift them back down, which sign-extends them.
+        packed = np.frombuffer(data, dtype = "u1", count = count * 3).reshape(count, 3)
+        padded = np.zeros((count, 4), dtype = "u1")
+        padded[:, 1:] = packed
+        samples = padded.view("<i4").reshape(count) >> 8
+        bits = 24
+    else:
+        native = _numpy_dtype(sample_format, bytes_per_sample * 8)
+        if native is None:
+            raise PyWaveError("cannot decode {} bit PCM samples.".format(bits_per_sample))
+        samples = np.frombuffer(data, dtype = native, count = count)
+        bits = bytes_per_sample * 8
+
+    # samples in a larger container (e.g. 24 in 32 bit) are left-justified, the unused low bits are discarded.
+    valid_bits = min(valid_bits_per_sample or bits, bits)
+    if valid_bits < bits:
+        samples = samples >> (bits - valid_bits)
+    return _convert_samples(samples, valid_bits, dtype).reshape(frames, channels)
+
+
+# _convert_samples(samples: numpy.ndarray, valid_bits: int, dtype: numpy.dtype) -> numpy.ndarray
+#     Converts signed integer samples with <valid_bits> bits to <dtype> (None keeps them as they are), see _decode_frames().
+def _convert_samples(samples, valid_bits, dtype):
+    if dtype is None:
+        out = samples
+    elif dtype.kind == "f":
+        out = (samples * (1.0 / 2 ** (valid_bits - 1))).astype(dtype)
+    else:
+        target_bits = dtype.itemsize * 8
+        if valid_bits > target_bits:
+            out = (samples >> (valid_bits - target_bits)).astype(dtype)
+        else:
+            out = samples.astype(dtype) << (target_bits - valid_bits)
+    return out
+
+
+# The decoded values of all 256 A-law / µ-law codes (ITU-T G.711), built on first use by _g711_table().
+_G711_TABLES = {}
+
+# _g711_table(sample_format: int) -> numpy.ndarray
+#     Returns the int16 lookup table of WAVE_FORMAT_ALAW or WAVE_FORMAT_MULAW.
+def _g711_table(sample_format):
+    np = _import_numpy()
+    if sample_format not in _G711_TABLES:
+        codes = np.arange(256)
+        if sample_format == WAVE_FORMAT_ALAW:
+            codes ^= 0x55
+            exponent = (codes & 0x70) >> 4
+            magnitude = ((codes & 0x0F) << 4) + np.where(exponent == 0, 8, 0x108)
+            magnitude = np.where(exponent > 1, magnitude << np.maximum(exponent - 1, 0), magnitude)
+            table = np.where(codes & 0x80, magnitude, -magnitude)
+        else:
+            codes = ~codes & 0xFF
+            magnitude = (((codes & 0x0F) << 3) + 0x84) << ((codes & 0x70) >> 4)
+            table = np.where(codes & 0x80, 0x84 - magnitude, magnitude - 0x84)
+        _G711_TABLES[sample_format] = table.astype("<i2")
+    return _G711_TABLES[sample_format]
+
+
+# IMA / DVI ADPCM (WAVE_FORMAT_DVI_ADPCM) tables
+_IMA_STEPS = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97, 107, 118,
+    130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963, 1060,
+    1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484,
+    7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767,
+)
+_IMA_INDEX_CHANGES = (-1, -1, -1, -1, 2, 4, 6, 8) * 2
+
+
+# _ima_adpcm_tables() -> tuple
+#     Returns two (89, 8) arrays, indexed by the step index and the magnitude bits of a nibble: the difference that
+#     the nibble stands for and the next step index. They replace the bit tests of the reference decoder.
+def _ima_adpcm_tables():
+    np = _import_numpy()
+    step = np.array(_IMA_STEPS, dtype = "i4")[:, np.newaxis]
+    magnitude = np.arange(8)
+    differences = (step >> 3) + (magnitude & 4 != 0) * step + (magnitude & 2 != 0) * (step >> 1) + (magnitude & 1 != 0) * (step >> 2)
+    next_index = np.clip(np.arange(89)[:, np.newaxis] + np.array(_IMA_INDEX_CHANGES[:8]), 0, 88)
+    return differences.astype("i4"), next_index.astype("i4")
+
+# Microsoft ADPCM (WAVE_FORMAT_ADPCM) tables
+_MS_ADPCM_ADAPTATION = (230, 230, 230, 230, 307, 409, 512, 614, 768, 614, 512, 409, 307, 230, 230, 230)
+_MS_ADPCM_COEFFICIENTS = ((256, 0), (512, -256), (0, 0), (192, 64), (240, 0), (460, -208), (392, -232))
+
+
+# _decode_adpcm(data: bytes, channels: int, sample_format: int, block_align: int, coefficients = None, dtype = None) -> numpy.ndarray
+#     Decodes IMA (WAVE_FORMAT_DVI_ADPCM) or Microsoft (WAVE_FORMAT_ADPCM) ADPCM data to a (frames, channels) array of
+#     16 bit samples, converted to <dtype> like _decode_frames() does. <data> consists of whole blocks of <block_align>
+#     bytes, optionally followed by a shorter last block. The decoding of a block is sequential, but all blocks and
+#     channels are decoded at the same time, so the Python loop only runs once per sample of a block.
+def _decode_adpcm(data, channels, sample_format, block_align, coefficients = None, dtype = None):
+    np = _import_numpy()
+    if dtype not in (None, "native"):
+        dtype = np.dtype(dtype)
+        assert dtype.name in ("float32", "float64", "int16", "int32"), "dtype has to be 'float32', 'float64', 'int16', 'int32' or 'native'"
+    else:
+        dtype = None
+    decode = _decode_ima_adpcm_blocks if sample_format == WAVE_FORMAT_DVI_ADPCM else _decode_ms_adpcm_blocks
+
+    data = np.frombuffer(data, dtype = "u1")
+    whole = len(data) // block_align * block_align
+    parts = []
+    if whole:
+        parts.append(decode(data[:whole].reshape(-1, block_align), channels, coefficients))
+    if whole < len(data):
+        parts.append(decode(data[whole:].reshape(1, -1), channels, coefficients))
+    samples = np.concatenate(parts) if parts else np.zeros((0, channels), dtype = "<i2")
+    return _convert_samples(samples, 16, dtype)
+
+
+def _decode_ima_adpcm_blocks(blocks, channels, coefficients = None):
+    """Decodes an array of IMA ADPCM blocks of equal size, see _decode_adpcm()."""
+    np = _import_numpy()
+    count, size = blocks.shape
+    header = blocks[:, :4 * channels].reshape(count, channels, 4)
+    predictor = header[:, :, 0:2].copy().view("<i2")[:, :, 0].astype("i4").ravel()
+    index = np.minimum(header[:, :, 2], 88).astype("i4").ravel()
+
+    # after the header, each channel has 4 bytes (8 samples, low nibble first) in turn
+    groups = (size - 4 * channels) // (4 * channels)
+    data = blocks[:, 4 * channels:4 * channels * (groups + 1)].reshape(count, groups, channels, 4)
+    nibbles = np.stack((data & 0x0F, data >> 4), axis = -1).reshape(count, groups, channels, 8)
+    nibbles = nibbles.transpose(0, 2, 1, 3).reshape(count * channels, groups * 8).astype("i4")
+
+    differences, next_index = _ima_adpcm_tables()
+    signs = 1 - ((nibbles >> 2) & 2)            # nibble bit 3 is the sign
+    magnitudes = nibbles & 7
+    out = np.empty((count * channels, groups * 8 + 1), dtype = "<i2")
+    out[:, 0] = predictor
+    for position in range(groups * 8):
+        magnitude = magnitudes[:, position]
+        predictor = np.clip(predictor + signs[:, position] * differences[index, magnitude], -32768, 32767)
+        index = next_index[index, magnitude]
+        out[:, position + 1] = predictor
+    return out.reshape(count, channels, -1).transpose(0, 2, 1).reshape(-1, channels)
+
+
+def _decode_ms_adpcm_blocks(blocks, channels, coefficients = None):
+    """Decodes an array of Microsoft ADPCM blocks of equal size, see _decode_adpcm()."""
+    np = _import_numpy()
+    count, size = blocks.shape
+    coefficients = np.array(coefficients or _MS_ADPCM_COEFFICIENTS, dtype = "i4")
+    # the header has one byte per channel (the coefficient index), then int16 delta, sample 1 and sample 2 per channel
+    predictor = np.minimum(blocks[:, :channels], len(coefficients) - 1).ravel()
+    values = blocks[:, channels:7 * channels].copy().view("<i2").reshape(count, 3, channels).transpose(0, 2, 1).reshape(-1, 3).astype("i4")
+    delta, sample1, sample2 = values[:, 0], values[:, 1], values[:, 2]
+    coefficient1, coefficient2 = coefficients[predictor, 0], coefficients[predictor, 1]
+
+    # after the header, the nibbles (high nibble first) belong to the channels in turn
+    steps = (size - 7 * channels) * 2 // channels
+    data = blocks[:, 7 * channels:]
+    nibbles = np.stack((data >> 4, data & 0x0F), axis = -1).reshape(count, -1)[:, :steps * channels]
+    nibbles = nibbles.reshape(count, steps, channels).transpose(0, 2, 1).reshape(count * channels, steps).astype("i4")
+
+    adaptation = np.array(_MS_ADPCM_ADAPTATION, dtype = "i4")
+    out = np.empty((count * channels, steps + 2), dtype = "<i2")
+    out[:, 0] = sample2
+    out[:, 1] = sample1
+    for position in range(steps):
+        nibble = nibbles[:, position]
+        signed = nibble - ((nibble & 8) << 1)
+        sample = np.clip(((sample1 * coefficient1 + sample2 * coefficient2) >> 8) + signed * delta, -32768, 32767)
+        sample2, sample1 = sample1, sample
+        delta = np.maximum((adaptation[nibble] * delta) >> 8, 16)
+        out[:, position + 2] = sample
+    return out.reshape(count, channels, -1).transpose(0, 2, 1).reshape(-1, channels)
+
+
+# _encode_frames(frames: numpy.ndarray, sample_format: int, bits_per_sample: int) -> bytes
+#     Converts a (frames, channels) NumPy array to interleaved sample data of the given format, without looping over the samples in Python.
+#     Float input is expected in the range [-1.0, 1.0] and is clipped to the range of the output. Integer input is
+#     interpreted relative to the full range of its type (e.g. int16 uses [-32768, 32767], uint8 is offset by 128).
+def _encode_frames(frames, sample_format, bits_per_sample):
+    np = _import_numpy()
+    frames = np.asarray(frames)
+    kind = frames.dtype.kind
+    assert kind in ("f", "i", "u"), "can only write float or integer frames"
+
+    if kind == "u":
+        assert frames.dtype.itemsize == 1, "unsigned frames are only supported as uint8"
+        frames = frames.astype("<i2") - 128
+        input_bits = 8
+    elif kind == "i":
+        input_bits = frames.dtype.itemsize * 8
+
+    if sample_format == WAVE_FORMAT_IEEE_FLOAT:
+        native = _numpy_dtype(sample_format, bits_per_sample)
+        if native is None:
+            raise PyWaveError("cannot encode {} bit float samples.".format(bits_per_sample))
+        if kind != "f":
+            frames = frames * (1.0 / 2 ** (input_bits - 1))
+        return np.ascontiguousarray(frames, dtype = native).tobytes()
+
+    if sample_format in (WAVE_FORMAT_ALAW, WAVE_FORMAT_MULAW):
+        samples = np.frombuffer(_encode_frames(frames, WAVE_FORMAT_PCM, 16), dtype = "<i2")
+        return _g711_encoding_table(sample_format)[samples.astype("i4") + 32768].tobytes()
+
+    if sample_format != WAVE_FORMAT_PCM:
+        raise PyWaveError("cannot encode samples of wave format {:#06x}.".format(sample_format))
+
+    bytes_per_sample = (bits_per_sample + 7) // 8
+    if bytes_per_sample not in (1, 2, 3, 4):
+        raise PyWaveError("cannot encode {} bit PCM samples.".format(bits_per_sample))
+    bits = bytes_per_sample * 8
+
+    # quantize to <bits_per_sample> and left-justify the samples in their container
+    full_scale = 2 ** (bits_per_sample - 1)
+    if kind == "f":
+        samples = np.clip(np.rint(frames * float(full_scale)), -full_scale, full_scale - 1).astype("<i8")
+    elif input_bits > bits_per_sample:
+        samples = frames.astype("<i8") >> (input_bits - bits_per_sample)
+    else:
+        samples = frames.astype("<i8") << (bits_per_sample - input_bits)
+    if bits > bits_per_sample:
+        samples <<= (bits - bits_per_sample)
+
+    if bytes_per_sample == 1:
+        return (samples + 128).astype("u1").tobytes()
+    if bytes_per_sample == 3:
+        # Packed 24 bit samples: take the 3 low bytes of every (little endian) int32.
+        return np.ascontiguousarray(samples, dtype = "<i4").view("u1").reshape(-1, 4)[:, :3].tobytes()
+    return samples.astype(_numpy_dtype(sample_format, bits)).tobytes()
+
+
+# The A-law / µ-law codes of all 65536 16 bit samples (ITU-T G.711), built on first use by _g711_encoding_table().
+_G711_ENCODING_TABLES = {}
+
+# _g711_encoding_table(sample_format: int) -> numpy.ndarray
+#     Returns the uint8 lookup table of WAVE_FORMAT_ALAW or WAVE_FORMAT_MULAW, indexed by the 16 bit sample + 32768.
+def _g711_encoding_table(sample_format):
+    np = _import_numpy()
+    if sample_format not in _G711_ENCODING_TABLES:
+        samples = np.arange(-32768, 32768)
+        if sample_format == WAVE_FORMAT_ALAW:
+            values = samples >> 3                                   # A-law encodes 13 bits
+            mask = np.where(values >= 0, 0xD5, 0x55)
+            values = np.where(values >= 0, values, -values - 1)
+            segment = np.searchsorted([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF], values)
+            mantissa = np.where(segment < 2, values >> 1, values >> np.maximum(segment, 1)) & 0x0F
+            codes = np.where(segment >= 8, 0x7F, (np.minimum(segment, 7) << 4) | mantissa) ^ mask
+        else:
+            values = samples >> 2                                   # µ-law encodes 14 bits
+            mask = np.where(values >= 0, 0xFF, 0x7F)
+            values = np.minimum(np.abs(values), 8159) + 0x21
+            segment = np.searchsorted([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF], values)
+            codes = np.where(segment >= 8, 0x7F, (np.minimum(segment, 7) << 4) | ((values >> (np.minimum(segment, 7) + 1)) & 0x0F)) ^ mask
+        _G711_ENCODING_TABLES[sample_format] = codes.astype("u1")
+    return _G711_ENCODING_TABLES[sample_format]
+
+
+# _ima_adpcm_block_size(channels: int, frequency: int) -> tuple
+#     Returns the conventional block size (block align) of IMA ADPCM for the given format (256 bytes per channel
+#     at 11025 Hz, growing with the sample rate) and the number of samples (frames) per block.
+def _ima_adpcm_block_size(channels, frequency):
+    block_align = 256 * channels * max(1, frequency // 11025)
+    return block_align, (block_align - 4 * channels) * 8 // (4 * channels) + 1
+
+
+# _encode_ima_adpcm(samples: numpy.ndarray, block_align: int) -> bytes
+#     Encodes the (frames, channels) int16 array <samples> to IMA ADPCM blocks of <block_align> bytes. The number of
+#     frames has to be a multiple of the samples per block. Like the decoder, the encoder runs through the positions
+#     of a block in a Python loop, with all blocks and channels at once. To make the blocks independent of each other,
+#     the step index each block starts with is estimated from its first samples, instead of being carried over from
+#     the end of the previous block.
+def _encode_ima_adpcm(samples, block_align):
+    np = _import_numpy()
+    channels = samples.shape[1]
+    groups = (block_align - 4 * channels) // (4 * channels)
+    samples_per_block = groups * 8 + 1
+    count = len(samples) // samples_per_block
+    samples = samples[:count * samples_per_block].reshape(count, samples_per_block, channels).transpose(0, 2, 1).reshape(count * channels, samples_per_block).astype("i4")
+
+    steps = np.array(_IMA_STEPS, dtype = "i4")
+    differences, next_index = _ima_adpcm_tables()
+    predictor = samples[:, 0].copy()
+    start_index = np.clip(np.searchsorted(steps, np.abs(np.diff(samples[:, :9], axis = 1)).mean(axis = 1)) - 1, 0, 88).astype("i4")
+    index = start_index.copy()
+    nibbles = np.empty((count * channels, groups * 8), dtype = "u1")
+    for position in range(groups * 8):
+        difference = samples[:, position + 1] - predictor
+        negative = difference < 0
+        # the magnitude bits quantize the difference in quarters of the step
+        magnitude = np.minimum((np.abs(difference) << 2) // steps[index], 7)
+        decoded = differences[index, magnitude]
+        predictor = np.clip(np.where(negative, predictor - decoded, predictor + decoded), -32768, 32767)
+        index = next_index[index, magnitude]
+        nibbles[:, position] = magnitude | (negative << 3)
+
+    header = np.zeros((count, channels, 4), dtype = "u1")
+    header[:, :, 0:2] = samples[:, 0].astype("<i2").view("u1").reshape(count, channels, 2)
+    header[:, :, 2] = start_index.reshape(count, channels)
+    # per channel 4 bytes (8 samples, low nibble first) in turn
+    nibbles = nibbles.reshape(count, channels, groups, 8).transpose(0, 2, 1, 3)
+    data = nibbles[..., 0::2] | (nibbles[..., 1::2] << 4)
+    blocks = np.concatenate((header.reshape(count, -1), data.reshape(count, -1)), axis = 1)
+    return np.ascontiguousarray(blocks).tobytes()
+
+
 # RIFF WAVE chunks
 fourccRIFF  = b"RIFF"   # RIFF file tag (1st 4 bytes)
 fourccWAVE  = b"WAVE"   # RIFF subchunk: WAVE file tag (3rd 4 bytes)
 
+# RF64 / BW64 files replace the RIFF tag and store the sizes that don't fit into 32 bits in the ds64 chunk,
+# which has to be the first chunk. See https://tech.ebu.ch/docs/tech/tech3306.pdf and ITU-R BS.2088.
+fourccRF64  = b"RF64"   # RF64 file tag, replaces the RIFF tag
+fourccBW64  = b"BW64"   # Broadcast Wave 64 file tag, replaces the RIFF tag
+fourccDS64  = b"ds64"   # data size 64 chunk, contains the 64 bit sizes of the RIFF and data chunks (and optionally others)
+
 # WAVE subchunks that are part of the 1991 standard (https://www.aelius.com/njh/wavemetatools/doc/riffmci.pdf)
 fourccFMT   = b"fmt "   # format chunk, required for WAV-files
 fourccDATA  = b"data"   # data chunk, required for WAV-files
@@ -185,20 +584,381 @@ fourccCART  = b"cart"   # Often found in BEXT WAV files
 
 # Ignore these chunks in the generic read, as we have dedicated readers for them.
 # We read all other chunks with a generic reader.
-KNOWN_FOURCC = {fourccFMT, fourccDATA, fourccLIST, fourccDISP, fourccBEXT, fourccCART, fourccPEAK}
+KNOWN_FOURCC = {fourccFMT, fourccDATA, fourccLIST, fourccDISP, fourccBEXT, fourccCART, fourccPEAK, fourccDS64}
+
+
+class LazyMetadata(collections.abc.MutableMapping):
+    """A dictionary of metadata entries that are only read and parsed
+when they are first accessed. The parsed values are cached.
+<loaders> maps each key to a function that returns its value."""
+
+    def __init__(self, loaders):
+        self._loaders = dict(loaders)
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self._loaders:
+                raise KeyError(key)
+            self._values[key] = self._loaders.pop(key)()
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._loaders.pop(key, None)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if key not in self._values and key not in self._loaders:
+            raise KeyError(key)
+        self._loaders.pop(key, None)
+        self._values.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._values) + [key for key in self._loaders if key not in self._values])
+
+    def __len__(self):
+        return len(self._values) + len(self._loaders)
+
+    def is_loaded(self, key):
+        """Returns True if the entry <key> has already been read."""
+        return key in self._values
+
+    def __repr__(self):
+        return "LazyMetadata({})".format(", ".join(repr(key) if self.is_loaded(key) else repr(key) + " (not loaded)" for key in self))
+
+
+class Chunk:
+    """A single chunk of a RIFF file.
+<fourcc> - The chunk type (bytes)
+<offset> - The position of the chunk data in the file (after the 8 byte chunk header)
+<size> - The size of the chunk data as stated in the chunk header
+<padding> - The number of pad bytes after the chunk data (0 or 1)"""
+
+    def __init__(self, fourcc, offset, size, padding = 0):
+        self.fourcc     = fourcc
+        self.offset     = offset
+        self.size       = size
+        self.padding    = padding
+
+    @property
+    def end(self):
+        """The position after the chunk data and its padding."""
+        return self.offset + self.size + self.padding
+
+    def __repr__(self):
+        return "Chunk({!r}, offset={}, size={}, padding={})".format(self.fourcc, self.offset, self.size, self.padding)
+
+
+class ChunkIndex:
+    """An ordered index of all the chunks in a RIFF file, including
+repeated chunks (e.g. several LIST chunks).
+For compatibility with the dictionary that was used before,
+<fourcc> in index, index[<fourcc>] (which returns a tuple
+(size, offset) of the first chunk of that type) and iterating
+over the (unique) chunk types work as they did on that dict.
+Use find() / find_all() to get Chunk objects, and the <chunks>
+list for every chunk in file order."""
+
+    # The header is scanned with reads of this size, so small chunks cost no extra system calls.
+    BUFFER_SIZE = 65536
+
+    def __init__(self, chunks = ()):
+        self.chunks = []
+        self._by_fourcc = {}
+        for chunk in chunks:
+            self.append(chunk)
+
+    def append(self, chunk):
+        """Adds <chunk> to the end of the index."""
+        self.chunks.append(chunk)
+        self._by_fourcc.setdefault(chunk.fourcc, []).append(chunk)
+
+    def find(self, fourcc):
+        """Returns the first chunk of type <fourcc>, or None."""
+        chunks = self._by_fourcc.get(fourcc)
+        return chunks[0] if chunks else None
+
+    def find_all(self, fourcc):
+        """Returns a list of all the chunks of type <fourcc>, in file order."""
+        return list(self._by_fourcc.get(fourcc, ()))
+
+    def __contains__(self, fourcc):
+        return fourcc in self._by_fourcc
+
+    def __getitem__(self, fourcc):
+        chunk = self._by_fourcc[fourcc][0]
+        return (chunk.size, chunk.offset)
+
+    def __iter__(self):
+        return iter(self._by_fourcc)
+
+    def __len__(self):
+        return len(self._by_fourcc)
+
+    def keys(self):
+        return self._by_fourcc.keys()
+
+    def __repr__(self):
+        return "ChunkIndex({!r})".format(self.chunks)
+
+    @classmethod
+    def scan(cls, file_, start = 12, end = None, buffer_size = None, large_sizes = None):
+        """Returns a ChunkIndex of the chunks in <file_> between the
+positions <start> and <end> (or the end of the file).
+The chunk headers are read with a few large reads: chunks that
+fit into the buffer are skipped without reading or seeking,
+only larger chunks (like the data chunk) cause a seek.
+<large_sizes> maps chunk types to their real size, which is used
+for chunks with a size of 0xFFFFFFFF in an RF64 file."""
+        buffer_size = buffer_size or cls.BUFFER_SIZE
+        index = cls()
+
+        buffer = b""
+        buffer_start = start
+
+        def get(position, size):
+            nonlocal buffer, buffer_start
+            if position < buffer_start or position + size > buffer_start + len(buffer):
+                file_.seek(position)
+                buffer = file_.read(max(size, buffer_size))
+                buffer_start = position
+            return buffer[position - buffer_start:position - buffer_start + size]
+
+        position = start
+        # An incorrect RIFF size in the file can cause reads past end of file, so we also stop at EOF (an incomplete chunk header).
+        while end is None or position < end:
+            header = get(position, 8)
+            if len(header) < 8:
+                break
+            size = bti(header[4:8])
+            if size == 0xFFFFFFFF and large_sizes and header[:4] in large_sizes:
+                size = large_sizes[header[:4]]
+            offset = position + 8
+            position = offset + size
+
+            # "All information in a wave file must be word aligned (i.e., aligned at every two bytes)."
+            # "If a chunk has an odd number of bytes, then it will be padded with a zero byte, although this byte will not be counted in the size of the chunk."
+            # Now, here we have an issue. We should align on words, but if we do that, we may miss the next chunk by 1, for misaligned chunks.
+            # So if we get uneven data, keep it as reported. The parser for the chunk just needs to deal with it and correctly align the data on word boundaries.
+            # If our next read is not at the EOF, then check if our next read is another chunk by checking for a null byte.
+            # If it is a null byte, skip it as padding. Otherwise, the next chunk starts right after the data.
+            padding = 0
+            if size % 2 == 1 and (end is None or position < end):
+                if get(position, 1) in (b"", b"\x00"):
+                    padding = 1
+            position += padding
+
+            index.append(Chunk(header[:4], offset, size, padding))
+        return index
 
 
 OK = 0
 ERROR_NOT_A_WAVE_FILE = -1
 
+# The speaker positions of the bits of a channel mask: [bit, name, abbreviation].
+SPEAKERS = [
+    [0x1, 'Front Left', 'FL'],
+    [0x2, 'Front Right', 'FR'],
+    [0x4, 'Front Center', 'FC'],
+    [0x8, 'Low Frequency', 'LFE'],
+    [0x10, 'Back Left (Surround Back Left)', 'BL'],
+    [0x20, 'Back Right (Surround Back Right)', 'BR'],
+    [0x40, 'Front Left of Center', 'FLC'],
+    [0x80, 'Front Right of Center', 'FRC'],
+    [0x100, 'Back Center', 'BC'],
+    [0x200, 'Side Left (Surround Left)', 'SL'],
+    [0x400, 'Side Right (Surround Right)', 'SR'],
+    [0x800, 'Top Center', 'TC'],
+    [0x1000, 'Top Front Left', 'TFL'],
+    [0x2000, 'Top Front Center', 'TFC'],
+    [0x4000, 'Top Front Right', 'TFR'],
+    [0x8000, 'Top Back Left', 'TBL'],
+    [0x10000, 'Top Back Center', 'TBC'],
+    [0x20000, 'Top Back Right', 'TBR'],
+
+    # everything after this one is part of the FFMPEG layout specs, but not officially part of the master channel layout masks. Use at your own risk.
+    [0x20000000, 'Downmix Left', 'DL'],
+    [0x40000000, 'Downmix Right', 'DR'],
+    [0x80000000, 'Wide Left', 'WL'],
+    [0x100000000, 'Wide Right', 'WR'],
+    [0x400000, 'Surround Direct Left', 'SDL'],
+    [0x800000, 'Surround Direct Right', 'SDR'],
+    [0x1000000, 'Low Frequency 2', 'LFE2']
+]
+
+# See for possible channel layouts: https://trac.ffmpeg.org/wiki/AudioChannelManipulation
+# Standard channel layouts:
+# NAME           DECOMPOSITION
+# mono           FC                         0b000000000100
+# stereo         FL+FR                      0b000000000011
+# 2.1            FL+FR+LFE                  0b000000001011
+# 3.0            FL+FR+FC                   0b000000000111
+# 3.0(back)      FL+FR+BC                   0b000100000011
+# 4.0            FL+FR+FC+BC                0b000100000111
+# quad           FL+FR+BL+BR                0b000000110011
+# quad(side)     FL+FR+SL+SR                0b011000000011
+# 3.1            FL+FR+FC+LFE               0b000000001111
+# 5.0            FL+FR+FC+BL+BR             0b000000110111
+# 5.0(side)      FL+FR+FC+SL+SR             0b011000000111
+# 4.1            FL+FR+FC+LFE+BC            0b000100001111
+# 5.1            FL+FR+FC+LFE+BL+BR         0b000000111111
+# 5.1(side)      FL+FR+FC+LFE+SL+SR         0b011000001111
+# 6.0            FL+FR+FC+BC+SL+SR          0b011100000111
+# 6.0(front)     FL+FR+FLC+FRC+SL+SR        0b011011000011
+# hexagonal      FL+FR+FC+BL+BR+BC          0b000100110111
+# 6.1            FL+FR+FC+LFE+BC+SL+SR      0b011100001111
+# 6.1(back)      FL+FR+FC+LFE+BL+BR+BC      0b000100111111
+# 6.1(front)     FL+FR+LFE+FLC+FRC+SL+SR    0b011011001011
+# 7.0            FL+FR+FC+BL+BR+SL+SR       0b011000110111
+# 7.0(front)     FL+FR+FC+FLC+FRC+SL+SR     0b011011000111
+# 7.1            FL+FR+FC+LFE+BL+BR+SL+SR   0b011000111111
+# 7.1(wide)      FL+FR+FC+LFE+BL+BR+FLC+FRC 0b000011111111
+# 7.1(wide-side) FL+FR+FC+LFE+FLC+FRC+SL+SR 0b011011001111
+# octagonal      FL+FR+FC+BL+BR+BC+SL+SR    0b011100110111
+# downmix        DL+DR                      0b01100000000000000000000000000000
+# max value in WAV-file:                    0b11111111111111111111111111111111
+# hexadecagonal  FL+FR+FC+BL+BR+BC+SL+SR+TFL+TFC+TFR+TBL+TBC+TBR+WL+WR
+#                                           0b110000000000000111111011100110111
+CHANNEL_SETUPS = {
+    0b000000000100: 'mono',
+    0b000000000011: 'stereo',
+    0b000000001011: '2.1',
+    0b000000000111: '3.0',
+    0b000100000011: '3.0 (back)',
+    0b000100000111: '4.0',
+    0b000000110011: 'quad',
+    0b011000000011: 'quad(side)',
+    0b000000001111: '3.1',
+    0b000000110111: '5.0',
+    0b011000000111: '5.0 (side)',
+    0b000100001111: '4.1',
+    0b000000111111: '5.1',
+    0b011000001111: '5.1 (side)',
+    0b011100000111: '6.0',
+    0b011011000011: '6.0 (front)',
+    0b000100110111: 'hexagonal',
+    0b011100001111: '6.1',
+    0b000100111111: '6.1 (back)',
+    0b011011001011: '6.1 (front)',
+    0b011000110111: '7.0',
+    0b011011000111: '7.0 (front)',
+    0b011000111111: '7.1',
+    0b000011111111: '7.1 (wide)',
+    0b011011001111: '7.1 (wide-side)',
+    0b011100110111: 'octagonal',
+    0b01100000000000000000000000000000: 'downmix'
+}
+
+# The speakers that are assumed for files without a channel mask (e.g. a WAVEFORMATEX with 6 channels is 5.1).
+DEFAULT_CHANNEL_MASKS = {1: 0x4, 2: 0x3, 3: 0x7, 4: 0x33, 5: 0x37, 6: 0x3F, 8: 0x63F}
+
+
+# Downmix presets (ITU-R BS.775 style): for a (from, to) pair of CHANNEL_SETUPS names, the gain of every source speaker
+# in every target speaker. Speakers that are not listed (like the LFE for stereo downmixes) are dropped.
+_HALF_POWER = math.sqrt(0.5)       # -3 dB
+_STEREO_FROM_SURROUND = lambda *surround: {
+    "FL": dict({"FL": 1.0, "FC": _HALF_POWER}, **{speaker: _HALF_POWER for speaker in surround[0::2]}),
+    "FR": dict({"FR": 1.0, "FC": _HALF_POWER}, **{speaker: _HALF_POWER for speaker in surround[1::2]}),
+}
+DOWNMIX_PRESETS = {
+    ("stereo", "mono"):         {"FC": {"FL": 0.5, "FR": 0.5}},
+    ("mono", "stereo"):         {"FL": {"FC": 1.0}, "FR": {"FC": 1.0}},
+    ("2.1", "stereo"):          {"FL": {"FL": 1.0}, "FR": {"FR": 1.0}},
+    ("3.0", "stereo"):          _STEREO_FROM_SURROUND(),
+    ("3.1", "stereo"):          _STEREO_FROM_SURROUND(),
+    ("quad", "stereo"):         {"FL": {"FL": 1.0, "BL": _HALF_POWER}, "FR": {"FR": 1.0, "BR": _HALF_POWER}},
+    ("quad(side)", "stereo"):   {"FL": {"FL": 1.0, "SL": _HALF_POWER}, "FR": {"FR": 1.0, "SR": _HALF_POWER}},
+    ("5.0", "stereo"):          _STEREO_FROM_SURROUND("BL", "BR"),
+    ("5.0 (side)", "stereo"):   _STEREO_FROM_SURROUND("SL", "SR"),
+    ("5.1", "stereo"):          _STEREO_FROM_SURROUND("BL", "BR"),
+    ("5.1 (side)", "stereo"):   _STEREO_FROM_SURROUND("SL", "SR"),
+    ("7.1", "stereo"):          _STEREO_FROM_SURROUND("BL", "BR", "SL", "SR"),
+    ("5.1", "mono"):            {"FC": {"FC": 1.0, "FL": _HALF_POWER, "FR": _HALF_POWER, "BL": 0.5, "BR": 0.5}},
+    ("5.1 (side)", "mono"):     {"FC": {"FC": 1.0, "FL": _HALF_POWER, "FR": _HALF_POWER, "SL": 0.5, "SR": 0.5}},
+    ("7.1", "5.1"):             {"FL": {"FL": 1.0}, "FR": {"FR": 1.0}, "FC": {"FC": 1.0}, "LFE": {"LFE": 1.0},
+                                 "BL": {"BL": _HALF_POWER, "SL": _HALF_POWER}, "BR": {"BR": _HALF_POWER, "SR": _HALF_POWER}},
+    ("7.1", "5.1 (side)"):      {"FL": {"FL": 1.0}, "FR": {"FR": 1.0}, "FC": {"FC": 1.0}, "LFE": {"LFE": 1.0},
+                                 "SL": {"SL": _HALF_POWER, "BL": _HALF_POWER}, "SR": {"SR": _HALF_POWER, "BR": _HALF_POWER}},
+}
+
+
+# get_speakers(channel_mask: int, channels: int) -> list
+#     Returns the abbreviations (see SPEAKERS) of the speakers of the <channels> channels, in the order of the
+#     channels in the file (the order of the bits of <channel_mask>). Channels beyond the mask are None.
+#     Without a <channel_mask> (0), the speakers of DEFAULT_CHANNEL_MASKS are assumed.
+def get_speakers(channel_mask, channels):
+    channel_mask = channel_mask or DEFAULT_CHANNEL_MASKS.get(channels, 0)
+    abbreviations = {bit: abbreviation for bit, name, abbreviation in SPEAKERS}
+    speakers = [abbreviations.get(1 << bit) for bit in range(channel_mask.bit_length()) if channel_mask & (1 << bit)]
+    return (speakers + [None] * channels)[:channels]
+
+
+# get_remix_matrix(channel_mask: int, channels: int, layout, normalize: bool = False) -> tuple
+#     Returns the (channels, output channels) mixing matrix that converts frames with the given channels to <layout>
+#     (a CHANNEL_SETUPS name or a channel mask), and the channel mask of the output: (frames @ matrix) is the remix.
+#     Uses DOWNMIX_PRESETS, or picks the channels by speaker if the layout is a subset of the input.
+#     With <normalize>, the gains of every output channel are scaled down to add up to (at most) 1, so it can't clip.
+#     Without a <channel_mask> (0), the speakers of DEFAULT_CHANNEL_MASKS are assumed.
+def get_remix_matrix(channel_mask, channels, layout, normalize = False):
+    np = _import_numpy()
+    channel_mask = channel_mask or DEFAULT_CHANNEL_MASKS.get(channels, 0)
+    masks = {name: mask for mask, name in CHANNEL_SETUPS.items()}
+    if isinstance(layout, str):
+        if layout not in masks:
+            raise PyWaveError("unknown channel layout '{}'.".format(layout))
+        output_mask = masks[layout]
+    else:
+        output_mask = layout
+    source_speakers = get_speakers(channel_mask, channels)
+    output_speakers = get_speakers(output_mask, bin(output_mask).count("1"))
+
+    preset = DOWNMIX_PRESETS.get((CHANNEL_SETUPS.get(channel_mask), CHANNEL_SETUPS.get(output_mask)))
+    if preset is None:
+        if not set(output_speakers) <= set(source_speakers):
+            raise PyWaveError("there is no downmix preset from '{}' to '{}'.".format(CHANNEL_SETUPS.get(channel_mask, hex(channel_mask)), CHANNEL_SETUPS.get(output_mask, hex(output_mask))))
+        preset = {speaker: {speaker: 1.0} for speaker in output_speakers}
+
+    matrix = np.zeros((channels, len(output_speakers)))
+    for column, speaker in enumerate(output_speakers):
+        for source, gain in preset.get(speaker, {}).items():
+            if source in source_speakers:
+                matrix[source_speakers.index(source), column] = gain
+    if normalize:
+        matrix /= np.maximum(np.abs(matrix).sum(axis = 0), 1.0)
+    return matrix, output_mask
+
+
 class Wave:
     """Opens a WAVE-RIFF file for reading or writing.
 <mode> can be either (r)ead or (w)rite.
+If <mmap> is True (read mode only), the file is memory mapped and
+the data chunk is exposed as <data_view> and <data_memmap>.
+<path> can also be a binary file object, or (read mode only) the
+content of a wave file as bytes, bytearray or memoryview.
+If <stream> is True (automatically for non-seekable file objects),
+the file is only read / written front to back, without seeking.
+If <lazy_metadata> is True (read mode only), only the header is read
+when opening and <metadata> is a LazyMetadata mapping, which reads
+each chunk when it is first accessed.
 If <mode> is 'w', the following keyword arguments can be set:
 <channels> - The number of channels (e.g. 1 == Mono or 2 == Stereo)
 <frequency> - The number of samples per second (e.g. 48000)
 <bps> (bits_per_sample) - The bit depth of each sample (e.g. 8, 16)
-<format> - Which wave format to use (e.g. WAVE_FORMAT_PCM)"""
+<format> - Which wave format to use (e.g. WAVE_FORMAT_PCM)
+<rf64> - False (default) writes a RIFF file, which is limited to 4 GiB.
+         True writes an RF64 file, 'auto' reserves space for the ds64
+         chunk and upgrades to RF64 once the file grows beyond 4 GiB
+<total_frames> - The number of frames that will be written to a stream
+         (see <stream>), or None if the length is unknown
+<peak_chunk> - If True, the per-channel peaks are tracked while writing
+         and stored in a PEAK chunk on close
+<levl_chunk> - If True, a peak envelope of the data (one positive and
+         negative peak per <levl_block_frames> frames, default 256) is
+         tracked while writing and stored in a levl chunk on close
+<defer_header> - If True, write() only appends data and the header
+                 is updated on flush() / close() (and at checkpoints)
+<checkpoint_bytes> / <checkpoint_seconds> - In deferred mode, update
+                 the header every time this much data has been written"""
 
     # Definitions pulled inside the class so we can use them outside the class as well.
     # If there is a better way of doing this, feel free to fix it :)
@@ -218,9 +978,13 @@ If <mode> is 'w', the following keyword arguments can be set:
     WAVE_FORMAT_MPEGLAYER3      = WAVE_FORMAT_MPEGLAYER3
     WAVE_FORMAT_DOLBY_AC3_SPDIF = WAVE_FORMAT_DOLBY_AC3_SPDIF
 
+    # The largest RIFF chunk size that fits into the 32 bit size field. Larger files have to be written as RF64.
+    RF64_LIMIT = 0xFFFFFFFF
 
-    def __init__(self, path, auto_read = False, mode = "r", **kwargs):
+    def __init__(self, path, auto_read = False, mode = "r", mmap = False, lazy_metadata = False, stream = False, **kwargs):
         assert mode in ("r", "w"), "mode has to be (r)ead or (w)rite"
+        assert not (mmap and mode == "w"), "memory mapping is only supported in read mode"
+        assert not (mmap and stream), "memory mapping is not supported for streams"
 
         self.messages = []      # this list will hold our warning messages and even errors (not the type that causes an abort though).
         
@@ -228,14 +992,33 @@ If <mode> is 'w', the following keyword arguments can be set:
         # which will then raise an exception because mode isn't set.
         self.path = path
         self.mode = mode
+        self.memory_mapped = mmap
+        self.stream = stream
+        self._owns_file = True
+        self._lock = threading.Lock()       # guards the file position for positional reads that have to seek
+
+        # <path> can also be the content of a wave file (bytes starting with a RIFF tag, a bytearray or a memoryview)
+        # or an already opened binary file object. We don't close file objects that we didn't open ourselves.
+        if isinstance(path, (bytearray, memoryview)) or (isinstance(path, bytes) and path[:4] in (fourccRIFF, fourccRF64, fourccBW64)):
+            assert mode == "r", "wave data in memory can only be opened in read mode"
+            self.path = "<{}>".format(type(path).__name__)
+            self.wf = io.BytesIO(path)
+        elif hasattr(path, "read") or hasattr(path, "write"):
+            self.path = getattr(path, "name", "<{}>".format(type(path).__name__))
+            self.wf = path
+            self._owns_file = False
+        else:
+            self.wf = builtin_open(path, mode + "b")
 
-        self.wf = builtin_open(path, mode + "b")
+        # pipes, sockets and the like can only be read / written front to back.
+        if not self.stream and hasattr(self.wf, "seekable") and not self.wf.seekable():
+            assert not mmap, "memory mapping is not supported for streams"
+            self.stream = True
 
         if mode == "r":
-            self._prepare_read(auto_read)
+            self._prepare_read(auto_read, lazy_metadata)
 
         elif mode == "w":
-            self._prepared_for_writing = False
             for keyword in kwargs:
                 arg = kwargs[keyword]
                 if keyword in ("channels", "Channels"):
@@ -250,14 +1033,50 @@ If <mode> is 'w', the following keyword arguments can be set:
                 elif keyword in ("format", "Format", "FormatTag", "format_tag"):
                     assert type(arg) == int, "format has to be of type 'int'"
                     self.format = arg
+                elif keyword == "rf64":
+                    assert arg in (False, True, "auto"), "rf64 has to be False, True or 'auto'"
+                    self.rf64 = arg
+                elif keyword in ("total_frames", "frames"):
+                    assert arg is None or (type(arg) == int and arg >= 0), "total_frames has to be a non-negative 'int'"
+                    self.total_frames = arg
+                elif keyword in ("channel_mask", "ChannelMask"):
+                    assert arg is None or (type(arg) == int and arg >= 0), "channel_mask has to be a non-negative 'int'"
+                    self.channel_mask = arg
+                elif keyword in ("peak_chunk", "peak"):
+                    self.peak_chunk = bool(arg)
+                elif keyword in ("levl_chunk", "levl"):
+                    self.levl_chunk = bool(arg)
+                elif keyword == "levl_block_frames":
+                    assert type(arg) == int and arg > 0, "levl_block_frames has to be a positive 'int'"
+                    self.levl_block_frames = arg
+                elif keyword in ("defer_header", "deferred"):
+                    self.defer_header = bool(arg)
+                elif keyword == "checkpoint_bytes":
+                    assert type(arg) == int and arg > 0, "checkpoint_bytes has to be a positive 'int'"
+                    self.checkpoint_bytes = arg
+                elif keyword == "checkpoint_seconds":
+                    assert type(arg) in (int, float) and arg > 0, "checkpoint_seconds has to be a positive number"
+                    self.checkpoint_seconds = arg
                 else:
                     raise TypeError("Unknown keyword for Wave(): '" + keyword + "'")
 
             # use sensible defaults if the values are missing
             if not hasattr(self, "channels"):           self.channels = 2
             if not hasattr(self, "frequency"):          self.frequency = 48000
-            if not hasattr(self, "bits_per_sample"):    self.bits_per_sample = 16
             if not hasattr(self, "format"):             self.format = WAVE_FORMAT_PCM
+            if not hasattr(self, "bits_per_sample"):    self.bits_per_sample = {WAVE_FORMAT_IEEE_FLOAT: 32, WAVE_FORMAT_ALAW: 8, WAVE_FORMAT_MULAW: 8, WAVE_FORMAT_DVI_ADPCM: 4}.get(self.format, 16)
+            if not hasattr(self, "rf64"):               self.rf64 = False
+            if not hasattr(self, "total_frames"):       self.total_frames = None
+            if not hasattr(self, "channel_mask"):       self.channel_mask = None
+            if not hasattr(self, "peak_chunk"):         self.peak_chunk = False
+            if not hasattr(self, "levl_chunk"):         self.levl_chunk = False
+            if not hasattr(self, "levl_block_frames"):  self.levl_block_frames = 256
+            if not hasattr(self, "defer_header"):       self.defer_header = False
+            if not hasattr(self, "checkpoint_bytes"):   self.checkpoint_bytes = None
+            if not hasattr(self, "checkpoint_seconds"): self.checkpoint_seconds = None
+
+            assert not (self.stream and (self.peak_chunk or self.levl_chunk)), "PEAK and levl chunks can't be written to streams"
+            self._prepared_for_writing = False
 
     @property
     def format_name(self):
@@ -276,39 +1095,131 @@ If <mode> is 'w', the following keyword arguments can be set:
 
 ##        assert self.format == WAVE_FORMAT_PCM, "Sorry, currently only PCM is supported.."
 
-        self.format_chunk_size = 16
-
-        self.riff_chunk_size = 36
+        # Compressed formats get a WAVEFORMATEX (with the samples per block for IMA ADPCM) and a fact chunk with the number of samples.
+        self.compressed = self.format in (WAVE_FORMAT_ALAW, WAVE_FORMAT_MULAW, WAVE_FORMAT_DVI_ADPCM)
+        self.samples_per_block = 0
+        self.adpcm_coefficients = None
+        format_extra = b""
+        if self.format in (WAVE_FORMAT_ALAW, WAVE_FORMAT_MULAW):
+            assert self.bits_per_sample == 8, "A-law and µ-law have 8 bits per sample"
+        elif self.format == WAVE_FORMAT_DVI_ADPCM:
+            assert self.bits_per_sample == 4, "IMA ADPCM has 4 bits per sample"
+            self.block_align, self.samples_per_block = _ima_adpcm_block_size(self.channels, self.frequency)
+            self.average_bytes_per_sec = self.frequency * self.block_align // self.samples_per_block
+            format_extra = itb(self.samples_per_block, 2)
+            self._adpcm_pending = None      # frames that don't fill a block yet, see write_frames()
+        self.samples = 0
+
+        # With a channel mask the fmt chunk is a WAVEFORMATEXTENSIBLE, with the format in the sub format GUID.
+        if self.channel_mask is not None:
+            assert not self.compressed, "a channel mask can only be written for PCM and float files"
+            format_extra = itb(self.bits_per_sample, 2) + itb(self.channel_mask, 4) + itb(self.format, 4) + b"\x00\x00\x10\x00\x80\x00\x00\xAA\x00\x38\x9B\x71"
+
+        self.format_chunk_size = 18 + len(format_extra) if self.compressed or format_extra else 16
         self.data_chunk_size = 0
-
-        self.riff_chunk_size_offset = 4
-        self.data_chunk_size_offset = 40
-
-        self.data_starts_at = 44
         self.data_position = 0
 
+        # In deferred mode the size fields are only patched on flush() / close() and at every checkpoint.
+        # A checkpoint interval given in seconds is converted to bytes, rounded down to whole blocks.
+        if self.checkpoint_bytes:
+            self._checkpoint_interval = self.checkpoint_bytes
+        elif self.checkpoint_seconds:
+            self._checkpoint_interval = max(int(self.checkpoint_seconds * self.average_bytes_per_sec) // self.block_align, 1) * self.block_align
+        else:
+            self._checkpoint_interval = None
+        self._next_checkpoint = self._checkpoint_interval
+
         data_as_list = []
 
         data_as_list.append(fourccRIFF)
-        data_as_list.append(itb(self.riff_chunk_size, 4))
+        data_as_list.append(itb(0, 4))
         data_as_list.append(fourccWAVE)
 
+        # Reserve space for the ds64 chunk right after the WAVE tag. If <rf64> is 'auto', it is a JUNK chunk
+        # that is only turned into a ds64 chunk once the file grows beyond 4 GiB (see EBU Tech 3306).
+        self._rf64_active = False
+        if self.rf64:
+            self.ds64_chunk_offset = 12
+            data_as_list.append(fourccJUNK)
+            data_as_list.append(itb(28, 4))
+            data_as_list.append(bytes(28))
+
         data_as_list.append(fourccFMT)
         data_as_list.append(itb(self.format_chunk_size, 4))
-        data_as_list.append(itb(self.format, 2))
+        data_as_list.append(itb(WAVE_FORMAT_EXTENSIBLE if self.channel_mask is not None else self.format, 2))
         data_as_list.append(itb(self.channels, 2))
         data_as_list.append(itb(self.frequency, 4))
         data_as_list.append(itb(self.average_bytes_per_sec, 4))
         data_as_list.append(itb(self.block_align, 2))
         data_as_list.append(itb(self.bits_per_sample, 2))
+        if self.format_chunk_size > 16:
+            data_as_list.append(itb(len(format_extra), 2))
+            data_as_list.append(format_extra)
+        if self.compressed:
+            self.fact_chunk_offset = len(b"".join(data_as_list))
+            data_as_list.append(fourccFACT)
+            data_as_list.append(itb(4, 4))
+            data_as_list.append(itb(0, 4))
+
+        # The PEAK chunk has a fixed size, so we reserve space for it in front of the data chunk and fill it in on close.
+        # The levl chunk grows with the data, so it is appended after the data chunk on close.
+        if self.peak_chunk or self.levl_chunk:
+            self._init_level_tracking()
+        if self.peak_chunk:
+            self.peak_chunk_offset = len(b"".join(data_as_list))
+            data_as_list.append(fourccPEAK)
+            data_as_list.append(itb(8 + 8 * self.channels, 4))
+            data_as_list.append(bytes(8 + 8 * self.channels))
         
         data_as_list.append(fourccDATA)
         data_as_list.append(itb(0, 4))
 
         data = b"".join(data_as_list)
 
-        self.wf.seek(0)
-        self.wf.write(data)
+        self.riff_chunk_size_offset = 4
+        self.data_chunk_size_offset = len(data) - 4
+        self.data_starts_at = len(data)
+        self.riff_chunk_size = self.data_starts_at - 8
+
+        if self.stream:
+            # streams only get this one header, so it has to contain the final sizes (or the "unknown length" sizes)
+            self.wf.write(self._get_stream_header(data))
+        else:
+            self.wf.seek(0)
+            self.wf.write(data)
+            if self.rf64 is True:
+                self._write_chunk_sizes()
+
+
+    def _get_stream_header(self, header):
+        """Returns <header> with the sizes for a stream of <total_frames>
+frames, or with sizes of 0xFFFFFFFF (the conventional "unknown
+length" value) if <total_frames> is None."""
+        header = bytearray(header)
+        if self.total_frames is None:
+            header[self.riff_chunk_size_offset:self.riff_chunk_size_offset + 4] = itb(0xFFFFFFFF, 4)
+            header[self.data_chunk_size_offset:self.data_chunk_size_offset + 4] = itb(0xFFFFFFFF, 4)
+            if self.compressed:
+                header[self.fact_chunk_offset + 8:self.fact_chunk_offset + 12] = itb(0xFFFFFFFF, 4)
+            return bytes(header)
+
+        if self.compressed:
+            header[self.fact_chunk_offset + 8:self.fact_chunk_offset + 12] = itb(min(self.total_frames, 0xFFFFFFFF), 4)
+        if self.samples_per_block:
+            data_chunk_size = -(-self.total_frames // self.samples_per_block) * self.block_align
+        else:
+            data_chunk_size = self.total_frames * self.block_align
+        riff_chunk_size = self.riff_chunk_size + data_chunk_size + data_chunk_size % 2
+        if self.rf64 is True or riff_chunk_size > self.RF64_LIMIT:
+            if not self.rf64:
+                raise PyWaveError("'{}' would exceed the 4 GiB size limit of RIFF files. Open it with rf64 = 'auto' or True to write an RF64 file.".format(self.path))
+            header[0:8] = fourccRF64 + itb(0xFFFFFFFF, 4)
+            header[self.ds64_chunk_offset:self.ds64_chunk_offset + 32] = fourccDS64 + itb(28, 4) + itb(riff_chunk_size, 8) + itb(data_chunk_size, 8) + itb(self.total_frames, 8)
+            header[self.data_chunk_size_offset:self.data_chunk_size_offset + 4] = itb(0xFFFFFFFF, 4)
+        else:
+            header[self.riff_chunk_size_offset:self.riff_chunk_size_offset + 4] = itb(riff_chunk_size, 4)
+            header[self.data_chunk_size_offset:self.data_chunk_size_offset + 4] = itb(data_chunk_size, 4)
+        return bytes(header)
 
 
     def write(self, data):
@@ -319,21 +1230,323 @@ If <mode> is 'w', the following keyword arguments can be set:
             self._prepared_for_writing = True
 
         written_bytes = len(data)
+        self.samples += written_bytes // self.block_align * (self.samples_per_block or 1)
+        if self.stream:
+            # streams only ever append, the sizes have been written up front.
+            self._append_data(data)
+            return
+
+        if self.peak_chunk or self.levl_chunk:
+            self._track_levels(data)
+
+        if not self.rf64 and self.riff_chunk_size + written_bytes + (self.data_chunk_size + written_bytes) % 2 > self.RF64_LIMIT:
+            raise PyWaveError("'{}' would exceed the 4 GiB size limit of RIFF files. Open it with rf64 = 'auto' or True to write an RF64 file.".format(self.path))
+        if self.defer_header:
+            self._write_deferred(data)
+            return
+
         self.wf.seek(self.data_starts_at + self.data_position)
+        self._append_data(data)
+        self._write_chunk_sizes()
+
+    def _append_data(self, data):
+        """Writes <data> at the current position of the file and
+updates the chunk sizes"""
         self.wf.write(data)
-        
-        self.data_position += written_bytes
-        self.data_chunk_size += written_bytes
-        self.riff_chunk_size += written_bytes
-        
-        self.wf.seek(self.riff_chunk_size_offset)
-        self.wf.write(itb(self.riff_chunk_size, 4))
-        self.wf.seek(self.data_chunk_size_offset)
-        self.wf.write(itb(self.data_chunk_size, 4))
-            
+        self.data_position += len(data)
+        self.data_chunk_size += len(data)
+        self.riff_chunk_size += len(data)
+
+    def _write_deferred(self, data):
+        """Appends <data> without updating the header, except at the
+checkpoints (see defer_header)"""
+        # in deferred mode the file pointer never leaves the end of the data chunk, so we can simply append.
+        self._append_data(data)
+        if self._next_checkpoint is not None and self.data_chunk_size >= self._next_checkpoint:
+            # checkpoint: make sure that a crash leaves a readable file with (at least) the data up to here.
+            self._write_chunk_sizes()
+            self.wf.flush()
+            self._next_checkpoint = (self.data_chunk_size // self._checkpoint_interval + 1) * self._checkpoint_interval
+
+
+    def _copy_data_from(self, reader):
+        """Returns the number of bytes copied.
+Appends the data of the Wave <reader> from its current position
+to the end to the data chunk, without decoding it. Both files
+have to have the same format. If both are regular files, the
+data is copied by the kernel (os.copy_file_range() or
+os.sendfile()), otherwise in blocks of 1 MiB."""
+        assert self.mode == "w" and reader.mode == "r", "can only copy from a wave file in read mode to one in write mode"
+        if not self._prepared_for_writing:
+            self._prepare_for_writing()
+            self._prepared_for_writing = True
+        size = None if reader.unknown_length else reader.data_length - reader.data_position
+        if self.stream or reader.stream or self.peak_chunk or self.levl_chunk or size is None:
+            copied = 0
+            for block in reader.blocks(max(1, (1 << 20) // reader.block_align)):
+                self.write(block)
+                copied += len(block)
+            return copied
+
+        if not self.rf64 and self.riff_chunk_size + size + (self.data_chunk_size + size) % 2 > self.RF64_LIMIT:
+            raise PyWaveError("'{}' would exceed the 4 GiB size limit of RIFF files. Open it with rf64 = 'auto' or True to write an RF64 file.".format(self.path))
+        self.wf.flush()
+        copied = _copy_range(reader.wf, reader.data_starts_at + reader.data_position, self.wf, self.data_starts_at + self.data_position, size)
+        copied -= copied % reader.block_align       # a truncated source can end within a block
+        reader.seek(reader.data_position + copied)
+
+        self.samples += copied // self.block_align * (self.samples_per_block or 1)
+        self.data_position += copied
+        self.data_chunk_size += copied
+        self.riff_chunk_size += copied
+        self._write_chunk_sizes()
+        return copied
+
+
+    def _init_level_tracking(self):
+        """Resets the per-channel peaks (for the PEAK chunk) and the peak
+envelope (for the levl chunk) that are tracked while writing."""
+        _import_numpy()
+        self._peak_values = [0.0] * self.channels
+        self._peak_positions = [0] * self.channels
+        self._tracked_frames = 0
+        self._tracking_remainder = b""      # an incomplete frame at the end of the last write
+        self._levl_pending = numpy.zeros((0, self.channels))     # frames that don't fill a levl block yet
+        self._levl_peaks = []
+
+
+    def _track_levels(self, data):
+        """Updates the peaks and the peak envelope with <data>."""
+        data = self._tracking_remainder + data
+        whole = len(data) // self.block_align * self.block_align
+        self._tracking_remainder = data[whole:]
+        if not whole:
+            return
+        samples = self._decode(data[:whole], "float64")
+
+        magnitudes = numpy.abs(samples)
+        positions = magnitudes.argmax(axis = 0)
+        for channel in range(self.channels):
+            value = magnitudes[positions[channel], channel]
+            if value > self._peak_values[channel]:
+                self._peak_values[channel] = float(value)
+                self._peak_positions[channel] = self._tracked_frames + int(positions[channel])
+        self._tracked_frames += len(samples)
+
+        if self.levl_chunk:
+            samples = numpy.concatenate((self._levl_pending, samples))
+            blocks = len(samples) // self.levl_block_frames
+            self._add_levl_peaks(samples[:blocks * self.levl_block_frames].reshape(blocks, self.levl_block_frames, self.channels))
+            self._levl_pending = samples[blocks * self.levl_block_frames:]
+
+
+    def _add_levl_peaks(self, blocks):
+        """Adds the positive and negative peaks of the (blocks, frames, channels) array <blocks> to the peak envelope."""
+        if len(blocks):
+            positive = numpy.maximum(blocks.max(axis = 1), 0.0)
+            negative = numpy.maximum(-blocks.min(axis = 1), 0.0)
+            self._levl_peaks.append(numpy.stack((positive, negative), axis = 2))
+
+
+    def _write_peak_chunk(self):
+        """Fills in the PEAK chunk that was reserved in the header."""
+        data = [itb(1, 4), itb(int(time.time()), 4)]        # version, timestamp
+        for value, position in zip(self._peak_values, self._peak_positions):
+            data.append(struct.pack('<f', value))
+            data.append(itb(position, 4))
+        self.wf.seek(self.peak_chunk_offset + 8)
+        self.wf.write(b"".join(data))
+
+
+    # Writes the Peak Envelope chunk, see https://tech.ebu.ch/docs/tech/tech3285s3.pdf
+    #
+    # Format:
+    #   DWORD dwVersion;            /* version of the peak envelope chunk (0x0100) */
+    #   DWORD dwFormat;             /* format of a peak point: 1 = unsigned char, 2 = unsigned short */
+    #   DWORD dwPointsPerValue;     /* 1 = only positive peak point, 2 = positive AND negative peak point */
+    #   DWORD dwBlockSize;          /* frames per peak value */
+    #   DWORD dwPeakChannels;       /* number of channels */
+    #   DWORD dwNumPeakFrames;      /* number of peak frames */
+    #   DWORD dwPosPeakOfPeaks;     /* frame of the highest peak, 0xFFFFFFFF if unknown */
+    #   DWORD dwOffsetToPeaks;      /* offset of the peak data from the start of the chunk header (128) */
+    #   CHAR strTimestamp[28];      /* ASCII: "yyyy:mm:dd:hh:mm:ss:uuu" */
+    #   CHAR reserved[60];
+    #   peak data: for every block and channel the positive and then the negative peak (magnitude, 0 to 32767)
+    #
+    def _write_levl_chunk(self):
+        """Appends the levl chunk at the end of the file."""
+        pending = self._levl_pending
+        if len(pending):
+            self._add_levl_peaks(pending.reshape(1, len(pending), self.channels))
+            self._levl_pending = pending[:0]
+        peaks = numpy.concatenate(self._levl_peaks) if self._levl_peaks else numpy.zeros((0, self.channels, 2))
+        values = numpy.clip(numpy.rint(peaks * 32767.0), 0, 32767).astype("<u2")
+
+        if self._tracked_frames:
+            peak_of_peaks = self._peak_positions[max(range(self.channels), key = lambda channel: self._peak_values[channel])]
+        else:
+            peak_of_peaks = 0xFFFFFFFF
+        now = datetime.datetime.now()
+        timestamp = now.strftime("%Y:%m:%d:%H:%M:%S:") + "{:03d}".format(now.microsecond // 1000)
+
+        data = b"".join((itb(0x0100, 4), itb(2, 4), itb(2, 4), itb(self.levl_block_frames, 4), itb(self.channels, 4),
+                         itb(len(values), 4), itb(peak_of_peaks, 4), itb(128, 4), timestamp.encode().ljust(28, b"\x00"), bytes(60),
+                         values.tobytes()))
+        # with rf64 = 'auto', _write_chunk_sizes() upgrades the file if the levl chunk pushes it over the limit
+        if not self.rf64 and self.riff_chunk_size + 8 + len(data) > self.RF64_LIMIT:
+            raise PyWaveError("the levl chunk of '{}' would exceed the 4 GiB size limit of RIFF files. Open it with rf64 = 'auto' or True to write an RF64 file.".format(self.path))
+        self.wf.seek(self.data_starts_at + self.data_chunk_size + self.data_chunk_size % 2)
+        self.wf.write(fourccLEVL + itb(len(data), 4) + data)
+        self.riff_chunk_size += 8 + len(data)
+
+
+    def write_frames(self, frames):
+        """Converts the (frames, channels) NumPy array <frames> to the
+format and bit depth of the file and writes it to the data chunk.
+Float frames are expected in the range [-1.0, 1.0] and are clipped,
+integer frames are scaled from the full range of their type.
+A one-dimensional array is accepted for mono files. Requires NumPy."""
+        np = _import_numpy()
+        frames = np.asarray(frames)
+        if frames.ndim == 1 and self.channels == 1:
+            frames = frames.reshape(-1, 1)
+        assert frames.ndim == 2 and frames.shape[1] == self.channels, "expected an array of shape (frames, {})".format(self.channels)
+        if self.format != WAVE_FORMAT_DVI_ADPCM:
+            self.write(_encode_frames(frames, self._get_sample_format(), self.bits_per_sample))
+            return
+
+        # ADPCM is encoded in whole blocks, the rest is kept until the next call (or close())
+        if not self._prepared_for_writing:
+            self._prepare_for_writing()
+            self._prepared_for_writing = True
+        samples = np.frombuffer(_encode_frames(frames, WAVE_FORMAT_PCM, 16), dtype = "<i2").reshape(-1, self.channels)
+        if self._adpcm_pending is not None:
+            samples = np.concatenate((self._adpcm_pending, samples))
+        whole = len(samples) // self.samples_per_block * self.samples_per_block
+        self._adpcm_pending = samples[whole:]
+        if whole:
+            self.write(_encode_ima_adpcm(samples[:whole], self.block_align))
+
+
+    def _write_adpcm_pending(self):
+        """Encodes the frames that are left over from write_frames() as
+a last block, padded with silence. The fact chunk keeps the real
+number of samples."""
+        pending = getattr(self, "_adpcm_pending", None)
+        if pending is not None and len(pending):
+            padding = self.samples_per_block - len(pending)
+            self._adpcm_pending = None
+            self.write(_encode_ima_adpcm(numpy.concatenate((pending, numpy.zeros((padding, self.channels), dtype = pending.dtype))), self.block_align))
+            self.samples -= padding
+
+
+    def _write_chunk_sizes(self):
+        """Patches the RIFF and data chunk size fields in the header
+and moves the file pointer back to the end of the data chunk.
+Upgrades the file to RF64 if required (and allowed by <rf64>)."""
+        if not self._rf64_active and (self.rf64 is True or self.riff_chunk_size > self.RF64_LIMIT):
+            # From now on the 32 bit size fields are set to 0xFFFFFFFF and the real sizes are stored in the ds64 chunk.
+            self._rf64_active = True
+            self.wf.seek(0)
+            self.wf.write(fourccRF64 + itb(0xFFFFFFFF, 4))
+            self.wf.seek(self.ds64_chunk_offset)
+            self.wf.write(fourccDS64)
+            self.wf.seek(self.data_chunk_size_offset)
+            self.wf.write(itb(0xFFFFFFFF, 4))
+
+        if self.compressed:
+            self.wf.seek(self.fact_chunk_offset + 8)
+            self.wf.write(itb(min(self.samples, 0xFFFFFFFF), 4))
+
+        if self._rf64_active:
+            self.wf.seek(self.ds64_chunk_offset + 8)
+            self.wf.write(itb(self.riff_chunk_size, 8) + itb(self.data_chunk_size, 8) + itb(self.samples, 8))
+        else:
+            self.wf.seek(self.riff_chunk_size_offset)
+            self.wf.write(itb(self.riff_chunk_size, 4))
+            self.wf.seek(self.data_chunk_size_offset)
+            self.wf.write(itb(self.data_chunk_size, 4))
+        self.wf.seek(self.data_starts_at + self.data_chunk_size)
+
+
+    def flush(self):
+        """Writes the current chunk sizes to the header and flushes
+the file buffers, so the file is readable up to this point.
+In deferred mode this is the only time (besides checkpoints
+and close()) at which the header is updated."""
+        assert self.mode == "w", "this function can only be called in write mode"
+        if not self._prepared_for_writing:
+            self._prepare_for_writing()
+            self._prepared_for_writing = True
+        if not self.stream:
+            if self.peak_chunk:
+                self._write_peak_chunk()
+            self._write_chunk_sizes()
+        self.wf.flush()
 
-    def _prepare_read(self, auto_read):
+
+    def _prepare_read(self, auto_read, lazy_metadata = False):
         assert self.mode == "r", "this function can only be called in read mode"
+        if self.stream:
+            # Streams can't seek: the chunks in front of the data chunk are read into memory and parsed from there,
+            # afterwards the data chunk is read straight from the stream. Chunks after the data chunk are not available.
+            stream = self.wf
+            self.wf = io.BytesIO(self._read_stream_header(stream))
+            try:
+                self._read_header(False)
+            finally:
+                self.wf = stream
+        else:
+            self._read_header(lazy_metadata and not auto_read)
+            self.wf.seek(self.data_starts_at)
+
+        if self.memory_mapped:
+            self._map_data()
+
+        if auto_read:
+            warnings.warn(DeprecationWarning("auto_read will no longer be supported in a future update.\nUse <Wave.read()> instead"))
+            self.data = self.read()
+            self.wf.close()
+
+
+    def _read_stream_header(self, stream):
+        """Reads everything up to and including the header of the data
+chunk from the non-seekable <stream> and returns it."""
+        def read_exactly(size):
+            data = stream.read(size)
+            while len(data) < size:
+                more = stream.read(size - len(data))
+                if not more:
+                    break
+                data += more
+            return data
+
+        header = [read_exactly(12)]
+        if len(header[0]) < 12 or header[0][:4] not in (fourccRIFF, fourccRF64, fourccBW64) or header[0][8:] != fourccWAVE:
+            raise PyWaveError("'{}' does not appear to be a wave file.".format(self.path))
+
+        pending = b""       # the first byte of the next chunk header, if it was read while looking for a pad byte
+        while True:
+            chunk_header = pending + read_exactly(8 - len(pending))
+            if len(chunk_header) < 8:
+                raise PyWaveError("'{}' is missing the 'data' chunk.".format(self.path))
+            header.append(chunk_header)
+            if chunk_header[:4] == fourccDATA:
+                return b"".join(header)
+
+            size = bti(chunk_header[4:])
+            data = read_exactly(size + size % 2)
+            # just like ChunkIndex.scan(), accept odd sized chunks without a pad byte.
+            if size % 2 and data[size:] not in (b"", b"\x00"):
+                pending = data[size:]
+                data = data[:size] + b"\x00"
+            else:
+                pending = b""
+            header.append(data)
+
+
+    def _read_header(self, lazy_metadata):
+        """Parses the chunks and the format of the file."""
         if self._check_file_format() != OK:
             raise PyWaveError("'{}' does not appear to be a wave file.".format(self.path))
 
@@ -347,21 +1560,24 @@ If <mode> is 'w', the following keyword arguments can be set:
 
         fmt_size, fmt_position = self.chunks[fourccFMT]
 
+        fmt_data = self._read_chunk_data(fmt_size, fmt_position)
         if fmt_size == 16:
-            self.wfx = PCMWAVEFORMAT(self._read_chunk_data(fmt_size, fmt_position))
-        elif fmt_size == 18:
-            self.wfx = WAVEFORMATEX(self._read_chunk_data(fmt_size, fmt_position))
-        elif 18 < fmt_size <= 40:
-            self.wfx = WAVEFORMATEXTENSIBLE(self._read_chunk_data(fmt_size, fmt_position))
+            self.wfx = PCMWAVEFORMAT(fmt_data)
+        elif fmt_size >= 40 and bti(fmt_data[:2]) == WAVE_FORMAT_EXTENSIBLE:
+            self.wfx = WAVEFORMATEXTENSIBLE(fmt_data[:40])
+        elif fmt_size >= 18 and bti(fmt_data[:2]) != WAVE_FORMAT_EXTENSIBLE:
+            # compressed formats have format specific bytes after the WAVEFORMATEX, e.g. 2 for IMA ADPCM and 32 for MS ADPCM
+            self.wfx = WAVEFORMATEX(fmt_data)
         else:
             raise PyWaveError("'{}' has an unknown or unsupported format.".format(self.path))
 
-        self.metadata = {}
+        # Every metadata entry gets a loader that reads and parses its chunk. The loaders are either called right away,
+        # or (with <lazy_metadata>) only when the entry is first accessed, see LazyMetadata.
+        loaders = {}
 
-        # first, parse the known and specific tags
-        # NOTE: THIS ASSUMES WE ONLY HAVE ONE LIST CHUNK! That is not always true!
-        if fourccLIST in self.chunks:
-            ChunkSize, ChunkPosition = self.chunks[fourccLIST]
+        # first, parse the known and specific tags. There can be several LIST chunks, each with a different subchunk type.
+        for chunk in self.chunks.find_all(fourccLIST):
+            ChunkSize, ChunkPosition = chunk.size, chunk.offset
             self.wf.seek(ChunkPosition)
             # correct alignment errors by reading 1 byte more than required and testing it for a null byte.
             fourCC = self.wf.read(5)
@@ -372,46 +1588,45 @@ If <mode> is 'w', the following keyword arguments can be set:
             else:
                 padding = 0
                 fourCC = fourCC[:4]
-            if fourccLIST_INFO == fourCC:
-                self.metadata[fourCC.decode()] = self._get_info_chunk(ChunkSize, ChunkPosition + 4 + padding)
+            if fourCC.decode() in loaders:
+                self.messages.append("ERROR: LIST subchunk '{0}' has a duplicate (ignored) LIST chunk of the same type at position {1} with size {2}!".format(fourCC.decode(), ChunkPosition, ChunkSize))
+            elif fourccLIST_INFO == fourCC:
+                loaders[fourCC.decode()] = (Wave._get_info_chunk, ChunkSize - padding, ChunkPosition + 4 + padding)
             # otherwise read the LIST subchunk adtl as raw metadata
             elif fourccLIST_ADTL == fourCC:
-                self.metadata[fourCC.decode()] = self._read_chunk_data(ChunkSize, ChunkPosition)
+                loaders[fourCC.decode()] = (Wave._read_chunk_data, ChunkSize, ChunkPosition)
             # the wavl (wavelist) subchunk is unsupported and raises an error.
             elif fourccLIST_WAVL == fourCC:
-                self.metadata[fourCC.decode()] = _read_chunk_data(self.wf, ChunkSize, ChunkPosition)
                 self.messages.append("Error: subchunk tag for LIST subchunk '{}' is unsupported. Please raise an issue on Github.".format(fourCC.decode()))
                 raise PyWaveError("'{}' has unsupported WAVELIST chunks. Please raise an issue on Github.".format(self.path))
             else:
                 self.messages.append("Warning: subchunk tag for LIST subchunk '{}' is unknown.".format(fourCC.decode()))
 
-        # this could be done using a function map. But for now it will do.
-        if fourccDISP in self.chunks:
-            ChunkSize, ChunkPosition = self.chunks[fourccDISP]
-            self.wf.seek(ChunkPosition)
-            self.metadata[fourccDISP.decode()] = self._get_disp_chunk(ChunkSize, ChunkPosition)
-
-        if fourccBEXT in self.chunks:
-            ChunkSize, ChunkPosition = self.chunks[fourccBEXT]
-            self.wf.seek(ChunkPosition)
-            self.metadata[fourccBEXT.decode()] = self._get_bext_chunk(ChunkSize, ChunkPosition)
-
-        if fourccCART in self.chunks:
-            ChunkSize, ChunkPosition = self.chunks[fourccCART]
-            self.wf.seek(ChunkPosition)
-            self.metadata[fourccCART.decode()] = self._get_cart_chunk(ChunkSize, ChunkPosition)
-
-        if fourccPEAK in self.chunks:
-            ChunkSize, ChunkPosition = self.chunks[fourccPEAK]
-            self.wf.seek(ChunkPosition)
-            self.metadata[fourccPEAK.decode()] = self._get_peak_chunk(ChunkSize, ChunkPosition)
+        chunk_parsers = {
+            fourccDS64: Wave._get_ds64_chunk,
+            fourccDISP: Wave._get_disp_chunk,
+            fourccBEXT: Wave._get_bext_chunk,
+            fourccCART: Wave._get_cart_chunk,
+            fourccPEAK: Wave._get_peak_chunk,
+        }
+        for fourCC in chunk_parsers:
+            if fourCC in self.chunks:
+                ChunkSize, ChunkPosition = self.chunks[fourCC]
+                loaders[fourCC.decode()] = (chunk_parsers[fourCC], ChunkSize, ChunkPosition)
 
         # once we've checked the known chunks, add everything that is not yet parsed to the metadata as bytestring through the generic reader
         for fourCC in self.chunks:
             if fourCC not in KNOWN_FOURCC:
                 ChunkSize, ChunkPosition = self.chunks[fourCC]
-                self.wf.seek(ChunkPosition)
-                self.metadata[fourCC.decode()] = self._read_chunk_data(ChunkSize, ChunkPosition)
+                loaders[fourCC.decode()] = (Wave._read_chunk_data, ChunkSize, ChunkPosition)
+
+        # the loaders are (parser, size, offset) tuples. The lazy ones only hold a weak reference to this Wave,
+        # so that dropping it closes the file right away instead of waiting for the garbage collector.
+        if lazy_metadata:
+            reader = weakref.ref(self)
+            self.metadata = LazyMetadata({key: functools.partial(Wave._load_metadata, reader, *loaders[key]) for key in loaders})
+        else:
+            self.metadata = {key: parser(self, size, offset) for key, (parser, size, offset) in loaders.items()}
 
         # get the DATA chunk info
         self.data_length, self.data_starts_at = self.chunks[fourccDATA]
@@ -465,19 +1680,81 @@ If <mode> is 'w', the following keyword arguments can be set:
                 else:
                     self.messages.append('Warning: the samples per block field in the samples union (WAVEFORMATEXTENSIBLE header) should be non-zero, but is zero.')
 
+        # ADPCM formats store the samples per block (and MS ADPCM its coefficients) in the extra bytes of the WAVEFORMATEX
+        self.adpcm_coefficients = None
+        sample_format = self._get_sample_format()
+        if sample_format in (WAVE_FORMAT_ADPCM, WAVE_FORMAT_DVI_ADPCM):
+            extra = getattr(self.wfx, "Extra", b"")
+            if not self.samples_per_block and len(extra) >= 2:
+                self.samples_per_block = bti(extra[:2])
+            if sample_format == WAVE_FORMAT_ADPCM and len(extra) >= 4:
+                count = min(bti(extra[2:4]), (len(extra) - 4) // 4)
+                self.adpcm_coefficients = [(int.from_bytes(extra[4 + 4 * i:6 + 4 * i], "little", signed = True), int.from_bytes(extra[6 + 4 * i:8 + 4 * i], "little", signed = True)) for i in range(count)] or None
+            if not self.samples_per_block and self.channels:
+                header = 4 if sample_format == WAVE_FORMAT_DVI_ADPCM else 7
+                self.samples_per_block = (self.block_align - header * self.channels) * 8 // (4 * self.channels) + (1 if sample_format == WAVE_FORMAT_DVI_ADPCM else 2)
+
         self.bitrate = self.average_bytes_per_sec * 8
         self.bytes_per_sample = (self.bits_per_sample // 8)
-        self.samples = (self.data_length // self.bytes_per_sample // self.channels)
+        if self.data_length == 0xFFFFFFFF and not self.rf64 and not self.stream:
+            # a stream of unknown length (see below) that has been saved to a file: its data ends at the end of the file.
+            self.wf.seek(0, 2)
+            self.data_length = max(0, self.wf.tell() - self.data_starts_at)
+        fact_samples = None
+        if self.compressed and fourccFACT in self.chunks and self.chunks[fourccFACT][0] >= 4:
+            # the fact chunk of compressed files contains the number of samples (per channel), 0xFFFFFFFF if it is unknown (streams)
+            fact_samples = bti(self._read_chunk_data(4, self.chunks[fourccFACT][1]))
+        if fact_samples is not None and fact_samples != 0xFFFFFFFF:
+            self.samples = fact_samples
+        elif self.samples_per_block:
+            self.samples = self.data_length // self.block_align * self.samples_per_block
+        elif self.bytes_per_sample and self.channels:
+            self.samples = (self.data_length // self.bytes_per_sample // self.channels)
+        else:
+            self.samples = 0
 
         self.data_position = 0
         self.end_of_data = self.data_starts_at + self.data_length
-
-        self.wf.seek(self.data_starts_at)
-
-        if auto_read:
-            warnings.warn(DeprecationWarning("auto_read will no longer be supported in a future update.\nUse <Wave.read()> instead"))
-            self.data = self.read()
-            self.wf.close()
+        self._adpcm_leftover = None     # decoded frames of the current ADPCM block that read_frames() hasn't returned yet
+
+        # Streams that were written without knowing their length have a data chunk size of 0xFFFFFFFF.
+        # Their data is read up to the end of the stream, and the size members grow while reading.
+        self.unknown_length = self.stream and self.chunks[fourccDATA][0] == 0xFFFFFFFF and not self.rf64
+        if self.unknown_length:
+            self._update_length(0)
+
+
+    def _map_data(self):
+        """Maps the file into memory and exposes the data chunk as
+<data_view> (a read-only memoryview) and, if NumPy is installed
+and the samples have a matching type, as <data_memmap>, a
+(frames, channels) array on top of the same memory."""
+        if isinstance(self.wf, io.BytesIO):
+            self._mmap = self.wf.getbuffer()    # wave data that is already in memory doesn't need to be mapped
+        else:
+            self._mmap = builtin_mmap(self.wf.fileno(), 0, access = mmap.ACCESS_READ)
+        end = min(self.end_of_data, len(self._mmap))        # don't go beyond the end of a truncated file
+        self.data_view = memoryview(self._mmap)[self.data_starts_at:end]
+
+        self.data_memmap = None
+        dtype = _numpy_dtype(self._get_sample_format(), self.bits_per_sample)
+        if dtype is not None and _import_numpy(required = False) is not None:
+            frames = len(self.data_view) // self.block_align
+            self.data_memmap = numpy.frombuffer(self.data_view, dtype = dtype, count = frames * self.channels).reshape(frames, self.channels)
+
+
+    def _unmap_data(self):
+        """Releases the memory map. If the caller still holds views
+of the data, the map stays alive until those are garbage collected."""
+        self.data_memmap = None
+        try:
+            self.data_view.release()
+            if isinstance(self._mmap, memoryview):
+                self._mmap.release()
+            else:
+                self._mmap.close()
+        except BufferError:
+            self.messages.append("Warning: the memory map of '{}' is still in use and will be closed when it is no longer referenced.".format(self.path))
 
 
     def read(self, max_bytes=None):
@@ -495,18 +1772,458 @@ is returned (b"")."""
             if (max_bytes % self.block_align) != 0:
                 max_bytes = ((max_bytes // self.block_align) + 1) * self.block_align
                 self.messages.append("Warning: attempt to read a number of bytes that is not a multiple of the blockalign size of {}.".format(self.block_align))
-            out = self.wf.read(min(max_bytes, self.end_of_data - self.data_position))
+            out = self.wf.read(max_bytes if self.unknown_length else min(max_bytes, self.data_length - self.data_position))
         else:
-            out = self.wf.read(self.end_of_data - self.data_position)
+            out = self.wf.read() if self.unknown_length else self.wf.read(self.data_length - self.data_position)
         bytes_read = len(out)
 
         if bytes_read == 0:
             return b""
 
         self.data_position += bytes_read
+        if self.unknown_length:
+            self._update_length(self.data_position)
         return out
 
 
+    def _update_length(self, data_length):
+        """Sets the size members for a stream of unknown length
+to the <data_length> that has been read so far."""
+        self.data_length = data_length
+        self.end_of_data = self.data_starts_at + data_length
+        self.samples = data_length // self.block_align * (self.samples_per_block or 1)
+
+
+    def readinto(self, buffer):
+        """Returns the number of frames read.
+Reads as many whole blocks (frames) of data as fit into the
+writable <buffer> (e.g. a bytearray, memoryview or NumPy array)
+without allocating a new bytes object.
+If the end of the data chunk is reached, 0 is returned."""
+        assert self.mode == "r", "this function can only be called in read mode"
+        view = memoryview(buffer).cast("B")
+        assert len(view) >= self.block_align, "the buffer has to hold at least one block of {} bytes".format(self.block_align)
+
+        size = len(view) // self.block_align * self.block_align
+        if not self.unknown_length:
+            size = min(size, self.data_length - self.data_position)
+        bytes_read = 0
+        while bytes_read < size:
+            read = self.wf.readinto(view[bytes_read:size])
+            if not read:        # EOF before the end of the data chunk (truncated file)
+                break
+            bytes_read += read
+
+        self.data_position += bytes_read
+        if self.unknown_length:
+            self._update_length(self.data_position)
+        return bytes_read // self.block_align
+
+
+    def read_frames_into(self, buffer, number_of_frames):
+        """Returns the number of frames read.
+Reads at most <number_of_frames> frames into the start of the
+writable <buffer>, which has to be large enough to hold them."""
+        view = memoryview(buffer).cast("B")
+        size = number_of_frames * self.block_align
+        assert len(view) >= size, "the buffer is too small to hold {} frames".format(number_of_frames)
+        if number_of_frames <= 0:
+            return 0
+        return self.readinto(view[:size])
+
+
+    def blocks(self, frames_per_block, overlap = 0, dtype = None, reuse = False):
+        """Yields the data from the current position to the end in
+blocks of <frames_per_block> frames. Consecutive blocks share
+<overlap> frames. The last block can be shorter.
+If <dtype> is None, the blocks are bytes, otherwise they are
+(frames, channels) NumPy arrays of that type (see read_frames()).
+If <reuse> is True, all blocks are read into the same buffer
+(without copying), so a block is only valid until the next one
+is requested. Byte blocks are memoryviews in that case.
+ADPCM byte blocks contain the whole compression blocks that hold
+<frames_per_block> frames (and can't overlap). Decoded ADPCM
+blocks have exactly <frames_per_block> frames, without the
+padding of the last compression block, and are never reused."""
+        assert self.mode == "r", "this function can only be called in read mode"
+        assert frames_per_block > 0, "frames_per_block has to be positive"
+        assert 0 <= overlap < frames_per_block, "overlap has to be smaller than frames_per_block"
+        if self.samples_per_block:
+            if dtype is not None:
+                yield from self._adpcm_blocks(frames_per_block, overlap, dtype)
+                return
+            assert overlap == 0, "ADPCM byte blocks can't overlap"
+            frames_per_block = -(-frames_per_block // self.samples_per_block)
+
+        overlap_bytes = overlap * self.block_align
+        buffer = bytearray(frames_per_block * self.block_align)
+        view = memoryview(buffer)
+        filled = 0          # number of bytes at the start of the buffer that are left over from the previous block
+
+        while True:
+            frames = self.readinto(view[filled:])
+            if frames == 0:
+                return      # the overlap (if any) has been part of the previous block already
+            size = filled + frames * self.block_align
+
+            if dtype is None:
+                yield view[:size] if reuse else bytes(view[:size])
+            else:
+                yield self._decode(view[:size] if reuse else bytes(view[:size]), dtype)
+
+            if size < len(buffer):
+                return      # a short block means that we've reached the end of the data
+            if overlap_bytes:
+                buffer[:overlap_bytes] = buffer[size - overlap_bytes:size]
+            filled = overlap_bytes
+
+
+    def _adpcm_blocks(self, frames_per_block, overlap, dtype):
+        """Yields the decoded ADPCM frames from the current position to
+the end in blocks of <frames_per_block> frames, see blocks()."""
+        np = _import_numpy()
+        pending = self._decode(b"", dtype)
+        yielded = False
+        while True:
+            new = self.read_frames(frames_per_block - len(pending), dtype)
+            if len(new):
+                pending = np.concatenate((pending, new))
+            elif len(pending) <= (overlap if yielded else 0):
+                return      # the overlap (if any) has been part of the previous block already
+            yield pending[:frames_per_block]
+            yielded = True
+            if len(pending) < frames_per_block:
+                return
+            pending = pending[frames_per_block - overlap:]
+
+
+    def read_frames(self, number_of_frames = None, dtype = None):
+        """Returns a (frames, channels) NumPy array.
+Reads up to <number_of_frames> frames (or everything until the end
+if it is None) and converts them to <dtype>, which can be
+"float32", "float64", "int16", "int32" or None / "native" (see
+_decode_frames()). Requires NumPy.
+A-law, µ-law and ADPCM data is decoded to 16 bit samples. ADPCM
+is decoded in whole blocks of <samples_per_block> frames, the
+frames of the last block that are not returned are kept for the
+next call (until seek() is called), so tell() is at the end of
+that block."""
+        if number_of_frames is not None and number_of_frames <= 0:
+            return self._decode(b"", dtype)
+        if self._get_sample_format() not in (WAVE_FORMAT_ADPCM, WAVE_FORMAT_DVI_ADPCM):
+            return self._decode(self.read(None if number_of_frames is None else number_of_frames * self.block_align), dtype)
+
+        np = _import_numpy()
+        if dtype not in (None, "native"):
+            dtype = np.dtype(dtype)
+            assert dtype.name in ("float32", "float64", "int16", "int32"), "dtype has to be 'float32', 'float64', 'int16', 'int32' or 'native'"
+        else:
+            dtype = None
+        # the leftover frames (as 16 bit samples) are only valid if the position hasn't changed since they were decoded
+        position, leftover = self._adpcm_leftover or (None, None)
+        if position != self.data_position:
+            leftover = self._decode(b"", None)
+        self._adpcm_leftover = None
+        frame_position = self.data_position // self.block_align * self.samples_per_block - len(leftover)
+
+        if number_of_frames is None:
+            data = self.read()
+        else:
+            data = self.read(max(0, -(-(number_of_frames - len(leftover)) // self.samples_per_block)) * self.block_align)
+        frames = np.concatenate((leftover, self._decode(data, None)))
+        # the last block is padded, the fact chunk tells how many samples there really are
+        frames = frames[:max(0, self.samples - frame_position)]
+        if number_of_frames is not None and len(frames) > number_of_frames:
+            self._adpcm_leftover = (self.data_position, frames[number_of_frames:])
+            frames = frames[:number_of_frames]
+        return _convert_samples(frames, 16, dtype)
+
+
+    def read_at(self, start_frame, number_of_frames = None):
+        """Returns data (bytes).
+Reads up to <number_of_frames> frames (or everything until the end
+if it is None) starting at frame <start_frame>, without using or
+moving the current position. As it uses positional reads
+(os.pread() or the memory map), several threads can call it on
+the same Wave at the same time. For file objects without a file
+descriptor the reads are serialized instead (they are only safe
+against other positional reads, not against read() / seek()).
+ADPCM frames don't have bytes of their own, use read_frames_at()
+for them."""
+        assert self.mode == "r", "this function can only be called in read mode"
+        assert not self.stream, "positional reads are not available for streams"
+        assert start_frame >= 0, "start_frame can't be negative"
+        if self.samples_per_block:
+            raise PyWaveError("'{}' is ADPCM compressed, its frames can only be read with read_frames_at().".format(self.path))
+        total_frames = self.data_length // self.block_align
+        if number_of_frames is None:
+            number_of_frames = total_frames - start_frame
+        number_of_frames = min(number_of_frames, total_frames - start_frame)
+        if number_of_frames <= 0:
+            return b""
+        return bytes(self._pread(self.data_starts_at + start_frame * self.block_align, number_of_frames * self.block_align))
+
+
+    def read_time(self, start_seconds, duration = None):
+        """Returns data (bytes).
+Reads <duration> seconds (or everything until the end if it is
+None) starting at <start_seconds>, see read_at()."""
+        start_frame = round(start_seconds * self.frequency)
+        return self.read_at(start_frame, None if duration is None else round((start_seconds + duration) * self.frequency) - start_frame)
+
+
+    def read_frames_at(self, start_frame, number_of_frames = None, dtype = None):
+        """Returns a (frames, channels) NumPy array of the frames that
+read_at() returns, converted to <dtype> (see read_frames()).
+For ADPCM, the compression blocks that contain the frames are
+decoded, and the frames are cut out of them.
+Requires NumPy."""
+        if not self.samples_per_block:
+            return self._decode(self.read_at(start_frame, number_of_frames), dtype)
+        assert self.mode == "r", "this function can only be called in read mode"
+        assert not self.stream, "positional reads are not available for streams"
+        assert start_frame >= 0, "start_frame can't be negative"
+        total_frames = self._frame_count()
+        if number_of_frames is None:
+            number_of_frames = total_frames - start_frame
+        number_of_frames = min(number_of_frames, total_frames - start_frame)
+        if number_of_frames <= 0:
+            return self._decode(b"", dtype)
+        first_block = start_frame // self.samples_per_block
+        end_block = -(-(start_frame + number_of_frames) // self.samples_per_block)
+        frames = self._decode(self._pread(self.data_starts_at + first_block * self.block_align, (end_block - first_block) * self.block_align), dtype)
+        offset = start_frame - first_block * self.samples_per_block
+        return frames[offset:offset + number_of_frames]
+
+
+    def _frame_count(self):
+        """Returns the number of frames in the data chunk. For ADPCM
+that's the number of samples in the fact chunk, without the
+padding of the last block."""
+        if self.samples_per_block:
+            return min(self.samples, self.data_length // self.block_align * self.samples_per_block)
+        return self.data_length // self.block_align
+
+
+    def _channel_indexes(self, channels):
+        """Returns the indexes of <channels>, which are channel numbers
+or speaker abbreviations (see get_speakers())."""
+        speakers = get_speakers(getattr(self, "channel_mask", 0), self.channels)
+        indexes = []
+        for channel in channels:
+            if isinstance(channel, str):
+                if channel not in speakers:
+                    raise PyWaveError("'{}' has no '{}' channel (channels: {}).".format(self.path, channel, speakers))
+                channel = speakers.index(channel)
+            assert 0 <= channel < self.channels, "channel {} doesn't exist".format(channel)
+            indexes.append(channel)
+        return indexes
+
+
+    def read_channels(self, channels, number_of_frames = None, dtype = None):
+        """Returns a (frames, len(channels)) NumPy array with only the
+<channels> (channel numbers or speaker abbreviations like "FC"),
+see read_frames(). The bytes of these channels are picked from
+the interleaved data through a strided view, so only they are
+copied and decoded (except for ADPCM, which is decoded as a
+whole). Requires NumPy."""
+        np = _import_numpy()
+        indexes = self._channel_indexes(channels)
+        sample_format = self._get_sample_format()
+        if sample_format in (WAVE_FORMAT_ADPCM, WAVE_FORMAT_DVI_ADPCM):
+            return self.read_frames(number_of_frames, dtype)[:, indexes]
+        if number_of_frames is not None and number_of_frames <= 0:
+            data = b""
+        else:
+            data = self.read(None if number_of_frames is None else number_of_frames * self.block_align)
+        frames = len(data) // self.block_align
+        selected = np.frombuffer(data, dtype = "u1", count = frames * self.block_align).reshape(frames, self.channels, self.block_align // self.channels)[:, indexes]
+        return _decode_frames(selected.tobytes(), len(indexes), sample_format, self.bits_per_sample, getattr(self, "valid_bits_per_sample", self.bits_per_sample), dtype)
+
+
+    def read_remixed(self, layout, number_of_frames = None, dtype = "float64", normalize = False):
+        """Returns the frames (see read_frames()) remixed to <layout>,
+a CHANNEL_SETUPS name like "stereo" or a channel mask, with the
+matrix of get_remix_matrix(). <dtype> has to be a float type.
+Requires NumPy."""
+        assert dtype in ("float32", "float64"), "dtype has to be 'float32' or 'float64'"
+        matrix, mask = get_remix_matrix(getattr(self, "channel_mask", 0), self.channels, layout, normalize)
+        return (self.read_frames(number_of_frames, "float64") @ matrix).astype(dtype)
+
+
+    def _decode(self, data, dtype):
+        """Converts <data> in the format of this file to a NumPy array."""
+        sample_format = self._get_sample_format()
+        if sample_format in (WAVE_FORMAT_ADPCM, WAVE_FORMAT_DVI_ADPCM):
+            return _decode_adpcm(data, self.channels, sample_format, self.block_align, self.adpcm_coefficients, dtype)
+        return _decode_frames(data, self.channels, self._get_sample_format(), self.bits_per_sample, getattr(self, "valid_bits_per_sample", self.bits_per_sample), dtype)
+
+
+    def _pread(self, offset, size):
+        """Returns up to <size> bytes from the absolute position <offset>
+in the file, without using or moving the current file position.
+Uses the memory map or os.pread() where possible, so it can be
+called from several threads at the same time."""
+        if getattr(self, "_mmap", None) is not None and not getattr(self, "_closed", False):
+            return memoryview(self._mmap)[offset:offset + size]
+        try:
+            fileno = self.wf.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fileno = None
+        if fileno is not None and hasattr(os, "pread"):
+            data = os.pread(fileno, size, offset)
+            while 0 < len(data) < size:
+                more = os.pread(fileno, size - len(data), offset + len(data))
+                if not more:
+                    break
+                data += more
+            return data
+        with self._lock:
+            position = self.wf.tell()
+            try:
+                self.wf.seek(offset)
+                return self.wf.read(size)
+            finally:
+                self.wf.seek(position)
+
+
+    def stats(self, workers = None, block_frames = 65536):
+        """Returns a dict with per-channel signal statistics:
+'peak', 'rms' and 'dc_offset' (relative to full scale, with
+'peak_db' / 'rms_db' in dBFS), 'min' / 'max' (relative to full
+scale) and 'clipped' (number of samples at full scale), plus the
+number of 'frames'.
+The data is split into block aligned ranges that are processed in
+parallel by <workers> threads (in blocks of <block_frames> frames),
+and their partial sums are merged. The current position is not
+changed. Requires NumPy."""
+        assert self.mode == "r", "this function can only be called in read mode"
+        assert not self.stream, "statistics are not available for streams"
+        np = _import_numpy()
+
+        sample_format = self._get_sample_format()
+        if sample_format == WAVE_FORMAT_IEEE_FLOAT:
+            full_scale = 1.0
+        elif sample_format in (WAVE_FORMAT_ALAW, WAVE_FORMAT_MULAW, WAVE_FORMAT_ADPCM, WAVE_FORMAT_DVI_ADPCM):
+            full_scale = 32768.0        # decoded to 16 bit samples
+        else:
+            full_scale = float(2 ** (min(self.valid_bits_per_sample, self.bits_per_sample) - 1))
+
+        def process(start, end):
+            count, total, squares = 0, np.zeros(self.channels), np.zeros(self.channels)
+            minimum, maximum = np.full(self.channels, np.inf), np.full(self.channels, -np.inf)
+            clipped = np.zeros(self.channels, dtype = "i8")
+            for frame in range(start, end, block_frames):
+                frames = min(block_frames, end - frame)
+                samples = self.read_frames_at(frame, frames)
+                if samples.dtype == np.uint8:
+                    samples = samples.astype("i2") - 128
+                values = samples.astype("f8")
+                count += len(values)
+                total += values.sum(axis = 0)
+                squares += np.einsum("ij,ij->j", values, values)
+                minimum = np.minimum(minimum, values.min(axis = 0, initial = np.inf))
+                maximum = np.maximum(maximum, values.max(axis = 0, initial = -np.inf))
+                if sample_format == WAVE_FORMAT_IEEE_FLOAT:
+                    clipped += (np.abs(values) >= 1.0).sum(axis = 0)
+                else:
+                    clipped += ((values >= full_scale - 1) | (values <= -full_scale)).sum(axis = 0)
+                if len(values) < frames:
+                    break       # truncated file
+            return count, total, squares, minimum, maximum, clipped
+
+        total_frames = self._frame_count()
+        workers = max(1, min(workers or os.cpu_count() or 1, -(-total_frames // block_frames)))
+        frames_per_range = -(-total_frames // workers)
+        ranges = [(start, min(start + frames_per_range, total_frames)) for start in range(0, total_frames, frames_per_range or 1)]
+        if workers == 1:
+            partials = [process(start, end) for start, end in ranges]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+                partials = list(executor.map(lambda range_: process(*range_), ranges))
+
+        count = sum(partial[0] for partial in partials)
+        total = sum((partial[1] for partial in partials), np.zeros(self.channels))
+        squares = sum((partial[2] for partial in partials), np.zeros(self.channels))
+        minimum = np.min([partial[3] for partial in partials] or [np.zeros(self.channels)], axis = 0)
+        maximum = np.max([partial[4] for partial in partials] or [np.zeros(self.channels)], axis = 0)
+        clipped = sum((partial[5] for partial in partials), np.zeros(self.channels, dtype = "i8"))
+
+        if count == 0:
+            minimum = maximum = np.zeros(self.channels)
+        peak = np.maximum(np.abs(minimum), np.abs(maximum)) / full_scale
+        rms = np.sqrt(squares / max(count, 1)) / full_scale
+        with np.errstate(divide = "ignore"):
+            peak_db = 20 * np.log10(peak)
+            rms_db = 20 * np.log10(rms)
+        return {
+            "frames": count,
+            "peak": peak.tolist(),
+            "peak_db": peak_db.tolist(),
+            "rms": rms.tolist(),
+            "rms_db": rms_db.tolist(),
+            "dc_offset": (total / max(count, 1) / full_scale).tolist(),
+            "min": (minimum / full_scale).tolist(),
+            "max": (maximum / full_scale).tolist(),
+            "clipped": clipped.tolist(),
+        }
+
+
+    def loudness(self, block_frames = 65536):
+        """Returns a dict with the loudness of the data according to
+ITU-R BS.1770-4 / EBU R 128: the gated 'integrated' loudness
+(LUFS), the 'loudness_range' (LU, EBU Tech 3342), the
+'max_momentary' (400 ms) and 'max_short_term' (3 s) loudness
+(LUFS) and the 4x oversampled 'true_peak' (dBTP).
+The data is read in blocks of <block_frames> frames; besides
+those, only one value per channel and 100 ms is kept.
+The current position is not changed. Requires NumPy."""
+        assert self.mode == "r", "this function can only be called in read mode"
+        assert not self.stream, "loudness is not available for streams"
+        np = _import_numpy()
+
+        meter = LoudnessMeter(self.channels, self.frequency, getattr(self, "channel_mask", 0))
+        total_frames = self._frame_count()
+        for frame in range(0, total_frames, block_frames):
+            frames = min(block_frames, total_frames - frame)
+            samples = self.read_frames_at(frame, frames, "float64")
+            meter.add(samples)
+            if len(samples) < frames:
+                break       # truncated file
+        return meter.result()
+
+
+    def get_waveform_pyramid(self, base_block = 256, cache = True):
+        """Returns a WaveformPyramid of the data, for drawing waveforms
+at any zoom level. If <cache> is True, the pyramid is loaded from
+(or, if it is missing or outdated, saved to) a sidecar file next
+to the wave file. The current position is not changed.
+Requires NumPy."""
+        assert self.mode == "r", "this function can only be called in read mode"
+        sidecar = None
+        if cache and isinstance(self.path, (str, os.PathLike)):
+            sidecar = os.fspath(self.path) + WaveformPyramid.SIDECAR_SUFFIX
+            pyramid = WaveformPyramid.load(sidecar, self.path)
+            if pyramid is not None and pyramid.base_block == base_block:
+                return pyramid
+
+        pyramid = WaveformPyramid.from_wave(self, base_block)
+        if sidecar is not None:
+            try:
+                pyramid.save(sidecar, self.path)
+            except OSError as exception:
+                self.messages.append("Warning: could not save the waveform pyramid to '{}': {}".format(sidecar, exception))
+        return pyramid
+
+
+    def _get_sample_format(self):
+        """Returns the format of the samples, which is the sub format
+for WAVE_FORMAT_EXTENSIBLE files."""
+        if self.format == WAVE_FORMAT_EXTENSIBLE:
+            return getattr(self, "subformat", WAVE_FORMAT_UNKNOWN)
+        return self.format
+
+
     def read_samples(self, number_of_samples):
         """Returns <number_of_samples> samples"""
         return self.read(self.bytes_per_sample * number_of_samples)
@@ -520,10 +2237,51 @@ is returned (b"")."""
     def close(self):
         """Closes the file pointer"""
         # do not attempt to write or close the wavefile if it never initialized correctly.
-        if hasattr(self, "wf"):
-            if self.mode == "w" and hasattr(self, "data_chunk_size") and self.data_chunk_size % 2:
-                self.wf.write(b"\x00")
-            self.wf.close()
+        if hasattr(self, "wf") and not self.wf.closed and not getattr(self, "_closed", False):
+            self._closed = True
+            try:
+                # like before, a writer that never wrote (or flushed) anything leaves the file empty.
+                if self.mode == "w" and getattr(self, "_prepared_for_writing", False):
+                    self._write_adpcm_pending()
+                    if self.stream:
+                        self._close_stream()
+                    else:
+                        # the pad byte of an odd sized data chunk is not part of the data chunk, but it is part of the RIFF chunk.
+                        if self.data_chunk_size % 2:
+                            self.wf.seek(self.data_starts_at + self.data_chunk_size)
+                            self.wf.write(b"\x00")
+                            self.riff_chunk_size += 1
+                        try:
+                            if self.peak_chunk:
+                                self._write_peak_chunk()
+                            if self.levl_chunk:
+                                self._write_levl_chunk()
+                        finally:
+                            # even without the levl chunk, the file stays readable
+                            self._write_chunk_sizes()
+            finally:
+                if hasattr(self, "_mmap"):
+                    self._unmap_data()
+                if self._owns_file:
+                    self.wf.close()
+                else:
+                    self.wf.flush()
+
+
+    def _close_stream(self):
+        """Finishes a stream that is being written. The header can't be
+changed anymore, so a mismatch with <total_frames> is only reported."""
+        if self.total_frames is None:
+            return          # a pad byte would be read as data by readers that read to the end of the stream
+        if self.samples_per_block:
+            expected = -(-self.total_frames // self.samples_per_block) * self.block_align
+        else:
+            expected = self.total_frames * self.block_align
+        if self.data_chunk_size != expected:
+            self.messages.append("Warning: the header of the stream '{0}' announced {1} bytes of data, but {2} bytes were written.".format(self.path, expected, self.data_chunk_size))
+        if self.data_chunk_size % 2:
+            self.wf.write(b"\x00")
+            self.riff_chunk_size += 1
 
 
     def seek(self, offset, whence=0):
@@ -539,7 +2297,7 @@ the file plus <offset>."""
             pos = max(min(self.data_starts_at + offset, self.end_of_data), self.data_starts_at)
             
         elif whence == 1:
-            pos = max(min(self.data_position + offset, self.end_of_data), self.data_starts_at)
+            pos = max(min(self.data_starts_at + self.data_position + offset, self.end_of_data), self.data_starts_at)
             
         elif whence == 2:
             pos = max(min(self.end_of_data + offset, self.end_of_data), self.data_starts_at)
@@ -547,10 +2305,39 @@ the file plus <offset>."""
         else:
             raise AssertionError("whence has to be either 0, 1 or 2")
 
+        self._adpcm_leftover = None
+        if self.stream:
+            # streams can only skip forward, by reading and discarding the data in between.
+            if pos < self.data_starts_at + self.data_position:
+                raise PyWaveError("cannot seek backwards in the stream '{}'.".format(self.path))
+            while self.data_starts_at + self.data_position < pos:
+                skipped = len(self.wf.read(min(pos - self.data_starts_at - self.data_position, 1 << 20)))
+                if not skipped:
+                    break
+                self.data_position += skipped
+            return
+
         self.data_position = pos - self.data_starts_at
         self.wf.seek(pos)
 
 
+    @staticmethod
+    def _load_metadata(reader, parser, size, offset):
+        """Calls the metadata <parser> of a LazyMetadata entry on the
+Wave behind the weak reference <reader>, without moving the
+current position in the data stream."""
+        self = reader()
+        if self is None:
+            raise PyWaveError("cannot load metadata, the file has been closed.")
+        if self.wf.closed:
+            raise PyWaveError("cannot load metadata from '{}', the file is closed.".format(self.path))
+        position = self.wf.tell()
+        try:
+            return parser(self, size, offset)
+        finally:
+            self.wf.seek(position)
+
+
     def _read_chunk_data(self, size, offset):
         """Reads `size` bytes of data at `offset` from `file_`.
 Note: Position is not reset after reading."""
@@ -566,62 +2353,37 @@ Returns `OK` (0) on success and `ERROR_NOT_A_WAVE_FILE` (-1) on failure."""
         self.wf.seek(4, 1)
         WAVETag = self.wf.read(4)
 
-        if RIFFChunk != fourccRIFF or WAVETag != fourccWAVE:
+        if RIFFChunk not in (fourccRIFF, fourccRF64, fourccBW64) or WAVETag != fourccWAVE:
             return ERROR_NOT_A_WAVE_FILE
+        self.rf64 = RIFFChunk != fourccRIFF
         return OK
 
 
     def _get_chunks(self):
-        """Finds all the chunks in `file_`."""
+        """Returns a ChunkIndex of all the chunks in `file_`."""
         self.wf.seek(4)                     # skip 'RIFF' at start of file
         total_size = bti(self.wf.read(4))   # This should be the size of the entire file in bytes minus 8 bytes for the two fields not included in this count. Not always correct!
-        self.wf.seek(4, 1)
-        
-        out = {}                            # WARNING: a set instead of a list only works when each chunk is unique. But it is valid to have more than one LIST chunk.
-        Offset = 12
-        
-        read_bytes = 4
-        read = True
-
-        # An incorrect total_size in the file can cause reads past end of file.
-        # Fixed by checking for an empty read when trying to read the next chunk (empty read = EOF)
-        # We also pre-emptively prevent the scenario where we encounter a double top-level chunk (like two versions of ID3). 
-        # We make an exception only for the LIST chunk, that can occur multiple times but with a different form type ID.
-        while read_bytes < total_size and read:
-            read = self.wf.read(4)
-            if read != b'':             # if not EOF
-                read_bytes += len(read)
-                ChunkType = read
-        
-                read = self.wf.read(4)
-                read_bytes += len(read)         # should always be 4 unless we're at EOF
-                ChunkDataSize = bti(read)
-       
-                Offset += 8
-                if out.get(ChunkType) is not None and ChunkType != fourccLIST:
-                    self.messages.append("ERROR: chunk '{0}' has a duplicate (ignored) chunk of the same type at position {1} with size {2}!".format(ChunkType.decode(), Offset, ChunkDataSize))
-                else:
-                    out[ChunkType] = (ChunkDataSize, Offset)
-        
-                self.wf.seek(ChunkDataSize, 1)
-                read_bytes += ChunkDataSize
-                Offset += ChunkDataSize
-
-                # "All information in a wave file must be word aligned (i.e., aligned at every two bytes)."
-                # "If a chunk has an odd number of bytes, then it will be padded with a zero byte, although this byte will not be counted in the size of the chunk."
-                # Now, here we have an issue. We should align on words, but if we do that, we may miss the next chunk by 1, for misaligned chunks.
-                # So if we get uneven data, keep it as reported. The parser for the chunk just needs to deal with it and correctly align the data on word boundaries.
-                # If our next read is not at the EOF, then check if our next read is another chunk by checking for a null byte read.
-                # If we read a null byte, keep it skipped. Otherwise, go back 1 byte.
-                if read_bytes < total_size and (ChunkDataSize % 2 == 1):
-                    read = self.wf.read(1)                              # read the padding byte to see if it is actually a padding byte, or the first byte of a chunk
-                    if read not in (b'', b'\x00'):
-                        self.wf.seek(-1, 1)                             # if we are aligned on non-word (wrong), then go back 1 byte
-
-        # If the read_bytes are not the same as the total_size at EOF, we need to correct total_size to the real size value in read_bytes.
-        # If they are the same, the statement does not harm anything :)
-        total_size = read_bytes
-        return out
+
+        # RF64 files have their real sizes in the ds64 chunk, the 32 bit size fields are set to 0xFFFFFFFF.
+        large_sizes = None
+        if self.rf64:
+            header = self.wf.read(12)[4:]
+            if header[:4] != fourccDS64:
+                raise PyWaveError("'{}' is an RF64 file, but the first chunk is not a 'ds64' chunk.".format(self.path))
+            ds64 = self._get_ds64_chunk(bti(header[4:8]), 20)
+            total_size = ds64['riffSize']
+            large_sizes = {fourCC.encode(): size for fourCC, size in ds64['table'].items()}
+            large_sizes[fourccDATA] = ds64['dataSize']
+
+        chunks = ChunkIndex.scan(self.wf, 12, 8 + total_size, large_sizes = large_sizes)
+
+        # Only the first chunk of each type is used. We make an exception only for the LIST chunk,
+        # that can occur multiple times but with a different form type ID.
+        for fourCC in chunks:
+            if fourCC != fourccLIST:
+                for chunk in chunks.find_all(fourCC)[1:]:
+                    self.messages.append("ERROR: chunk '{0}' has a duplicate (ignored) chunk of the same type at position {1} with size {2}!".format(fourCC.decode(), chunk.offset, chunk.size))
+        return chunks
 
 
     # Specific function to read the INFO subchunk in the LIST chunk.
@@ -661,6 +2423,32 @@ Returns `OK` (0) on success and `ERROR_NOT_A_WAVE_FILE` (-1) on failure."""
         out['data'] = data
         return out
 
+    # Specific function to read the ds64 chunk of RF64 / BW64 files
+    # See for specs: https://tech.ebu.ch/docs/tech/tech3306.pdf
+    #
+    # Format:
+    #   DWORD riffSizeLow, riffSizeHigh;    /* size of the RIFF chunk */
+    #   DWORD dataSizeLow, dataSizeHigh;    /* size of the data chunk */
+    #   DWORD sampleCountLow, sampleCountHigh;  /* number of samples (frames) */
+    #   DWORD tableLength;                  /* number of valid entries in the table */
+    #   ChunkSize64 table[];                /* CHAR chunkId[4]; DWORD sizeLow, sizeHigh; for other chunks > 4 GiB */
+    #
+    def _get_ds64_chunk(self, size, offset):
+        self.wf.seek(offset)
+        out = {}
+        data = self.wf.read(size)
+
+        out['riffSize'] = bti(data[0:8])
+        out['dataSize'] = bti(data[8:16])
+        out['sampleCount'] = bti(data[16:24])
+        table_length = bti(data[24:28])
+        out['table'] = {}
+        for i in range(table_length):
+            entry = data[28 + i * 12:40 + i * 12]
+            if len(entry) == 12:
+                out['table'][entry[:4].decode()] = bti(entry[4:])
+        return out
+
     # Specific function to read the PEAK chunk
     # See for specs: https://web.archive.org/web/20081201144551/http://music.calarts.edu/~tre/PeakChunk.html
     def _get_peak_chunk(self, size, offset):
@@ -725,11 +2513,12 @@ Returns `OK` (0) on success and `ERROR_NOT_A_WAVE_FILE` (-1) on failure."""
         out['TimeReferenceHigh'] = bti(data[342:346])
         out['Version'] = bti(data[346:348])
         out['SMPTE UMID'] = data[348:412]
-        out['LoudnessValue'] = bti(data[412:414])
-        out['LoudnessRange'] = bti(data[414:416])
-        out['MaxTruePeakLevel'] = bti(data[416:418])
-        out['MaxMomentaryLoudness'] = bti(data[418:420])
-        out['MaxShortTermLoudness'] = bti(data[420:422])
+        # the loudness values are signed (LUFS / LU / dBTP multiplied by 100)
+        out['LoudnessValue'] = int.from_bytes(data[412:414], "little", signed = True)
+        out['LoudnessRange'] = int.from_bytes(data[414:416], "little", signed = True)
+        out['MaxTruePeakLevel'] = int.from_bytes(data[416:418], "little", signed = True)
+        out['MaxMomentaryLoudness'] = int.from_bytes(data[418:420], "little", signed = True)
+        out['MaxShortTermLoudness'] = int.from_bytes(data[420:422], "little", signed = True)
         #   out['Reserved'] = data[422:602]
         out['CodingHistory'] = clstr(data[602:])
         return out
@@ -847,40 +2636,11 @@ Returns `OK` (0) on success and `ERROR_NOT_A_WAVE_FILE` (-1) on failure."""
     # Great info on channel layouts: https://stackoverflow.com/questions/25178167/reading-a-single-channel-from-a-multi-channel-wav-file
     @staticmethod
     def get_channel_layout(channelmask, nr_of_channels):
-        master_channel_layout = [
-            [0x1, 'Front Left', 'FL'],
-            [0x2, 'Front Right', 'FR'],
-            [0x4, 'Front Center', 'FC'],
-            [0x8, 'Low Frequency', 'LFE'],
-            [0x10, 'Back Left (Surround Back Left)', 'BL'],
-            [0x20, 'Back Right (Surround Back Right)', 'BR'],
-            [0x40, 'Front Left of Center', 'FLC'],
-            [0x80, 'Front Right of Center', 'FRC'],
-            [0x100, 'Back Center', 'BC'],
-            [0x200, 'Side Left (Surround Left)', 'SL'],
-            [0x400, 'Side Right (Surround Right)', 'SR'],
-            [0x800, 'Top Center', 'TC'],
-            [0x1000, 'Top Front Left', 'TFL'],
-            [0x2000, 'Top Front Center', 'TFC'],
-            [0x4000, 'Top Front Right', 'TFR'],
-            [0x8000, 'Top Back Left', 'TBL'],
-            [0x10000, 'Top Back Center', 'TBC'],
-            [0x20000, 'Top Back Right', 'TBR'],
-
-            # everything after this one is part of the FFMPEG layout specs, but not officially part of the master channel layout masks. Use at your own risk.
-            [0x20000000, 'Downmix Left', 'DL'],
-            [0x40000000, 'Downmix Right', 'DR'],
-            [0x80000000, 'Wide Left', 'WL'],
-            [0x100000000, 'Wide Right', 'WR'],
-            [0x400000, 'Surround Direct Left', 'SDL'],
-            [0x800000, 'Surround Direct Right', 'SDR'],
-            [0x1000000, 'Low Frequency 2', 'LFE2']
-        ]
 
         channel_layout = []
 
         # I hope this obeys the ordering of the list.
-        for mclitem in master_channel_layout:
+        for mclitem in SPEAKERS:
             if channelmask & mclitem[0]:
                 channel_layout.append(mclitem[1])
 
@@ -916,69 +2676,7 @@ Returns `OK` (0) on success and `ERROR_NOT_A_WAVE_FILE` (-1) on failure."""
         # We cannot mask them, since downmix only has 2 bits but in the highest places.
         # So we will need an alternative method eventually, but for now it's okay.
 
-        # See for possible channel layouts: https://trac.ffmpeg.org/wiki/AudioChannelManipulation
-        # Standard channel layouts:
-        # NAME           DECOMPOSITION
-        # mono           FC                         0b000000000100
-        # stereo         FL+FR                      0b000000000011
-        # 2.1            FL+FR+LFE                  0b000000001011
-        # 3.0            FL+FR+FC                   0b000000000111
-        # 3.0(back)      FL+FR+BC                   0b000100000011
-        # 4.0            FL+FR+FC+BC                0b000100000111
-        # quad           FL+FR+BL+BR                0b000000110011
-        # quad(side)     FL+FR+SL+SR                0b011000000011
-        # 3.1            FL+FR+FC+LFE               0b000000001111
-        # 5.0            FL+FR+FC+BL+BR             0b000000110111
-        # 5.0(side)      FL+FR+FC+SL+SR             0b011000000111
-        # 4.1            FL+FR+FC+LFE+BC            0b000100001111
-        # 5.1            FL+FR+FC+LFE+BL+BR         0b000000111111
-        # 5.1(side)      FL+FR+FC+LFE+SL+SR         0b011000001111
-        # 6.0            FL+FR+FC+BC+SL+SR          0b011100000111
-        # 6.0(front)     FL+FR+FLC+FRC+SL+SR        0b011011000011
-        # hexagonal      FL+FR+FC+BL+BR+BC          0b000100110111
-        # 6.1            FL+FR+FC+LFE+BC+SL+SR      0b011100001111
-        # 6.1(back)      FL+FR+FC+LFE+BL+BR+BC      0b000100111111
-        # 6.1(front)     FL+FR+LFE+FLC+FRC+SL+SR    0b011011001011
-        # 7.0            FL+FR+FC+BL+BR+SL+SR       0b011000110111
-        # 7.0(front)     FL+FR+FC+FLC+FRC+SL+SR     0b011011000111
-        # 7.1            FL+FR+FC+LFE+BL+BR+SL+SR   0b011000111111
-        # 7.1(wide)      FL+FR+FC+LFE+BL+BR+FLC+FRC 0b000011111111
-        # 7.1(wide-side) FL+FR+FC+LFE+FLC+FRC+SL+SR 0b011011001111
-        # octagonal      FL+FR+FC+BL+BR+BC+SL+SR    0b011100110111
-        # downmix        DL+DR                      0b01100000000000000000000000000000
-        # max value in WAV-file:                    0b11111111111111111111111111111111
-        # hexadecagonal  FL+FR+FC+BL+BR+BC+SL+SR+TFL+TFC+TFR+TBL+TBC+TBR+WL+WR
-        #                                           0b110000000000000111111011100110111
-        master_layout = {
-            0b000000000100: 'mono',
-            0b000000000011: 'stereo',
-            0b000000001011: '2.1',
-            0b000000000111: '3.0',
-            0b000100000011: '3.0 (back)',
-            0b000100000111: '4.0',
-            0b000000110011: 'quad',
-            0b011000000011: 'quad(side)',
-            0b000000001111: '3.1',
-            0b000000110111: '5.0',
-            0b011000000111: '5.0 (side)',
-            0b000100001111: '4.1',
-            0b000000111111: '5.1',
-            0b011000001111: '5.1 (side)',
-            0b011100000111: '6.0',
-            0b011011000011: '6.0 (front)',
-            0b000100110111: 'hexagonal',
-            0b011100001111: '6.1',
-            0b000100111111: '6.1 (back)',
-            0b011011001011: '6.1 (front)',
-            0b011000110111: '7.0',
-            0b011011000111: '7.0 (front)',
-            0b011000111111: '7.1',
-            0b000011111111: '7.1 (wide)',
-            0b011011001111: '7.1 (wide-side)',
-            0b011100110111: 'octagonal',
-            0b01100000000000000000000000000000: 'downmix'
-        }
-        return master_layout.get(channelmask, 'Unknown layout')
+        return CHANNEL_SETUPS.get(channelmask, 'Unknown layout')
 
     def __del__(self):
         self.close()
@@ -989,3 +2687,1071 @@ Returns `OK` (0) on success and `ERROR_NOT_A_WAVE_FILE` (-1) on failure."""
 
 
 open = lambda path, mode = "r", **kwargs: Wave(path, mode=mode, **kwargs)
+
+
+class _BlockFilter:
+    """An IIR filter (e.g. a biquad) that is applied to (frames, channels)
+arrays of samples in chunks of <chunk> frames with matrix products
+instead of a loop over the samples (state space form): the zero
+state response of all chunks is a single product with the Toeplitz
+matrix of the impulse response, only the filter state is carried
+from chunk to chunk. The result is exact, not an approximation."""
+
+    def __init__(self, b, a, channels, chunk = 128):
+        np = _import_numpy()
+        a0 = a[0]
+        a = np.asarray(a, dtype = "f8") / a0
+        b = np.asarray(b, dtype = "f8") / a0
+        order = len(a) - 1
+
+        # transposed direct form II: state' = A state + B x, y = state[0] + b0 x
+        transition = np.zeros((order, order))
+        transition[:, 0] = -a[1:]
+        transition[:-1, 1:] = np.eye(order - 1)
+        input_ = b[1:] - a[1:] * b[0]
+
+        powers = [np.eye(order)]                             # A^0 ... A^chunk
+        for _ in range(chunk):
+            powers.append(powers[-1] @ transition)
+        self.powers = np.array(powers)
+        self.driven = self.powers[:chunk] @ input_             # A^k B, the state k samples after an impulse
+        self.initial = self.powers[:chunk, 0, :]                # C A^k, the output k samples after a state
+        impulse = np.concatenate(([b[0]], self.driven[:chunk - 1, 0]))
+        index = np.arange(chunk)
+        self.toeplitz = np.where(index[:, np.newaxis] >= index, impulse[np.abs(index[:, np.newaxis] - index)], 0.0)
+
+        self.chunk = chunk
+        self.channels = channels
+        self.state = np.zeros((order, channels))
+
+    def _process(self, samples, frames):
+        """Filters whole chunks of <frames> (<= chunk) frames."""
+        np = _import_numpy()
+        chunks = len(samples) // frames
+        # (chunks, frames, channels) -> (frames, chunks * channels), so the zero state response is one product
+        columns = samples.reshape(chunks, frames, self.channels).transpose(1, 0, 2).reshape(frames, -1)
+        output = self.toeplitz[:frames, :frames] @ columns
+        drive = (self.driven[frames - 1::-1].T @ columns).reshape(-1, chunks, self.channels)
+        transition = self.powers[frames]
+        states = np.empty((len(self.state), chunks, self.channels))
+        state = self.state
+        for index in range(chunks):
+            states[:, index] = state
+            state = transition @ state + drive[:, index]
+        self.state = state
+        output += self.initial[:frames] @ states.reshape(len(state), -1)
+        output = output.reshape(frames, chunks, self.channels)
+        return output.transpose(1, 0, 2).reshape(-1, self.channels)
+
+    def __call__(self, samples):
+        np = _import_numpy()
+        whole = len(samples) // self.chunk * self.chunk
+        parts = []
+        if whole:
+            parts.append(self._process(samples[:whole], self.chunk))
+        if whole < len(samples):
+            parts.append(self._process(samples[whole:], len(samples) - whole))
+        return np.concatenate(parts) if len(parts) != 1 else parts[0]
+
+
+# _k_weighting(frequency: int) -> list
+#     Returns the (b, a) coefficients of the two biquads of the K-weighting filter of ITU-R BS.1770-4 (the high
+#     shelf "pre-filter" and the RLB high pass) for the sample rate <frequency>. At 48 kHz these are the
+#     coefficients given in the recommendation, other rates use the same analog prototype.
+#     The biquads are kept separate, as the poles of the high pass are very close to 1, which makes a combined
+#     4th order filter numerically much less accurate.
+def _k_weighting(frequency):
+    K = math.tan(math.pi * 1681.974450955533 / frequency)
+    Q = 0.7071752369554196
+    Vh = 10 ** (3.999843853973347 / 20)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1 + K / Q + K * K
+    shelf_b = [(Vh + Vb * K / Q + K * K) / a0, 2 * (K * K - Vh) / a0, (Vh - Vb * K / Q + K * K) / a0]
+    shelf_a = [1, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0]
+
+    K = math.tan(math.pi * 38.13547087602444 / frequency)
+    Q = 0.5003270373238773
+    a0 = 1 + K / Q + K * K
+    highpass_b = [1, -2, 1]
+    highpass_a = [1, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0]
+    return [(shelf_b, shelf_a), (highpass_b, highpass_a)]
+
+
+class LoudnessMeter:
+    """Measures loudness according to ITU-R BS.1770-4 / EBU R 128
+(see Wave.loudness()). Samples are added in blocks of any size as
+(frames, channels) float arrays relative to full scale; only the
+filter states and one mean square per channel and 100 ms are kept.
+The <channel_mask> (or DEFAULT_CHANNEL_MASKS, if it is 0)
+determines the channel weights: surround channels count 1.41,
+LFE channels are ignored."""
+
+    TRUE_PEAK_TAPS = 12     # per phase
+
+    def __init__(self, channels, frequency, channel_mask = 0):
+        np = _import_numpy()
+        self.channels = channels
+        self.frequency = frequency
+        channel_mask = channel_mask or DEFAULT_CHANNEL_MASKS.get(channels, 0)
+        weights = []
+        for channel in range(channels):
+            # the n-th set bit of the mask belongs to the n-th channel
+            bit = 0
+            mask = channel_mask
+            for _ in range(channel + 1):
+                bit = mask & -mask
+                mask &= mask - 1
+            weights.append(0.0 if bit in (0x8, 0x1000000) else 1.41 if bit in (0x10, 0x20, 0x200, 0x400) else 1.0)
+        self.weights = np.array(weights)
+
+        self.filters = [_BlockFilter(b, a, channels) for b, a in _k_weighting(frequency)]
+        self.subblock = max(1, round(frequency / 10))        # 100 ms
+        self.energies = []                                    # sums of squares per sub-block and channel
+        self._remainder = np.zeros((0, channels))
+
+        # polyphase FIR for the true peak: a windowed sinc at the oversampled rate, one phase per output sample
+        self.oversampling = 4 if frequency < 96000 else 2 if frequency < 192000 else 1
+        taps = self.TRUE_PEAK_TAPS * self.oversampling
+        n = np.arange(taps) - (taps - 1) / 2
+        prototype = np.sinc(n / self.oversampling) * np.kaiser(taps, 5.0)
+        self.phases = prototype.reshape(self.TRUE_PEAK_TAPS, self.oversampling)[::-1]
+        self._history = np.zeros((self.TRUE_PEAK_TAPS - 1, channels))
+        self.true_peak = 0.0
+
+    def add(self, samples):
+        """Adds the (frames, channels) array <samples>."""
+        np = _import_numpy()
+        samples = np.asarray(samples, dtype = "f8").reshape(-1, self.channels)
+        if not len(samples):
+            return
+
+        extended = np.concatenate((self._history, samples))
+        windows = np.lib.stride_tricks.sliding_window_view(extended, self.TRUE_PEAK_TAPS, axis = 0)
+        oversampled = np.einsum("fct,tp->fcp", windows, self.phases, optimize = True)
+        self.true_peak = max(self.true_peak, float(np.abs(oversampled).max()), float(np.abs(samples).max()))
+        self._history = extended[len(extended) - self.TRUE_PEAK_TAPS + 1:]
+
+        for filter_ in self.filters:
+            samples = filter_(samples)
+        filtered = np.concatenate((self._remainder, samples))
+        complete = len(filtered) // self.subblock * self.subblock
+        if complete:
+            squares = filtered[:complete].reshape(-1, self.subblock, self.channels) ** 2
+            self.energies.append(squares.sum(axis = 1))
+        self._remainder = filtered[complete:]
+
+    def _window_loudness(self, energies, subblocks):
+        """Returns the loudness of all windows of <subblocks> sub-blocks
+(with a step of one sub-block) and their weighted mean squares."""
+        np = _import_numpy()
+        if len(energies) < subblocks:
+            return np.zeros(0), np.zeros(0)
+        cumulative = np.concatenate((np.zeros((1, self.channels)), np.cumsum(energies, axis = 0)))
+        mean_squares = (cumulative[subblocks:] - cumulative[:-subblocks]) / (subblocks * self.subblock) @ self.weights
+        with np.errstate(divide = "ignore"):
+            return -0.691 + 10 * np.log10(mean_squares), mean_squares
+
+    def result(self):
+        """Returns the dict described in Wave.loudness()."""
+        np = _import_numpy()
+        energies = np.concatenate(self.energies) if self.energies else np.zeros((0, self.channels))
+        with np.errstate(divide = "ignore"):
+            gated_loudness = lambda mean_squares: -0.691 + 10 * math.log10(mean_squares.mean()) if len(mean_squares) and mean_squares.mean() > 0 else -math.inf
+
+            momentary, mean_squares = self._window_loudness(energies, 4)
+            mean_squares = mean_squares[momentary > -70]                        # absolute gate
+            mean_squares = mean_squares[-0.691 + 10 * np.log10(mean_squares) > gated_loudness(mean_squares) - 10]  # relative gate
+            integrated = gated_loudness(mean_squares)
+
+            short_term, mean_squares = self._window_loudness(energies, 30)
+            short_term_gated = short_term[short_term > -70]
+            short_term_gated = short_term_gated[short_term_gated > gated_loudness(mean_squares[short_term > -70]) - 20]
+            if len(short_term_gated):
+                low, high = np.percentile(short_term_gated, [10, 95])
+                loudness_range = float(high - low)
+            else:
+                loudness_range = 0.0
+
+            return {
+                "integrated": integrated,
+                "loudness_range": loudness_range,
+                "max_momentary": float(momentary.max()) if len(momentary) else -math.inf,
+                "max_short_term": float(short_term.max()) if len(short_term) else -math.inf,
+                "true_peak": 20 * math.log10(self.true_peak) if self.true_peak else -math.inf,
+            }
+
+
+# write_bext_loudness(path: str, loudness: dict = None) -> dict
+#     Writes the loudness values (see Wave.loudness(), measured if <loudness> is None) into the bext chunk of the
+#     wave file at <path>, which is patched in place. Files without a bext chunk get an empty one (version 2)
+#     appended. Returns the loudness.
+def write_bext_loudness(path, loudness = None):
+    if loudness is None:
+        with Wave(path) as wf:
+            loudness = wf.loudness()
+    with Wave(path) as wf:
+        chunks, rf64 = wf.chunks, wf.rf64
+        riff_size_offset = 20 if rf64 else 4
+
+    # bext stores the values in hundredths as signed 16 bit integers
+    values = b"".join(
+        max(-32768, min(32767, round(loudness[key] * 100) if math.isfinite(loudness[key]) else -32768)).to_bytes(2, "little", signed = True)
+        for key in ("integrated", "loudness_range", "true_peak", "max_momentary", "max_short_term")
+    )
+    with builtin_open(path, "r+b") as f:
+        chunk = chunks.find(fourccBEXT)
+        if chunk is None:
+            f.seek(0, 2)
+            if f.tell() % 2:
+                f.write(b"\x00")
+            body = bytearray(602)
+            body[346:348] = itb(2)
+            body[412:422] = values
+            f.write(fourccBEXT + itb(len(body), 4) + body)
+            riff_size = f.tell() - 8
+            if not rf64 and riff_size > 0xFFFFFFFF:
+                raise PyWaveError("cannot add a bext chunk to '{}', the file would exceed 4 GiB.".format(path))
+            f.seek(riff_size_offset)
+            f.write(itb(riff_size, 8 if rf64 else 4))
+        else:
+            if chunk.size < 422:
+                raise PyWaveError("the bext chunk of '{}' is too small for loudness values.".format(path))
+            f.seek(chunk.offset + 346)
+            if bti(f.read(2)) < 2:
+                f.seek(chunk.offset + 346)
+                f.write(itb(2))
+            f.seek(chunk.offset + 412)
+            f.write(values)
+    return loudness
+
+
+# Quality presets of the Resampler: (taps per phase at the lower of the two rates, pass band edge relative to the
+# Nyquist frequency of the lower rate, beta of the Kaiser window).
+RESAMPLE_QUALITY = {
+    "low":      (16, 0.85, 6.0),
+    "medium":   (32, 0.90, 8.6),
+    "high":     (64, 0.95, 12.0),
+}
+
+
+class Resampler:
+    """A streaming rational sample rate converter (polyphase FIR with a
+Kaiser windowed sinc) for (frames, channels) float arrays.
+Blocks of any size are passed to process(), which returns the
+output that can be computed so far; flush() returns the rest. The
+filter state (the last input frames) is kept between the blocks,
+so the result doesn't depend on the block sizes. The delay of the
+filter is compensated: the output is aligned with the input and has
+round(input frames * to_rate / from_rate) frames in total.
+<quality> is one of the keys of RESAMPLE_QUALITY."""
+
+    def __init__(self, from_rate, to_rate, channels, quality = "medium"):
+        np = _import_numpy()
+        assert quality in RESAMPLE_QUALITY, "quality has to be one of {}".format(", ".join(RESAMPLE_QUALITY))
+        divisor = math.gcd(from_rate, to_rate)
+        self.up, self.down = to_rate // divisor, from_rate // divisor
+        self.channels = channels
+        self.input_frames = 0
+        self.output_frames = 0
+
+        taps, passband, beta = RESAMPLE_QUALITY[quality]
+        # the filter runs at the upsampled rate, its cutoff is at the lower of the two Nyquist frequencies
+        taps = -(-taps * max(self.up, self.down) // self.up)
+        length = taps * self.up
+        self.delay = length // 2
+        cutoff = passband / max(self.up, self.down)     # relative to the Nyquist frequency of the upsampled rate
+        n = np.arange(length) - self.delay
+        prototype = np.sinc(cutoff * n) * np.kaiser(length, beta)
+        prototype *= self.up / prototype.sum()          # unity gain at DC
+        # phases[p, i] is the coefficient of the i-th frame of a window of <taps> frames (oldest first) for phase p
+        self.phases = prototype.reshape(taps, self.up)[::-1].T.copy()
+        self.taps = taps
+
+        # the input frames that are still needed, starting with <taps - 1> frames of silence in front of the input
+        self._buffer = np.zeros((taps - 1, channels))
+        self._buffer_start = -(taps - 1)
+
+    def _compute(self, end):
+        """Returns the output frames up to (not including) <end>."""
+        np = _import_numpy()
+        start = self.output_frames
+        out = np.empty((max(0, end - start), self.channels))
+        windows = np.lib.stride_tricks.sliding_window_view(self._buffer, self.taps, axis = 0)
+        # the outputs with the same phase are <up> frames apart, their windows are <down> input frames apart
+        for offset in range(min(self.up, len(out))):
+            position = (start + offset) * self.down + self.delay
+            first = position // self.up - self.taps + 1 - self._buffer_start
+            count = len(range(offset, len(out), self.up))
+            out[offset::self.up] = windows[first:first + (count - 1) * self.down + 1:self.down] @ self.phases[position % self.up]
+        self.output_frames = max(start, end)
+
+        # drop the frames that the next output doesn't need anymore
+        needed = (self.output_frames * self.down + self.delay) // self.up - self.taps + 1 - self._buffer_start
+        if needed > 0:
+            self._buffer = self._buffer[needed:]
+            self._buffer_start += needed
+        return out
+
+    def process(self, frames):
+        """Adds the (frames, channels) array <frames> and returns the
+output frames that can be computed with it."""
+        np = _import_numpy()
+        frames = np.asarray(frames, dtype = "f8").reshape(-1, self.channels)
+        if self.up == self.down:
+            self.input_frames += len(frames)
+            self.output_frames += len(frames)
+            return frames
+        self._buffer = np.concatenate((self._buffer, frames))
+        self.input_frames += len(frames)
+        # output m needs the input frames up to (m * down + delay) // up
+        available = (self.input_frames * self.up - self.delay - 1) // self.down + 1
+        return self._compute(min(available, self.input_frames * self.up // self.down))
+
+    def flush(self):
+        """Returns the remaining output frames (the input is padded with
+silence to compute them)."""
+        np = _import_numpy()
+        total = round(self.input_frames * self.up / self.down)
+        if self.up == self.down or self.output_frames >= total:
+            return np.zeros((0, self.channels))
+        self._buffer = np.concatenate((self._buffer, np.zeros((self.taps, self.channels))))
+        return self._compute(total)
+
+
+# resample(source, destination, frequency: int = 48000, quality: str = "medium", block_frames: int = 65536, **kwargs) -> dict
+#     Converts the wave file <source> (a path or a Wave opened for reading) to the sample rate <frequency> and writes it
+#     to <destination> (a path, a file object or a Wave opened for writing), block by block with a Resampler.
+#     The destination gets the channels, format and bits per sample of the source, unless they are given in <kwargs>
+#     (which are passed to the writer). Returns a dict with the number of 'frames' read and written, the 'seconds' of
+#     audio, the 'elapsed' time and the 'realtime_factor' (seconds of audio per second). Requires NumPy.
+def resample(source, destination, frequency = 48000, quality = "medium", block_frames = 65536, **kwargs):
+    started = time.perf_counter()
+    reader = source if isinstance(source, Wave) else Wave(source)
+    try:
+        if isinstance(destination, Wave):
+            writer = destination
+        else:
+            options = {"channels": reader.channels, "format": reader._get_sample_format(), "bits_per_sample": reader.bits_per_sample}
+            if options["format"] in (WAVE_FORMAT_ADPCM, WAVE_FORMAT_DVI_ADPCM):
+                options["format"], options["bits_per_sample"] = WAVE_FORMAT_DVI_ADPCM, 4
+            options.update(kwargs)
+            options["frequency"] = frequency
+            writer = Wave(destination, mode = "w", **options)
+        try:
+            assert writer.frequency == frequency, "the destination has to be opened with frequency = {}".format(frequency)
+            resampler = Resampler(reader.frequency, frequency, reader.channels, quality)
+            for block in reader.blocks(block_frames, dtype = "float64"):
+                writer.write_frames(resampler.process(block))
+            writer.write_frames(resampler.flush())
+        finally:
+            if writer is not destination:
+                writer.close()
+    finally:
+        if reader is not source:
+            reader.close()
+
+    elapsed = time.perf_counter() - started
+    seconds = resampler.input_frames / reader.frequency
+    return {
+        "frames": [resampler.input_frames, resampler.output_frames],
+        "seconds": seconds,
+        "elapsed": elapsed,
+        "realtime_factor": seconds / elapsed if elapsed else math.inf,
+    }
+
+
+# _copy_range(source, source_offset: int, destination, destination_offset: int, size: int) -> int
+#     Copies <size> bytes from the file object <source> at <source_offset> to the file object <destination> at
+#     <destination_offset> and returns the number of bytes copied (less if <source> ends early). Uses the kernel
+#     (os.copy_file_range() or os.sendfile()) if both have a file descriptor, otherwise reads and writes blocks of 1 MiB.
+#     The file positions of both file objects are undefined afterwards, <destination> has to be flushed before.
+def _copy_range(source, source_offset, destination, destination_offset, size):
+    copied = 0
+    try:
+        source_fileno, destination_fileno = source.fileno(), destination.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        source_fileno = destination_fileno = None
+
+    if source_fileno is not None:
+        try:
+            if hasattr(os, "copy_file_range"):
+                while copied < size:
+                    count = os.copy_file_range(source_fileno, destination_fileno, size - copied, source_offset + copied, destination_offset + copied)
+                    if count == 0:
+                        return copied
+                    copied += count
+                return copied
+        except OSError:
+            pass            # e.g. not supported by the file system, try the next option with what is left
+        try:
+            if hasattr(os, "sendfile"):
+                os.lseek(destination_fileno, destination_offset + copied, os.SEEK_SET)
+                while copied < size:
+                    count = os.sendfile(destination_fileno, source_fileno, source_offset + copied, size - copied)
+                    if count == 0:
+                        return copied
+                    copied += count
+                return copied
+        except OSError:
+            pass
+
+    while copied < size:
+        source.seek(source_offset + copied)
+        data = source.read(min(size - copied, 1 << 20))
+        if not data:
+            break
+        destination.seek(destination_offset + copied)
+        destination.write(data)
+        copied += len(data)
+    return copied
+
+
+# convert(source, destination, layout = None, normalize: bool = False, quality: str = "medium", block_frames: int = 65536, **kwargs) -> dict
+#     Converts the wave file <source> (a path or a Wave opened for reading) and writes it to <destination> (a path, a file
+#     object or a Wave opened for writing), streaming it in blocks of <block_frames> frames. The destination gets the
+#     properties of the source, unless they are given in <kwargs> (which are passed to the writer), so the bit depth, the
+#     format (PCM, float, A-law, µ-law, IMA ADPCM), the sample rate (see Resampler, <quality>) and the container (<rf64>) can
+#     be changed. If <layout> is given, the channels are remixed to it (see get_remix_matrix(), <normalize>) and the channel
+#     mask of the layout is written. If the samples don't have to be converted, the data is copied as it is, by the kernel
+#     where possible. Returns a dict with the number of 'frames' read and written, the 'seconds' of audio, the 'elapsed'
+#     time, the 'realtime_factor' (seconds of audio per second) and whether the data was 'copied'.
+#     Requires NumPy unless the data is copied.
+def convert(source, destination, layout = None, normalize = False, quality = "medium", block_frames = 65536, **kwargs):
+    started = time.perf_counter()
+    reader = source if isinstance(source, Wave) else Wave(source)
+    try:
+        sample_format = reader._get_sample_format()
+        if isinstance(destination, Wave):
+            writer = destination
+        else:
+            options = {"channels": reader.channels, "frequency": reader.frequency, "format": sample_format, "bits_per_sample": reader.bits_per_sample}
+            if sample_format == WAVE_FORMAT_ADPCM:
+                options["format"], options["bits_per_sample"] = WAVE_FORMAT_DVI_ADPCM, 4    # Microsoft ADPCM can't be written
+            # compressed files can't have a channel mask, their speakers are the defaults of their channel count
+            keep_mask = kwargs.get("format", options["format"]) in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT)
+            if reader.format == WAVE_FORMAT_EXTENSIBLE and keep_mask:
+                options["channel_mask"] = reader.channel_mask
+            if "format" in kwargs and "bits_per_sample" not in kwargs:
+                del options["bits_per_sample"]      # the writer picks the default of the new format
+            options.update(kwargs)
+            if layout is not None:
+                channel_mask = get_remix_matrix(getattr(reader, "channel_mask", 0), reader.channels, layout)[1]
+                options["channels"] = bin(channel_mask).count("1")
+                if keep_mask:
+                    options["channel_mask"] = channel_mask
+            writer = Wave(destination, mode = "w", **options)
+        try:
+            if not writer._prepared_for_writing:
+                writer._prepare_for_writing()
+                writer._prepared_for_writing = True
+            copy = (layout is None and writer.format == sample_format and writer.channels == reader.channels
+                    and writer.frequency == reader.frequency and writer.bits_per_sample == reader.bits_per_sample
+                    and writer.block_align == reader.block_align)
+            if copy:
+                first_frame = reader.data_position // reader.block_align * (reader.samples_per_block or 1)
+                copied = writer._copy_data_from(reader)
+                padded = copied // reader.block_align * (reader.samples_per_block or 1)
+                frames = min(padded, max(0, reader.samples - first_frame))
+                writer.samples -= padded - frames       # the fact chunk gets the real number of samples of ADPCM data
+                input_frames = output_frames = frames
+            else:
+                matrix = None
+                if layout is not None:
+                    matrix = get_remix_matrix(getattr(reader, "channel_mask", 0), reader.channels, layout, normalize)[0]
+                resampler = Resampler(reader.frequency, writer.frequency, writer.channels, quality)
+                for block in reader.blocks(block_frames, dtype = "float64"):
+                    if matrix is not None:
+                        block = block @ matrix
+                    writer.write_frames(resampler.process(block))
+                writer.write_frames(resampler.flush())
+                input_frames, output_frames = resampler.input_frames, resampler.output_frames
+        finally:
+            if writer is not destination:
+                writer.close()
+    finally:
+        if reader is not source:
+            reader.close()
+
+    elapsed = time.perf_counter() - started
+    seconds = input_frames / reader.frequency
+    return {
+        "frames": [input_frames, output_frames],
+        "seconds": seconds,
+        "elapsed": elapsed,
+        "realtime_factor": seconds / elapsed if elapsed else math.inf,
+        "copied": copy,
+    }
+
+
+class WaveformPyramid:
+    """Per-channel minimum and maximum values of the samples at several
+resolutions, for drawing waveforms at any zoom level.
+Level 0 has one value per <base_block> frames, every following level
+halves the resolution, up to a single value for the whole file.
+<levels> is a list of (minimum, maximum) tuples of float32 arrays of
+shape (values, channels), relative to full scale."""
+
+    SIDECAR_SUFFIX = ".pyramid"
+
+    # Sidecar file layout: magic, version, source size, source mtime (ns), channels, frames, base block, number of levels,
+    # followed by the number of values, the minimum and the maximum array of each level.
+    _MAGIC = b"PWPK"
+    _HEADER = struct.Struct("<4sIQQIQII")
+
+    def __init__(self, channels, frames, base_block, levels):
+        self.channels = channels
+        self.frames = frames
+        self.base_block = base_block
+        self.levels = levels
+
+    @classmethod
+    def from_wave(cls, wave, base_block = 256, blocks_per_read = 256):
+        """Builds the pyramid of <wave> in a single pass over its data,
+without changing its current position."""
+        np = _import_numpy()
+        frames = wave._frame_count()
+        read_frames = base_block * blocks_per_read
+        minimum, maximum = [], []
+        for start in range(0, frames, read_frames):
+            size = min(read_frames, frames - start)
+            samples = wave.read_frames_at(start, size, "float32")
+            if not len(samples):
+                break
+            # pad the last block with its own last frame, so it doesn't change its minimum / maximum
+            blocks = -(-len(samples) // base_block)
+            if blocks * base_block > len(samples):
+                samples = np.concatenate((samples, np.repeat(samples[-1:], blocks * base_block - len(samples), axis = 0)))
+            samples = samples.reshape(blocks, base_block, wave.channels)
+            minimum.append(samples.min(axis = 1))
+            maximum.append(samples.max(axis = 1))
+
+        empty = np.zeros((0, wave.channels), dtype = "float32")
+        levels = [(np.concatenate(minimum) if minimum else empty, np.concatenate(maximum) if maximum else empty)]
+        while len(levels[-1][0]) > 1:
+            levels.append(tuple(cls._halve(values, reduce) for values, reduce in zip(levels[-1], (np.minimum, np.maximum))))
+        return cls(wave.channels, frames, base_block, levels)
+
+    @staticmethod
+    def _halve(values, reduce):
+        """Combines pairs of values (an odd last value stays on its own)."""
+        pairs = len(values) // 2
+        halved = reduce(values[0:pairs * 2:2], values[1:pairs * 2:2])
+        if len(values) % 2:
+            halved = numpy.concatenate((halved, values[-1:]))
+        return halved
+
+    def query(self, start_frame, end_frame, columns):
+        """Returns the (minimum, maximum) arrays of shape (columns, channels)
+for the frames from <start_frame> to <end_frame> divided into
+<columns> equal parts (e.g. the pixel columns of a display).
+Uses the coarsest level that still has at least one value per
+column, so it is fast at every zoom level."""
+        np = _import_numpy()
+        start_frame = max(0, min(start_frame, self.frames))
+        end_frame = max(start_frame, min(end_frame, self.frames))
+        assert columns > 0, "columns has to be positive"
+        frames_per_column = (end_frame - start_frame) / columns
+
+        level = 0
+        while level + 1 < len(self.levels) and self.base_block << (level + 1) <= frames_per_column:
+            level += 1
+        block = self.base_block << level
+        minimum, maximum = self.levels[level]
+        if not len(minimum):
+            return np.zeros((columns, self.channels), dtype = "float32"), np.zeros((columns, self.channels), dtype = "float32")
+
+        # the first value of every column; columns that are narrower than a value use the value they're in
+        first = min(start_frame // block, len(minimum) - 1)
+        last = max(first + 1, min(-(-end_frame // block), len(minimum)))
+        edges = np.floor(start_frame + np.arange(columns) * frames_per_column).astype("i8") // block - first
+        edges = np.clip(edges, 0, last - first - 1)
+        return np.minimum.reduceat(minimum[first:last], edges, axis = 0), np.maximum.reduceat(maximum[first:last], edges, axis = 0)
+
+    def save(self, path, source):
+        """Writes the pyramid to the sidecar file <path>. The size and
+modification time of the wave file <source> are stored with it,
+so load() can tell when it is outdated."""
+        stat = os.stat(source)
+        with builtin_open(path, "wb") as f:
+            f.write(self._HEADER.pack(self._MAGIC, 1, stat.st_size, stat.st_mtime_ns, self.channels, self.frames, self.base_block, len(self.levels)))
+            for minimum, maximum in self.levels:
+                f.write(itb(len(minimum), 8))
+                f.write(numpy.ascontiguousarray(minimum, dtype = "<f4").tobytes())
+                f.write(numpy.ascontiguousarray(maximum, dtype = "<f4").tobytes())
+
+    @classmethod
+    def load(cls, path, source):
+        """Returns the pyramid from the sidecar file <path>, or None if it
+doesn't exist, is damaged, or doesn't match the size and
+modification time of the wave file <source>."""
+        np = _import_numpy()
+        try:
+            stat = os.stat(source)
+            with builtin_open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < cls._HEADER.size:
+            return None
+        magic, version, size, mtime_ns, channels, frames, base_block, level_count = cls._HEADER.unpack_from(data)
+        if magic != cls._MAGIC or version != 1 or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            return None
+
+        levels = []
+        offset = cls._HEADER.size
+        for _ in range(level_count):
+            count = bti(data[offset:offset + 8])
+            offset += 8
+            if offset + count * channels * 8 > len(data):
+                return None
+            minimum = np.frombuffer(data, dtype = "<f4", count = count * channels, offset = offset).reshape(count, channels)
+            offset += count * channels * 4
+            maximum = np.frombuffer(data, dtype = "<f4", count = count * channels, offset = offset).reshape(count, channels)
+            offset += count * channels * 4
+            levels.append((minimum, maximum))
+        return cls(channels, frames, base_block, levels)
+
+
+# The executor that AsyncWave uses for its blocking file I/O, unless another one is given.
+# It is created on first use, and its size limits how many files are accessed at the same time.
+ASYNC_MAX_WORKERS = 8
+_async_executor = None
+
+def _get_async_executor():
+    global _async_executor
+    if _async_executor is None:
+        _async_executor = concurrent.futures.ThreadPoolExecutor(max_workers = ASYNC_MAX_WORKERS, thread_name_prefix = "PyWave")
+    return _async_executor
+
+
+class AsyncWave:
+    """asyncio interface to a Wave. The blocking calls are run in
+<executor> (by default a shared thread pool with ASYNC_MAX_WORKERS
+threads), so they don't stall the event loop. The calls for one
+file are run one after another.
+Attributes that aren't methods (channels, frequency, ...) are
+taken from the wrapped <wave>. Its methods are only available as
+the coroutines below, so none of them can block the event loop.
+Use open_async() to open a file."""
+
+    # The number of frames per block when iterating with 'async for'
+    BLOCK_FRAMES = 65536
+
+    def __init__(self, wave, executor = None):
+        import asyncio      # only imported when needed, it takes longer to import than the rest of PyWave (see main())
+        self.wave = wave
+        self._executor = executor or _get_async_executor()
+        self._lock = asyncio.Lock()
+
+    async def _run(self, function, *args, **kwargs):
+        import asyncio
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def read(self, max_bytes = None):
+        """See Wave.read()"""
+        return await self._run(self.wave.read, max_bytes)
+
+    async def read_frames(self, number_of_frames = None, dtype = None):
+        """See Wave.read_frames()"""
+        return await self._run(self.wave.read_frames, number_of_frames, dtype)
+
+    async def read_at(self, start_frame, number_of_frames = None):
+        """See Wave.read_at()"""
+        return await self._run(self.wave.read_at, start_frame, number_of_frames)
+
+    async def read_time(self, start_seconds, duration = None):
+        """See Wave.read_time()"""
+        return await self._run(self.wave.read_time, start_seconds, duration)
+
+    async def read_frames_at(self, start_frame, number_of_frames = None, dtype = None):
+        """See Wave.read_frames_at()"""
+        return await self._run(self.wave.read_frames_at, start_frame, number_of_frames, dtype)
+
+    async def read_samples(self, number_of_samples):
+        """See Wave.read_samples()"""
+        return await self._run(self.wave.read_samples, number_of_samples)
+
+    async def readinto(self, buffer):
+        """See Wave.readinto()"""
+        return await self._run(self.wave.readinto, buffer)
+
+    async def read_frames_into(self, buffer, number_of_frames):
+        """See Wave.read_frames_into()"""
+        return await self._run(self.wave.read_frames_into, buffer, number_of_frames)
+
+    async def read_channels(self, channels, number_of_frames = None, dtype = None):
+        """See Wave.read_channels()"""
+        return await self._run(self.wave.read_channels, channels, number_of_frames, dtype)
+
+    async def read_remixed(self, layout, number_of_frames = None, dtype = "float64", normalize = False):
+        """See Wave.read_remixed()"""
+        return await self._run(self.wave.read_remixed, layout, number_of_frames, dtype, normalize)
+
+    async def stats(self, workers = None, block_frames = 65536):
+        """See Wave.stats()"""
+        return await self._run(self.wave.stats, workers, block_frames)
+
+    async def loudness(self, block_frames = 65536):
+        """See Wave.loudness()"""
+        return await self._run(self.wave.loudness, block_frames)
+
+    async def get_waveform_pyramid(self, base_block = 256, cache = True):
+        """See Wave.get_waveform_pyramid()"""
+        return await self._run(self.wave.get_waveform_pyramid, base_block, cache)
+
+    async def write(self, data):
+        """See Wave.write()"""
+        return await self._run(self.wave.write, data)
+
+    async def write_frames(self, frames):
+        """See Wave.write_frames()"""
+        return await self._run(self.wave.write_frames, frames)
+
+    async def seek(self, offset, whence = 0):
+        """See Wave.seek()"""
+        return await self._run(self.wave.seek, offset, whence)
+
+    async def flush(self):
+        """See Wave.flush()"""
+        return await self._run(self.wave.flush)
+
+    async def close(self):
+        """See Wave.close()"""
+        return await self._run(self.wave.close)
+
+    async def blocks(self, frames_per_block, overlap = 0, dtype = None):
+        """Asynchronous version of Wave.blocks() (without buffer reuse,
+as the blocks are handed over from another thread)."""
+        iterator = self.wave.blocks(frames_per_block, overlap, dtype)
+        end = object()
+        while True:
+            block = await self._run(next, iterator, end)
+            if block is end:
+                return
+            yield block
+
+    def tell(self):
+        return self.wave.tell()
+
+    def __getattr__(self, name):
+        value = getattr(self.wave, name)
+        if isinstance(value, types.MethodType):
+            # a method that isn't wrapped above would run in the event loop
+            raise AttributeError("'AsyncWave' has no coroutine '{}'".format(name))
+        return value
+
+    def __aiter__(self):
+        return self.blocks(self.BLOCK_FRAMES)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def open_async(path, mode = "r", executor = None, **kwargs):
+    """Opens a wave file without blocking the event loop and returns
+an AsyncWave. The arguments are the same as for open(), <executor>
+is passed on to AsyncWave."""
+    import asyncio
+    executor = executor or _get_async_executor()
+    wave = await asyncio.get_running_loop().run_in_executor(executor, functools.partial(Wave, path, mode = mode, **kwargs))
+    return AsyncWave(wave, executor)
+
+
+# The metadata entries that are included in the records of probe() / scan() by default.
+SCAN_METADATA = ("bext", "INFO", "cart")
+
+# _jsonable(value) -> value
+#     Returns <value> with all bytes converted to hex strings (and infinite or NaN floats to None), so records can be written as
+#     (strict) JSON.
+def _jsonable(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def probe(path, metadata = SCAN_METADATA):
+    """Returns a record (dict) with the format of the wave file at
+<path> and the <metadata> entries it contains. Only the header and
+the requested metadata chunks are read.
+Errors don't raise, they are stored in the 'error' field."""
+    record = {"path": os.fspath(path)}
+    try:
+        stat = os.stat(path)
+        record["size"] = stat.st_size
+        record["mtime"] = stat.st_mtime
+        with Wave(path, lazy_metadata = True) as wf:
+            format_name = wf.format_name
+            record["format"] = wf.format
+            record["format_name"] = format_name[0] if isinstance(format_name, tuple) else format_name
+            record["subformat"] = wf.subformat
+            record["channels"] = wf.channels
+            record["channel_mask"] = getattr(wf, "channel_mask", 0)
+            record["frequency"] = wf.frequency
+            record["bits_per_sample"] = wf.bits_per_sample
+            record["valid_bits_per_sample"] = wf.valid_bits_per_sample
+            record["block_align"] = wf.block_align
+            record["frames"] = wf.samples
+            record["duration"] = wf.samples / wf.frequency if wf.frequency else 0.0
+            record["rf64"] = wf.rf64
+            record["metadata"] = {key: _jsonable(wf.metadata[key]) for key in metadata if key in wf.metadata}
+            record["messages"] = wf.messages
+        record["error"] = None
+    except Exception as exception:
+        record["error"] = "{}: {}".format(type(exception).__name__, exception)
+    return record
+
+
+# _probe_batch(batch: list, metadata: tuple) -> list
+#     Probes a batch of (path, previous) tuples in a worker. Files whose (size, mtime) equals <previous> are unchanged and skipped.
+def _probe_batch(batch, metadata):
+    records = []
+    for path, previous in batch:
+        if previous is not None:
+            try:
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime) == tuple(previous):
+                    continue
+            except OSError:
+                pass
+        records.append(probe(path, metadata))
+    return records
+
+
+def scan(paths, workers = None, metadata = SCAN_METADATA, processes = False, batch_size = 64, skip = None):
+    """Probes all the wave files in the iterable <paths> (see probe())
+with a pool of <workers> threads (or processes, if <processes> is
+True) and yields the records in the order of <paths>.
+Only a bounded number of batches of <batch_size> paths is in flight
+at any time, so <paths> can be a generator over millions of files.
+<skip> can map paths to the (size, mtime) of a previous scan, files
+that haven't changed since are skipped."""
+    skip = skip or {}
+
+    def batches():
+        batch = []
+        for path in paths:
+            batch.append((os.fspath(path), skip.get(os.fspath(path))))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    if workers == 1:
+        for batch in batches():
+            yield from _probe_batch(batch, metadata)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    executor_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    with executor_class(max_workers = workers) as executor:
+        window = workers * 2
+        pending = collections.deque()
+        for batch in batches():
+            pending.append(executor.submit(_probe_batch, batch, metadata))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def scan_to_jsonl(paths, output, **kwargs):
+    """Scans <paths> (see scan()) and writes one JSON record per line
+to <output>, a path or a text file object. Returns the number of
+records written."""
+    import json
+    count = 0
+    file_ = builtin_open(output, "w", encoding = "utf-8") if isinstance(output, (str, bytes, os.PathLike)) else output
+    try:
+        for record in scan(paths, **kwargs):
+            file_.write(json.dumps(record) + "\n")
+            count += 1
+    finally:
+        if file_ is not output:
+            file_.close()
+    return count
+
+
+def scan_to_sqlite(paths, database, table = "waves", **kwargs):
+    """Scans <paths> (see scan()) into the SQLite <table> of <database>
+(a path or an sqlite3 connection). Files that are already in the
+table with the same size and mtime are skipped, so repeated scans
+only probe new and changed files. Returns the number of records
+written."""
+    import json
+    import sqlite3      # like asyncio and argparse, only imported when needed (see main())
+    table = '"{}"'.format(table.replace('"', '""'))      # quoted, so any name is taken literally and can't inject SQL
+    connection = database if isinstance(database, sqlite3.Connection) else sqlite3.connect(database)
+    try:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS {} (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, format INTEGER, channels INTEGER, "
+            "frequency INTEGER, bits_per_sample INTEGER, frames INTEGER, duration REAL, error TEXT, record TEXT)".format(table))
+        kwargs.setdefault("skip", {path: (size, mtime) for path, size, mtime in connection.execute(
+            "SELECT path, size, mtime FROM {} WHERE error IS NULL".format(table))})
+
+        count = 0
+        rows = []
+        for record in scan(paths, **kwargs):
+            rows.append(tuple(record.get(key) for key in ("path", "size", "mtime", "format", "channels", "frequency", "bits_per_sample", "frames", "duration", "error")) + (json.dumps(record),))
+            if len(rows) >= 1000:
+                count += len(rows)
+                connection.executemany("INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(table), rows)
+                rows = []
+        count += len(rows)
+        connection.executemany("INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(table), rows)
+        connection.commit()
+    finally:
+        if connection is not database:
+            connection.close()
+    return count
+
+
+CLI_FORMATS = {
+    "pcm":      WAVE_FORMAT_PCM,
+    "float":    WAVE_FORMAT_IEEE_FLOAT,
+    "alaw":     WAVE_FORMAT_ALAW,
+    "mulaw":    WAVE_FORMAT_MULAW,
+    "ima":      WAVE_FORMAT_DVI_ADPCM,
+}
+
+# _find_wave_files(paths: list, extensions: tuple) -> generator
+#     Yields the files in <paths>. Directories are walked recursively (yielding the files with one of <extensions>) and "-"
+#     stands for the paths read from stdin, one per line. Nothing is collected up front, so it can be used on millions of files.
+def _find_wave_files(paths, extensions):
+    import sys
+    for path in paths:
+        if path == "-":
+            for line in sys.stdin:
+                line = line.rstrip("\r\n")
+                if line:
+                    yield line
+        elif os.path.isdir(path):
+            stack = [path]
+            while stack:
+                directory = stack.pop()
+                try:
+                    entries = sorted(os.scandir(directory), key = lambda entry: entry.name)
+                except OSError:
+                    continue
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks = False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(extensions):
+                        yield entry.path
+        else:
+            yield path
+
+
+def main(argv = None):
+    """Returns the exit status of the command line interface
+(python -m PyWave), 0 if all files could be processed, 1 if not.
+The subcommands 'info', 'scan' and 'stats' write one JSON record
+per file and line, 'convert' writes the result of convert()."""
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(prog = "python -m PyWave", description = "Inspect, scan and convert wave files.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    info = commands.add_parser("info", help = "print the format of wave files (header only)")
+    info.add_argument("paths", nargs = "+", help = "wave files, '-' reads the paths from stdin")
+    info.add_argument("--metadata", default = "", help = "comma separated metadata to include, e.g. 'bext,INFO'")
+
+    scan_ = commands.add_parser("scan", help = "probe all the wave files in directories in parallel")
+    scan_.add_argument("paths", nargs = "+", help = "files or directories (searched recursively), '-' reads the paths from stdin")
+    scan_.add_argument("--metadata", default = ",".join(SCAN_METADATA), help = "comma separated metadata to include (default: %(default)s)")
+    scan_.add_argument("--extensions", default = ".wav,.wave,.bwf,.rf64", help = "file extensions to look for in directories (default: %(default)s)")
+    scan_.add_argument("--workers", type = int, default = None, help = "number of threads / processes (default: number of CPUs)")
+    scan_.add_argument("--processes", action = "store_true", help = "use processes instead of threads")
+    scan_.add_argument("--output", default = None, help = "write the JSON lines to this file instead of stdout")
+
+    convert_ = commands.add_parser("convert", help = "convert a wave file")
+    convert_.add_argument("source")
+    convert_.add_argument("destination")
+    convert_.add_argument("--format", choices = sorted(CLI_FORMATS), default = None)
+    convert_.add_argument("--bits", type = int, default = None, help = "bits per sample")
+    convert_.add_argument("--frequency", type = int, default = None, help = "sample rate")
+    convert_.add_argument("--layout", choices = sorted(set(CHANNEL_SETUPS.values())), default = None, help = "remix the channels to this layout")
+    convert_.add_argument("--normalize", action = "store_true", help = "scale the remix so it can't clip")
+    convert_.add_argument("--quality", choices = list(RESAMPLE_QUALITY), default = "medium", help = "resampling quality")
+    convert_.add_argument("--rf64", choices = ("no", "auto", "yes"), default = "auto", help = "write an RF64 file (default: %(default)s)")
+
+    stats_ = commands.add_parser("stats", help = "print the peak, RMS, DC offset and clipping of wave files")
+    stats_.add_argument("paths", nargs = "+", help = "wave files, '-' reads the paths from stdin")
+    stats_.add_argument("--workers", type = int, default = None, help = "number of threads per file (default: number of CPUs)")
+
+    args = parser.parse_args(argv)
+    status = 0
+    output = sys.stdout
+    try:
+        if args.command == "info":
+            metadata = tuple(key for key in args.metadata.split(",") if key)
+            for path in _find_wave_files(args.paths, ()):
+                record = probe(path, metadata)
+                if record["error"] is not None:
+                    status = 1
+                output.write(json.dumps(_jsonable(record)) + "\n")
+
+        elif args.command == "scan":
+            metadata = tuple(key for key in args.metadata.split(",") if key)
+            extensions = tuple(extension.lower() for extension in args.extensions.split(",") if extension)
+            if args.output is not None:
+                output = builtin_open(args.output, "w", encoding = "utf-8")
+            try:
+                for record in scan(_find_wave_files(args.paths, extensions), workers = args.workers, metadata = metadata, processes = args.processes):
+                    if record["error"] is not None:
+                        status = 1
+                    output.write(json.dumps(_jsonable(record)) + "\n")
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+
+        elif args.command == "convert":
+            kwargs = {"rf64": {"no": False, "auto": "auto", "yes": True}[args.rf64]}
+            if args.format is not None:
+                kwargs["format"] = CLI_FORMATS[args.format]
+            if args.bits is not None:
+                kwargs["bits_per_sample"] = args.bits
+            if args.frequency is not None:
+                kwargs["frequency"] = args.frequency
+            try:
+                result = convert(args.source, args.destination, layout = args.layout, normalize = args.normalize, quality = args.quality, **kwargs)
+            except (PyWaveError, OSError, AssertionError) as exception:
+                result = {"error": "{}: {}".format(type(exception).__name__, exception)}
+                status = 1
+            output.write(json.dumps(_jsonable(result)) + "\n")
+
+        elif args.command == "stats":
+            for path in _find_wave_files(args.paths, ()):
+                record = {"path": path}
+                try:
+                    with Wave(path, lazy_metadata = True) as wf:
+                        record.update(wf.stats(workers = args.workers))
+                    record["error"] = None
+                except Exception as exception:
+                    record["error"] = "{}: {}".format(type(exception).__name__, exception)
+                    status = 1
+                output.write(json.dumps(_jsonable(record)) + "\n")
+        output.flush()
+    except BrokenPipeError:
+        # the reader of a pipeline (e.g. head) has stopped, don't complain about the lines that couldn't be written
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+    return status
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Benchmarks for PyWave on a synthetic corpus (see wave_corpus.py).
+
+Measures the open latency, the header scan and metadata parsing time, the
+sequential and random read throughput and the write throughput, and writes
+the results as JSON, so they can be compared across releases:
+
+    python bench_pywave.py --output results.json
+    python bench_pywave.py --compare results.json     # exit status 1 on regressions
+
+Every result has a 'name' (the benchmark), a 'case' (the file or format), the
+'value' in 'unit' (the median of the repeats) and the 'best' of the repeats.
+Units ending in '/s' are better when higher, all others when lower.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import PyWave
+import wave_corpus
+
+
+# the files of the read benchmarks, in the size given by --size
+THROUGHPUT_FORMATS = ("pcm16", "pcm24", "float32", "alaw", "ima_adpcm")
+
+# the formats of the write benchmark: (format, bits per sample)
+WRITE_FORMATS = {
+    "pcm16":        (PyWave.WAVE_FORMAT_PCM, 16),
+    "pcm24":        (PyWave.WAVE_FORMAT_PCM, 24),
+    "float32":      (PyWave.WAVE_FORMAT_IEEE_FLOAT, 32),
+    "alaw":         (PyWave.WAVE_FORMAT_ALAW, 8),
+    "ima_adpcm":    (PyWave.WAVE_FORMAT_DVI_ADPCM, 4),
+}
+
+READ_BLOCK_FRAMES = 65536
+RANDOM_READ_FRAMES = 4096
+RANDOM_READS = 200
+
+# calls per repeat of the benchmarks that take microseconds, so the timer resolution and noise don't dominate
+FAST_CALLS = 20
+
+
+def measure(function, repeats, number = 1):
+    """Returns the times (in seconds) per call of <repeats> runs of
+<number> calls of <function>."""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - started) / number)
+    return times
+
+
+def result(name, case, times, unit, amount = None):
+    """Returns a result record. Without <amount>, the value is the time in
+microseconds, otherwise <amount> per second."""
+    if amount is None:
+        value, best = statistics.median(times) * 1e6, min(times) * 1e6
+    else:
+        value, best = amount / max(statistics.median(times), 1e-9), amount / max(min(times), 1e-9)
+    return {"name": name, "case": case, "value": value, "best": best, "unit": unit, "repeats": len(times)}
+
+
+def bench_open(corpus, repeats):
+    for spec in corpus:
+        if spec["size"] == "small" and spec["channels"] == 2:
+            for lazy in (False, True):
+                times = measure(lambda: PyWave.Wave(spec["path"], lazy_metadata = lazy).close(), repeats, FAST_CALLS)
+                yield result("open_lazy" if lazy else "open", spec["name"], times, "us")
+
+
+def bench_metadata(corpus, repeats):
+    for spec in corpus:
+        if spec["layout"] in ("metadata", "misaligned_list", "trailing") and spec["size"] == "small":
+            def parse():
+                with PyWave.Wave(spec["path"], lazy_metadata = True) as wf:
+                    dict(wf.metadata)
+            yield result("metadata", spec["name"], measure(parse, repeats, FAST_CALLS), "us")
+
+
+def bench_scan(corpus, repeats):
+    paths = [spec["path"] for spec in corpus]
+    yield result("probe", "corpus", measure(lambda: [PyWave.probe(path) for path in paths], repeats), "files/s", len(paths))
+    yield result("scan", "corpus", measure(lambda: list(PyWave.scan(paths)), repeats), "files/s", len(paths))
+
+
+def bench_read(corpus, repeats, size, numpy_available):
+    for spec in corpus:
+        if spec["size"] != size or spec["layout"] != "plain" or spec["channels"] != 2 or spec["format_name"] not in THROUGHPUT_FORMATS:
+            continue
+        path, megabytes = spec["path"], (spec["bytes"] >> 10) / 1024
+
+        def read_bytes():
+            with PyWave.Wave(path) as wf:
+                for _ in wf.blocks(READ_BLOCK_FRAMES, reuse = True):
+                    pass
+        yield result("read", spec["name"], measure(read_bytes, repeats), "MB/s", megabytes)
+
+        if numpy_available:
+            def read_frames():
+                with PyWave.Wave(path) as wf:
+                    for _ in wf.blocks(READ_BLOCK_FRAMES, dtype = "float32"):
+                        pass
+            yield result("read_frames", spec["name"], measure(read_frames, repeats), "frames/s", spec["frames"])
+
+        rng = random.Random(0)
+        starts = [rng.randrange(max(1, spec["frames"] - RANDOM_READ_FRAMES)) for _ in range(RANDOM_READS)]
+        with PyWave.Wave(path) as wf:
+            # read_at() reads bytes, which ADPCM frames don't have
+            if spec["format"] not in (PyWave.WAVE_FORMAT_ADPCM, PyWave.WAVE_FORMAT_DVI_ADPCM):
+                times = measure(lambda: [wf.read_at(start, RANDOM_READ_FRAMES) for start in starts], repeats)
+                yield result("random_read", spec["name"], times, "reads/s", RANDOM_READS)
+            if numpy_available:
+                times = measure(lambda: [wf.read_frames_at(start, RANDOM_READ_FRAMES, "float32") for start in starts], repeats)
+                yield result("random_read_frames", spec["name"], times, "reads/s", RANDOM_READS)
+
+
+def bench_write(directory, repeats, size, numpy_available):
+    if not numpy_available:
+        return
+    import numpy
+    frames = wave_corpus.SIZES[size]
+    samples = numpy.sin(numpy.arange(frames * 2).reshape(-1, 2) * 0.01) * 0.5
+    path = os.path.join(directory, "write.wav")
+    for name, (format_, bits_per_sample) in WRITE_FORMATS.items():
+        def write():
+            with PyWave.Wave(path, mode = "w", channels = 2, frequency = 48000, format = format_, bits_per_sample = bits_per_sample) as wf:
+                for start in range(0, frames, 65536):
+                    wf.write_frames(samples[start:start + 65536])
+        yield result("write_frames", name, measure(write, repeats), "frames/s", frames)
+    os.remove(path)
+
+
+def environment():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    try:
+        import importlib.metadata
+        pywave_version = importlib.metadata.version("PyWave")
+    except Exception:
+        pywave_version = None
+    return {
+        "pywave": pywave_version,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "numpy": numpy_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def run(directory, repeats = 5, size = "large"):
+    """Generates the corpus in <directory> (if it's not there yet) and
+returns the benchmark report (dict)."""
+    specs = wave_corpus.corpus_specs(sizes = ("small",))
+    specs += [wave_corpus.spec(format_name, 2, size) for format_name in THROUGHPUT_FORMATS if size != "small"]
+    manifest = os.path.join(directory, "corpus.json")
+    corpus = None
+    if os.path.exists(manifest):
+        with open(manifest, encoding = "utf-8") as f:
+            corpus = json.load(f)
+        if {spec["name"] for spec in corpus} != {spec["name"] for spec in specs}:
+            corpus = None
+    if corpus is None:
+        corpus = wave_corpus.generate_corpus(directory, specs)
+
+    numpy_available = PyWave._import_numpy(required = False) is not None
+    results = []
+    results += bench_open(corpus, repeats)
+    results += bench_metadata(corpus, repeats)
+    results += bench_scan(corpus, repeats)
+    results += bench_read(corpus, repeats, size, numpy_available)
+    results += bench_write(directory, repeats, size, numpy_available)
+    return {"environment": environment(), "results": results}
+
+
+def compare(report, baseline, threshold):
+    """Returns the results of <report> that are more than <threshold>
+(relative) worse than the same result in <baseline>, as
+(result, baseline value, change) tuples."""
+    previous = {(entry["name"], entry["case"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in report["results"]:
+        old = previous.get((entry["name"], entry["case"]))
+        if old is None or old["unit"] != entry["unit"] or not old["value"]:
+            continue
+        change = entry["value"] / old["value"] - 1
+        if (change < -threshold) if entry["unit"].endswith("/s") else (change > threshold):
+            regressions.append((entry, old["value"], change))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark PyWave on a synthetic corpus.")
+    parser.add_argument("--corpus", default = None, help = "directory of the corpus (generated if needed, default: a temporary directory)")
+    parser.add_argument("--size", default = "large", choices = sorted(wave_corpus.SIZES), help = "size of the throughput files (default: %(default)s)")
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--output", default = None, help = "write the report to this file instead of stdout")
+    parser.add_argument("--compare", default = None, help = "a previous report, regressions are listed on stderr")
+    parser.add_argument("--threshold", type = float, default = 0.1, help = "relative change that counts as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.corpus is None:
+        with tempfile.TemporaryDirectory() as directory:
+            report = run(directory, args.repeats, args.size)
+    else:
+        report = run(args.corpus, args.repeats, args.size)
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent = 1)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w", encoding = "utf-8") as f:
+            json.dump(report, f, indent = 1)
+
+    if args.compare is not None:
+        with open(args.compare, encoding = "utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for entry, old, change in regressions:
+            sys.stderr.write("regression: {} {}: {:.4g} {} (was {:.4g}, {:+.1%})\n".format(entry["name"], entry["case"], entry["value"], entry["unit"], old, change))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
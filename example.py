@@ -34,15 +34,8 @@ print(wf.samples, "total samples")
 print(wf.data_length, "bytes of data")
 print(wf.block_align, "bytes per block (1 sample for each channel)")
 
-wf_copy = PyWave.open(PATH_COPY, 
-                      mode = "w",
-                      channels = wf.channels,
-                      frequency = wf.frequency,
-                      bits_per_sample = wf.bits_per_sample,
-                      format = wf.format)
-wf_copy.write(wf.read())
 wf.close()
-wf_copy.close()
+PyWave.convert(PATH, PATH_COPY)
 
 print("\nA copy of the wav-file was created as: '{0}'".format(PATH_COPY))
 
@@ -1,3 +1,6 @@
+import io
+import math
+
 import PyWave
 import pytest
 
@@ -62,3 +65,774 @@ def test_static_methods(wf):
 def test_delete():
     with pytest.raises(FileNotFoundError):
         wavefile = PyWave.open("xxxx.yyy")
+
+
+def test_deferred_header(tmp_path):
+    path = str(tmp_path / "deferred.wav")
+    wf = PyWave.open(path, mode = "w", channels = 1, frequency = 8000, bits_per_sample = 16, defer_header = True, checkpoint_bytes = 8)
+    wf.write(b"\x01\x00" * 3)
+    wf.write(b"\x02\x00" * 3)
+
+    # the checkpoint has been passed, so the file is readable up to here
+    with PyWave.open(path) as wf_checkpoint:
+        assert wf_checkpoint.data_length == 12
+
+    wf.write(b"\x03\x00")
+    wf.close()
+
+    with PyWave.open(path) as wf:
+        assert wf.data_length == 14
+        assert wf.read() == b"\x01\x00" * 3 + b"\x02\x00" * 3 + b"\x03\x00"
+
+
+def test_close_without_writing(tmp_path):
+    path = tmp_path / "empty.wav"
+    PyWave.open(str(path), mode = "w", channels = 1, frequency = 8000, bits_per_sample = 16).close()
+    assert path.stat().st_size == 0
+
+    with PyWave.open(str(path), mode = "w", channels = 1, frequency = 8000, bits_per_sample = 16) as wf:
+        wf.write(b"")
+    with PyWave.open(str(path)) as wf:
+        assert wf.data_length == 0
+
+
+def test_readinto(wf):
+    buffer = bytearray(wf.block_align * 10 + 3)    # the 3 extra bytes are not a whole frame, and are not used
+    assert wf.readinto(buffer) == 10
+    assert wf.data_position == wf.block_align * 10
+
+    wf.seek(0)
+    assert bytes(buffer[:wf.block_align * 10]) == wf.read(wf.block_align * 10)
+
+    wf.seek(-wf.block_align * 2, 2)
+    assert wf.read_frames_into(buffer, 5) == 2      # clamped to the end of the data chunk
+    assert wf.readinto(buffer) == 0
+
+
+def test_mmap():
+    with PyWave.open("path/to/a/wave/file.wav", mmap = True) as wf:
+        assert len(wf.data_view) == wf.data_length
+        assert bytes(wf.data_view[:wf.block_align * 4]) == wf.read(wf.block_align * 4)
+
+        np = pytest.importorskip("numpy")
+        assert wf.data_memmap.shape == (wf.samples, wf.channels)
+        assert wf.data_memmap.dtype == np.float32
+        assert wf.data_memmap[30415, 0] == np.float32(0.5768136382102966)     # the position of the peak from the PEAK chunk
+
+
+def test_read_frames(wf):
+    np = pytest.importorskip("numpy")
+    frames = wf.read_frames(100, dtype = "float32")
+    assert frames.shape == (100, 2)
+    wf.seek(0)
+    assert np.array_equal(frames, np.frombuffer(wf.read(100 * wf.block_align), dtype = "<f4").reshape(100, 2))
+
+    wf.seek(30415 * wf.block_align)
+    assert wf.read_frames(1, dtype = "int16")[0, 0] == round(0.5768136382102966 * 32768)
+
+
+def test_read_frames_24bit(tmp_path):
+    np = pytest.importorskip("numpy")
+    values = [0, 1, -1, 2 ** 23 - 1, -2 ** 23, 12345]
+    path = str(tmp_path / "24bit.wav")
+    with PyWave.open(path, mode = "w", channels = 2, bits_per_sample = 24) as wf:
+        wf.write(b"".join(value.to_bytes(3, "little", signed = True) for value in values))
+
+    with PyWave.open(path) as wf:
+        assert wf.read_frames().tolist() == [[0, 1], [-1, 2 ** 23 - 1], [-2 ** 23, 12345]]
+        wf.seek(0)
+        assert wf.read_frames(dtype = "int16")[1].tolist() == [-1, 32767]
+        wf.seek(0)
+        assert wf.read_frames(dtype = "float64")[2, 0] == -1.0
+
+
+@pytest.mark.parametrize("bits_per_sample", [8, 16, 24, 32])
+def test_write_frames_pcm(tmp_path, bits_per_sample):
+    np = pytest.importorskip("numpy")
+    frames = np.array([[0.0, 0.5], [-0.5, 1.5], [-2.0, 0.25]])
+    path = str(tmp_path / "pcm.wav")
+    with PyWave.open(path, mode = "w", channels = 2, bits_per_sample = bits_per_sample) as wf:
+        wf.write_frames(frames)
+        wf.write_frames((np.clip(frames, -1.0, 1.0) * 32767).astype("int16"))
+
+    with PyWave.open(path) as wf:
+        assert wf.data_length == 6 * wf.block_align
+        decoded = wf.read_frames(dtype = "float64")
+    expected = np.clip(frames, -1.0, 1.0 - 2.0 ** (1 - bits_per_sample))
+    assert np.allclose(decoded[:3], expected, atol = 2.0 ** (1 - bits_per_sample))
+    assert np.allclose(decoded[3:], np.clip(frames, -1.0, 1.0), atol = max(2.0 ** (1 - bits_per_sample), 2.0 ** -14))
+
+
+def test_write_frames_float(tmp_path):
+    np = pytest.importorskip("numpy")
+    frames = np.linspace(-1.0, 1.0, 20, dtype = "float32").reshape(10, 2)
+    path = str(tmp_path / "float.wav")
+    with PyWave.open(path, mode = "w", channels = 2, bits_per_sample = 32, format = PyWave.WAVE_FORMAT_IEEE_FLOAT) as wf:
+        wf.write_frames(frames)
+
+    with PyWave.open(path) as wf:
+        assert np.array_equal(wf.read_frames(), frames)
+
+
+def test_lazy_metadata():
+    with PyWave.open("path/to/a/wave/file.wav", lazy_metadata = True) as wf:
+        assert isinstance(wf.metadata, PyWave.LazyMetadata)
+        assert sorted(wf.metadata) == ["PEAK", "fact"]
+        assert not wf.metadata.is_loaded("PEAK")
+
+        wf.read(wf.block_align * 3)
+        assert wf.metadata["PEAK"]["peaks"][0]["position"] == 30415
+        assert wf.metadata.is_loaded("PEAK")
+        assert wf.wf.tell() == wf.data_starts_at + wf.block_align * 3       # loading the metadata does not move the file position
+
+        with PyWave.open("path/to/a/wave/file.wav") as wf_eager:
+            assert dict(wf.metadata) == wf_eager.metadata
+
+    # the loaders don't keep the Wave alive, so dropping it closes the file without the garbage collector
+    wf = PyWave.open("path/to/a/wave/file.wav", lazy_metadata = True)
+    file_ = wf.wf
+    del wf
+    assert file_.closed
+
+
+def riff(*chunks, form = b"RIFF"):
+    """Builds a RIFF WAVE file from (fourcc, data) tuples. Odd sized chunks get a pad byte."""
+    body = b"WAVE" + b"".join(fourcc + len(data).to_bytes(4, "little") + data + b"\x00" * (len(data) % 2) for fourcc, data in chunks)
+    return form + len(body).to_bytes(4, "little") + body
+
+
+FMT_PCM16_STEREO = (1).to_bytes(2, "little") + (2).to_bytes(2, "little") + (8000).to_bytes(4, "little") + (32000).to_bytes(4, "little") + (4).to_bytes(2, "little") + (16).to_bytes(2, "little")
+
+
+def test_chunk_index(tmp_path):
+    info = b"INFO" + b"INAM" + (6).to_bytes(4, "little") + b"title\x00"
+    path = tmp_path / "chunks.wav"
+    path.write_bytes(riff((b"fmt ", FMT_PCM16_STEREO), (b"LIST", info), (b"odd ", b"abc"), (b"LIST", b"adtl"), (b"odd ", b"xy"), (b"data", b"\x00" * 8)))
+
+    with PyWave.open(str(path)) as wf:
+        assert [chunk.fourcc for chunk in wf.chunks.chunks] == [b"fmt ", b"LIST", b"odd ", b"LIST", b"odd ", b"data"]
+        assert len(wf.chunks.find_all(b"LIST")) == 2
+        assert wf.chunks.find(b"odd ").padding == 1
+        assert wf.chunks[b"odd "] == (3, wf.chunks.find(b"odd ").offset)
+        assert wf.metadata["INFO"] == {"INAM": "title"}
+        assert wf.metadata["adtl"] == b"adtl"
+        assert wf.metadata["odd "] == b"abc"
+        assert any("duplicate" in message for message in wf.messages)
+        assert wf.read() == b"\x00" * 8
+
+
+def test_chunk_index_misaligned():
+    # the odd sized 'abc ' chunk is not padded, the next chunk starts right after its data
+    data = b"abc " + (3).to_bytes(4, "little") + b"xyz" + b"data" + (2).to_bytes(4, "little") + b"\x01\x02"
+    index = PyWave.ChunkIndex.scan(io.BytesIO(data), start = 0, buffer_size = 4)
+    assert [(chunk.fourcc, chunk.offset, chunk.size, chunk.padding) for chunk in index.chunks] == [(b"abc ", 8, 3, 0), (b"data", 19, 2, 0)]
+
+
+@pytest.mark.parametrize("rf64", [True, "auto"])
+def test_rf64(tmp_path, monkeypatch, rf64):
+    monkeypatch.setattr(PyWave.Wave, "RF64_LIMIT", 200)     # pretend that 200 bytes are 4 GiB
+    path = str(tmp_path / "rf64.wav")
+    with PyWave.open(path, mode = "w", channels = 2, bits_per_sample = 16, rf64 = rf64) as wf:
+        wf.write(b"\x01\x02" * 20)
+        assert wf._rf64_active == (rf64 is True)
+        wf.write(b"\x03\x04" * 60)
+        assert wf._rf64_active
+
+    with open(path, "rb") as f:
+        header = f.read(16)
+    assert header[:8] == b"RF64\xff\xff\xff\xff"
+    assert header[12:] == b"ds64"
+
+    with PyWave.open(path) as wf:
+        assert wf.rf64
+        assert wf.data_length == 160
+        assert wf.metadata["ds64"]["dataSize"] == 160
+        assert wf.metadata["ds64"]["sampleCount"] == 40
+        assert wf.read() == b"\x01\x02" * 20 + b"\x03\x04" * 60
+
+
+def test_rf64_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(PyWave.Wave, "RF64_LIMIT", 200)
+    with PyWave.open(str(tmp_path / "riff.wav"), mode = "w") as wf:
+        wf.write(b"\x00" * 100)
+        with pytest.raises(PyWave.PyWaveError):
+            wf.write(b"\x00" * 100)
+
+    # the levl chunk is appended on close(), it counts towards the limit as well
+    pytest.importorskip("numpy")
+    path = str(tmp_path / "levl.wav")
+    wf = PyWave.open(path, mode = "w", channels = 1, bits_per_sample = 16, levl_chunk = True)
+    wf.write(b"\x00" * 100)
+    with pytest.raises(PyWave.PyWaveError):
+        wf.close()
+    with PyWave.open(path) as wf:
+        assert wf.data_length == 100 and "levl" not in wf.metadata
+
+    with PyWave.open(path, mode = "w", channels = 1, bits_per_sample = 16, levl_chunk = True, rf64 = "auto") as wf:
+        wf.write(b"\x00" * 100)
+    with PyWave.open(path) as wf:
+        assert wf.rf64 and wf.data_length == 100 and "levl" in wf.metadata
+
+
+def test_open_bytes_and_file_objects():
+    with open("path/to/a/wave/file.wav", "rb") as f:
+        content = f.read()
+
+    for source in (content, bytearray(content), memoryview(content), io.BytesIO(content)):
+        with PyWave.open(source) as wf:
+            assert wf.samples == 99328
+            assert wf.metadata["PEAK"]["peaks"][0]["position"] == 30415
+            wf.seek(wf.block_align * 5)
+            assert wf.read(wf.block_align) == content[88 + wf.block_align * 5:88 + wf.block_align * 6]
+
+    with PyWave.open(content, mmap = True) as wf:
+        assert bytes(wf.data_view[:8]) == content[88:96]
+
+
+class NonSeekable(io.RawIOBase):
+    """A read-only stream like a pipe or socket."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+
+def test_stream():
+    with open("path/to/a/wave/file.wav", "rb") as f:
+        content = f.read()
+
+    with PyWave.open(io.BufferedReader(NonSeekable(content))) as wf:
+        assert wf.stream
+        assert wf.data_length == 794624
+        assert wf.metadata["PEAK"]["version"] == 1
+        assert wf.read(16) == content[88:104]
+        wf.seek(64)
+        assert wf.read(8) == content[88 + 64:88 + 72]
+        with pytest.raises(PyWave.PyWaveError):
+            wf.seek(0)
+        assert len(wf.read()) == 794624 - 72
+
+
+def test_stream_unknown_length():
+    content = riff((b"fmt ", FMT_PCM16_STEREO), (b"data", b"\x01\x02\x03\x04" * 4))
+    content = content[:40] + b"\xff\xff\xff\xff" + content[44:]      # data chunk of unknown length
+
+    with PyWave.open(content, stream = True) as wf:
+        assert wf.unknown_length
+        assert wf.read(8) == b"\x01\x02\x03\x04" * 2
+        assert wf.samples == 2
+        assert wf.read() == b"\x01\x02\x03\x04" * 2
+        assert wf.samples == 4
+
+
+class WriteOnly(io.RawIOBase):
+    """A write-only stream like a pipe or socket."""
+
+    def __init__(self):
+        self.data = b""
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += bytes(data)
+        return len(data)
+
+
+def test_stream_unknown_length_saved(tmp_path):
+    stream = WriteOnly()
+    with PyWave.open(stream, mode = "w", channels = 2, frequency = 8000, bits_per_sample = 16) as wf:
+        wf.write(b"\x01\x02\x03\x04" * 5)
+    path = tmp_path / "stream.wav"
+    path.write_bytes(stream.data)
+
+    # the data chunk size is still 0xFFFFFFFF, the data ends at the end of the file
+    with PyWave.open(str(path)) as wf:
+        assert wf.data_length == 20
+        assert wf.samples == 5
+        assert wf.read() == b"\x01\x02\x03\x04" * 5
+
+
+@pytest.mark.parametrize("total_frames", [None, 3])
+def test_stream_writer(total_frames):
+    output = WriteOnly()
+    with PyWave.open(output, mode = "w", channels = 1, bits_per_sample = 8, total_frames = total_frames) as wf:
+        assert wf.stream
+        wf.write(b"\x01\x02")
+        wf.write(b"\x03")
+
+    with PyWave.open(output.data, stream = True) as wf:
+        assert wf.unknown_length == (total_frames is None)
+        assert wf.read() == b"\x01\x02\x03"
+        assert wf.samples == 3
+
+
+def test_blocks(wf):
+    data = wf.read()
+    block_bytes = 1000 * wf.block_align
+    overlap_bytes = 200 * wf.block_align
+
+    wf.seek(0)
+    blocks = list(wf.blocks(1000, overlap = 200))
+    assert len(blocks) == -(-(wf.samples - 200) // 800)
+    for i, block in enumerate(blocks):
+        assert block == data[i * (block_bytes - overlap_bytes):i * (block_bytes - overlap_bytes) + block_bytes]
+    assert len(blocks[-1]) < block_bytes
+
+    wf.seek(0)
+    assert b"".join(bytes(block) for block in wf.blocks(4096, reuse = True)) == data
+
+
+def test_blocks_dtype(wf):
+    np = pytest.importorskip("numpy")
+    frames = wf.read_frames()
+    wf.seek(0)
+    blocks = list(wf.blocks(4096, dtype = "float32"))
+    assert all(block.shape[1] == 2 for block in blocks)
+    assert np.array_equal(np.concatenate(blocks), frames)
+
+
+def test_async(tmp_path):
+    import asyncio
+
+    async def copy():
+        path = str(tmp_path / "async.wav")
+        async with await PyWave.open_async("path/to/a/wave/file.wav") as wf:
+            assert wf.channels == 2
+            async with await PyWave.open_async(path, mode = "w", channels = wf.channels, frequency = wf.frequency, bits_per_sample = wf.bits_per_sample, format = wf.format) as wf_copy:
+                async for block in wf:
+                    await wf_copy.write(block)
+            await wf.seek(0)
+            data = await wf.read()
+            assert await wf.read_time(0.5, 0.001) == wf.wave.read_time(0.5, 0.001)
+            # methods without a coroutine version would block the event loop, static methods don't
+            with pytest.raises(AttributeError):
+                wf._pread
+            assert wf.get_format_name(wf.format)[0] == "WAVE_FORMAT_IEEE_FLOAT"
+        return path, data
+
+    path, data = asyncio.run(copy())
+    with PyWave.open(path) as wf:
+        assert wf.read() == data
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_scan(tmp_path, workers):
+    paths = ["path/to/a/wave/file.wav", str(tmp_path / "missing.wav"), "README.md"]
+    records = list(PyWave.scan(paths, workers = workers, batch_size = 1))
+    assert [record["path"] for record in records] == paths
+    assert records[0]["error"] is None
+    assert records[0]["frames"] == 99328
+    assert records[0]["format_name"] == "WAVE_FORMAT_IEEE_FLOAT"
+    assert records[1]["error"].startswith("FileNotFoundError")
+    assert records[2]["error"].startswith("PyWaveError")
+
+
+def test_scan_outputs(tmp_path):
+    import json
+    import sqlite3
+    paths = ["path/to/a/wave/file.wav", "README.md"]
+
+    assert PyWave.scan_to_jsonl(paths, str(tmp_path / "scan.jsonl")) == 2
+    with open(str(tmp_path / "scan.jsonl")) as f:
+        assert [json.loads(line)["path"] for line in f] == paths
+
+    database = str(tmp_path / "scan.db")
+    assert PyWave.scan_to_sqlite(paths, database) == 2
+    assert PyWave.scan_to_sqlite(paths, database) == 1     # the unchanged wave file is skipped, the failed file is scanned again
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT frames FROM waves WHERE path = ?", (paths[0], )).fetchone() == (99328, )
+
+    # the table name is quoted, not pasted into the SQL
+    assert PyWave.scan_to_sqlite(paths, database, table = 'x"; DROP TABLE waves; --') == 2
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM waves").fetchone() == (2, )
+        assert connection.execute('SELECT COUNT(*) FROM "x""; DROP TABLE waves; --"').fetchone() == (2, )
+
+
+def test_stats(wf):
+    pytest.importorskip("numpy")
+    wf.read(80)
+    stats = wf.stats(workers = 3, block_frames = 1000)
+    assert wf.tell() == 80
+    assert stats["frames"] == wf.samples
+    assert stats["peak"] == [peak["value"] for peak in wf.metadata["PEAK"]["peaks"]]
+    assert stats["clipped"] == [0, 0]
+
+    single = wf.stats(workers = 1)
+    assert single["max"] == stats["max"] and single["min"] == stats["min"]
+    assert single["rms"] == pytest.approx(stats["rms"])
+    assert single["dc_offset"] == pytest.approx(stats["dc_offset"])
+
+
+def test_stats_pcm(tmp_path):
+    np = pytest.importorskip("numpy")
+    path = str(tmp_path / "stats.wav")
+    with PyWave.open(path, mode = "w", channels = 2, bits_per_sample = 16) as wf:
+        wf.write_frames(np.array([[0.5, 1.0], [0.5, -1.0], [0.5, 0.0], [0.5, 0.0]]))
+
+    with PyWave.open(path) as wf:
+        stats = wf.stats(workers = 2, block_frames = 1)
+    assert stats["dc_offset"][0] == pytest.approx(0.5)
+    assert stats["rms"] == pytest.approx([0.5, 0.5 ** 0.5], abs = 1e-4)
+    assert stats["clipped"] == [0, 2]
+
+
+def test_peak_and_levl_chunks(tmp_path):
+    np = pytest.importorskip("numpy")
+    frames = np.zeros((1000, 2))
+    frames[10, 0] = -0.75
+    frames[700, 1] = 0.5
+    frames[300, 0] = 0.25
+
+    path = str(tmp_path / "peak.wav")
+    with PyWave.open(path, mode = "w", channels = 2, bits_per_sample = 16, peak_chunk = True, levl_chunk = True, levl_block_frames = 256) as wf:
+        wf.write_frames(frames[:5])
+        data = PyWave._encode_frames(frames[5:], PyWave.WAVE_FORMAT_PCM, 16)
+        wf.write(data[:101])     # writes don't have to end on a frame boundary
+        wf.write(data[101:])
+
+    with PyWave.open(path) as wf:
+        assert wf.read_frames(dtype = "float64").shape == (1000, 2)
+        peaks = wf.metadata["PEAK"]["peaks"]
+        assert [peak["position"] for peak in peaks] == [10, 700]
+        assert [peak["value"] for peak in peaks] == [0.75, 0.5]
+
+        levl = wf.metadata["levl"]
+        assert int.from_bytes(levl[20:24], "little") == 4          # number of peak frames: 1000 frames in blocks of 256
+        assert int.from_bytes(levl[24:28], "little") == 10         # position of the peak of peaks
+        values = np.frombuffer(levl[120:], dtype = "<u2").reshape(4, 2, 2)
+        assert values[0].tolist() == [[0, 24575], [0, 0]]          # block 0: negative peak of channel 0
+        assert values[1].tolist() == [[8192, 0], [0, 0]]
+        assert values[2].tolist() == [[0, 0], [16384, 0]]
+
+
+def test_waveform_pyramid(tmp_path):
+    np = pytest.importorskip("numpy")
+    frames = np.zeros((5000, 1))
+    frames[1234, 0] = 0.5
+    frames[4321, 0] = -0.25
+
+    path = str(tmp_path / "pyramid.wav")
+    with PyWave.open(path, mode = "w", channels = 1, bits_per_sample = 16) as wf:
+        wf.write_frames(frames)
+
+    with PyWave.open(path) as wf:
+        pyramid = wf.get_waveform_pyramid(base_block = 100)
+        assert wf.tell() == 0
+    assert [len(minimum) for minimum, maximum in pyramid.levels] == [50, 25, 13, 7, 4, 2, 1]
+
+    minimum, maximum = pyramid.query(0, 5000, 2)
+    assert maximum[:, 0].tolist() == pytest.approx([0.5, 0], abs = 1e-4)
+    assert minimum[:, 0].tolist() == pytest.approx([0, -0.25], abs = 1e-4)
+    assert pyramid.query(1200, 1300, 1000)[1].max() == pytest.approx(0.5, abs = 1e-4)
+
+    # the sidecar is used until the wave file changes
+    cached = PyWave.WaveformPyramid.load(path + PyWave.WaveformPyramid.SIDECAR_SUFFIX, path)
+    assert cached is not None and np.array_equal(cached.levels[0][1], pyramid.levels[0][1])
+    with PyWave.open(path, mode = "w", channels = 1, bits_per_sample = 16) as wf:
+        wf.write_frames(frames[:10])
+    assert PyWave.WaveformPyramid.load(path + PyWave.WaveformPyramid.SIDECAR_SUFFIX, path) is None
+
+
+def test_loudness(tmp_path):
+    np = pytest.importorskip("numpy")
+    # EBU Tech 3341: a 1 kHz sine at -23 dBFS in both channels of a stereo file has a loudness of -23 LUFS
+    t = np.arange(48000 * 5) / 48000
+    sine = 10 ** (-23 / 20) * np.sin(2 * np.pi * 1000 * t)
+    path = str(tmp_path / "loudness.wav")
+    with PyWave.open(path, mode = "w", channels = 2, frequency = 48000, bits_per_sample = 32, format = PyWave.WAVE_FORMAT_IEEE_FLOAT) as wf:
+        wf.write_frames(np.stack((sine, sine), axis = 1))
+
+    with PyWave.open(path) as wf:
+        loudness = wf.loudness(block_frames = 10000)
+    assert loudness["integrated"] == pytest.approx(-23, abs = 0.1)
+    assert loudness["max_momentary"] == pytest.approx(-23, abs = 0.1)
+    assert loudness["max_short_term"] == pytest.approx(-23, abs = 0.1)
+    assert loudness["loudness_range"] == pytest.approx(0, abs = 0.1)
+    assert loudness["true_peak"] == pytest.approx(-23, abs = 0.1)
+
+    # the file has no bext chunk, so one is added; the second call patches it
+    PyWave.write_bext_loudness(path, loudness)
+    PyWave.write_bext_loudness(path, dict(loudness, loudness_range = 1.5, true_peak = -math.inf))
+    with PyWave.open(path) as wf:
+        bext = wf.metadata["bext"]
+        assert wf.read_frames(dtype = "float64").shape == (len(t), 2)
+    assert bext["Version"] == 2
+    assert bext["LoudnessValue"] == round(loudness["integrated"] * 100)
+    assert bext["LoudnessRange"] == 150
+    assert bext["MaxTruePeakLevel"] == -32768
+
+
+def test_block_filter_normalizes_coefficients():
+    np = pytest.importorskip("numpy")
+    samples = np.random.default_rng(0).standard_normal((300, 2))
+    b, a = PyWave._k_weighting(48000)[0]
+    scaled = PyWave._BlockFilter(np.multiply(b, 4), np.multiply(a, 4), 2)(samples)
+    assert np.allclose(scaled, PyWave._BlockFilter(b, a, 2)(samples))
+
+
+def test_read_at(wf):
+    data = wf.read()
+    wf.seek(80)
+    assert wf.read_at(100, 10) == data[800:880]
+    assert wf.read_time(1.0, 0.5) == data[44100 * 8:66150 * 8]
+    assert wf.read_at(wf.samples - 2) == data[-16:]
+    assert wf.read_at(wf.samples + 5, 10) == b""
+    assert wf.tell() == 80
+
+    # many threads reading random regions from the same handle
+    import concurrent.futures
+    import random
+    starts = [random.randrange(wf.samples) for _ in range(200)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+        results = list(executor.map(lambda start: wf.read_at(start, 100), starts))
+    assert all(result == data[start * 8:(start + 100) * 8] for start, result in zip(starts, results))
+    assert wf.tell() == 80
+
+
+def fmt(format_, channels, frequency, block_align, bits_per_sample, extra = None):
+    """Builds a fmt chunk body, a WAVEFORMATEX if <extra> is given."""
+    data = b"".join(value.to_bytes(size, "little") for value, size in ((format_, 2), (channels, 2), (frequency, 4), (frequency * block_align, 4), (block_align, 2), (bits_per_sample, 2)))
+    return data if extra is None else data + len(extra).to_bytes(2, "little") + extra
+
+
+@pytest.mark.parametrize("format_, codes, values", [
+    (PyWave.WAVE_FORMAT_MULAW, b"\xff\x00\x80\x7f", [0, -32124, 32124, 0]),
+    (PyWave.WAVE_FORMAT_ALAW, b"\xd5\x55\xaa\x2a", [8, -8, 32256, -32256]),
+])
+def test_read_g711(format_, codes, values):
+    pytest.importorskip("numpy")
+    data = riff((b"fmt ", fmt(format_, 2, 8000, 2, 8, b"")), (b"fact", (2).to_bytes(4, "little")), (b"data", codes))
+    with PyWave.open(data) as wf:
+        assert wf.compressed and wf.samples == 2
+        assert wf.read_frames(dtype = "int16").tolist() == [values[0:2], values[2:4]]
+
+
+def test_read_adpcm():
+    pytest.importorskip("numpy")
+    # IMA ADPCM, mono, blocks of 8 bytes: a 4 byte header (predictor 0, step index 0) and 8 nibbles (low nibble first)
+    block = b"\x00\x00\x00\x00" + b"\x77\x07\x00\x00"
+    data = riff((b"fmt ", fmt(PyWave.WAVE_FORMAT_DVI_ADPCM, 1, 8000, 8, 4, (9).to_bytes(2, "little"))), (b"fact", (15).to_bytes(4, "little")), (b"data", block * 2))
+    with PyWave.open(data) as wf:
+        assert wf.samples_per_block == 9 and wf.samples == 15
+        samples = wf.read_frames(dtype = "int16")[:, 0].tolist()
+    assert samples[:4] == [0, 11, 41, 104]
+    assert len(samples) == 15           # the padding of the last block is cut off
+
+    # MS ADPCM, mono: coefficient index 0 (256, 0), delta 16, sample 1 = 100, sample 2 = 50, then nibbles (high nibble first)
+    coefficients = b"".join(value.to_bytes(2, "little", signed = True) for pair in PyWave._MS_ADPCM_COEFFICIENTS for value in pair)
+    block = b"\x00" + (16).to_bytes(2, "little") + (100).to_bytes(2, "little") + (50).to_bytes(2, "little") + b"\x10"
+    data = riff((b"fmt ", fmt(PyWave.WAVE_FORMAT_ADPCM, 1, 8000, 8, 4, (4).to_bytes(2, "little") + (7).to_bytes(2, "little") + coefficients)), (b"data", block))
+    with PyWave.open(data) as wf:
+        assert wf.adpcm_coefficients == list(PyWave._MS_ADPCM_COEFFICIENTS)
+        assert wf.read_frames(dtype = "int16")[:, 0].tolist() == [50, 100, 116, 116]
+
+
+@pytest.mark.parametrize("format_, fmt_size, tolerance", [(PyWave.WAVE_FORMAT_ALAW, 18, 0.02), (PyWave.WAVE_FORMAT_MULAW, 18, 0.02), (PyWave.WAVE_FORMAT_DVI_ADPCM, 20, 0.05)])
+def test_write_compressed(tmp_path, format_, fmt_size, tolerance):
+    np = pytest.importorskip("numpy")
+    t = np.arange(5000) / 8000
+    frames = np.stack((0.5 * np.sin(2 * np.pi * 440 * t), 0.25 * np.sin(2 * np.pi * 300 * t)), axis = 1)
+    path = str(tmp_path / "compressed.wav")
+    with PyWave.open(path, mode = "w", channels = 2, frequency = 8000, format = format_) as wf:
+        wf.write_frames(frames[:1234])
+        wf.write_frames(frames[1234:])
+
+    with PyWave.open(path) as wf:
+        assert wf.chunks[b"fmt "][0] == fmt_size
+        assert wf.compressed and wf.samples == 5000
+        assert int.from_bytes(wf.metadata["fact"], "little") == 5000
+        decoded = wf.read_frames(dtype = "float64")
+    assert decoded.shape == (5000, 2)
+    assert np.abs(decoded - frames).max() < tolerance
+
+
+def test_adpcm_frame_addressing(tmp_path):
+    np = pytest.importorskip("numpy")
+    path = str(tmp_path / "ima.wav")
+    with PyWave.open(path, mode = "w", channels = 2, frequency = 8000, format = PyWave.WAVE_FORMAT_DVI_ADPCM) as wf:
+        wf.write_frames(np.sin(np.arange(20002).reshape(10001, 2) * 0.01) * 0.5)
+
+    with PyWave.open(path) as wf:
+        everything = wf.read_frames(dtype = "int16")
+        assert everything.shape == (10001, 2)
+        # frames that start and end within compression blocks
+        assert wf.read_frames_at(100, 10, "int16").tolist() == everything[100:110].tolist()
+        assert wf.read_frames_at(9990, dtype = "int16").tolist() == everything[9990:].tolist()
+        with pytest.raises(PyWave.PyWaveError):
+            wf.read_at(100, 10)
+
+        # read_frames() returns exactly the requested frames, the rest of the block is kept for the next call
+        wf.seek(0)
+        parts = [wf.read_frames(10, "int16"), wf.read_frames(5000, "float64"), wf.read_frames(dtype = "int16")]
+        assert [len(part) for part in parts] == [10, 5000, 4991]
+        assert parts[0].tolist() == everything[:10].tolist()
+        assert parts[1] == pytest.approx(everything[10:5010] / 32768.0)
+        assert parts[2].tolist() == everything[5010:].tolist()
+
+        wf.seek(0)
+        blocks = list(wf.blocks(4096, overlap = 96, dtype = "int16"))
+        assert [len(block) for block in blocks] == [4096, 4096, 2001]
+        assert np.concatenate([blocks[0]] + [block[96:] for block in blocks[1:]]).tolist() == everything.tolist()
+
+        stats = wf.stats(workers = 2, block_frames = 1000)
+        assert stats["frames"] == 10001
+        assert stats["rms"] == pytest.approx(np.sqrt(((everything / 32768.0) ** 2).mean(axis = 0)))
+        assert wf.get_waveform_pyramid(cache = False).frames == 10001
+
+
+def test_resample(tmp_path):
+    np = pytest.importorskip("numpy")
+    t = np.arange(44100) / 44100
+    source = str(tmp_path / "44100.wav")
+    with PyWave.open(source, mode = "w", channels = 2, frequency = 44100, bits_per_sample = 32, format = PyWave.WAVE_FORMAT_IEEE_FLOAT) as wf:
+        wf.write_frames(np.stack((np.sin(2 * np.pi * 1000 * t), np.sin(2 * np.pi * 3000 * t)), axis = 1) * 0.5)
+
+    result = PyWave.resample(source, str(tmp_path / "48000.wav"), 48000)
+    assert result["frames"] == [44100, 48000]
+    assert result["realtime_factor"] > 0
+    with PyWave.open(str(tmp_path / "48000.wav")) as wf:
+        assert wf.frequency == 48000 and wf.format == PyWave.WAVE_FORMAT_IEEE_FLOAT
+        resampled = wf.read_frames(dtype = "float64")
+    t = np.arange(48000) / 48000
+    expected = np.stack((np.sin(2 * np.pi * 1000 * t), np.sin(2 * np.pi * 3000 * t)), axis = 1) * 0.5
+    assert np.abs(resampled - expected)[1000:-1000].max() < 1e-4
+
+    # the filter state is carried over between blocks, so the block size doesn't matter
+    PyWave.resample(source, str(tmp_path / "blocks.wav"), 48000, block_frames = 1000)
+    with PyWave.open(str(tmp_path / "blocks.wav")) as wf:
+        assert np.allclose(wf.read_frames(dtype = "float64"), resampled, atol = 1e-6)
+
+
+def test_read_channels_and_remix():
+    np = pytest.importorskip("numpy")
+    guid = (1).to_bytes(4, "little") + b"\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+    extensible = fmt(PyWave.WAVE_FORMAT_EXTENSIBLE, 6, 48000, 12, 16, (16).to_bytes(2, "little") + (0x3F).to_bytes(4, "little") + guid)
+    frames = (np.arange(60).reshape(10, 6) * 100).astype("<i2")      # 5.1: FL FR FC LFE BL BR
+    data = riff((b"fmt ", extensible), (b"data", frames.tobytes()))
+
+    with PyWave.open(data) as wf:
+        assert PyWave.get_speakers(wf.channel_mask, wf.channels) == ["FL", "FR", "FC", "LFE", "BL", "BR"]
+        assert wf.read_channels(["FC"], 3).tolist() == frames[:3, 2:3].tolist()
+        assert wf.read_channels([5, "FL"], dtype = "int32").tolist() == (frames[3:, [5, 0]].astype("i4") << 16).tolist()
+
+    with PyWave.open(data) as wf:
+        stereo = wf.read_remixed("stereo")
+    samples = frames / 32768
+    half = 0.5 ** 0.5
+    assert stereo[:, 0] == pytest.approx(samples[:, 0] + half * (samples[:, 2] + samples[:, 4]))
+    assert stereo[:, 1] == pytest.approx(samples[:, 1] + half * (samples[:, 2] + samples[:, 5]))
+
+    # without a channel mask, 6 channels are 5.1 (see DEFAULT_CHANNEL_MASKS), like for the loudness
+    with PyWave.open(riff((b"fmt ", fmt(1, 6, 48000, 12, 16)), (b"data", frames.tobytes()))) as wf:
+        assert np.array_equal(wf.read_remixed("stereo"), stereo)
+
+    matrix, mask = PyWave.get_remix_matrix(0x3F, 6, "stereo", normalize = True)
+    assert mask == 0x3 and np.abs(matrix).sum(axis = 0) == pytest.approx([1, 1])
+    # layouts that are contained in the input are picked, others need a preset
+    assert PyWave.get_remix_matrix(0x3F, 6, "3.0")[0].tolist() == np.eye(6)[:, :3].tolist()
+    with pytest.raises(PyWave.PyWaveError):
+        PyWave.get_remix_matrix(0x3, 2, "5.1")
+
+
+def test_convert(tmp_path):
+    np = pytest.importorskip("numpy")
+    source = str(tmp_path / "source.wav")
+    frames = (np.arange(6000).reshape(1000, 6) % 200 - 100) / 512
+    with PyWave.open(source, mode = "w", channels = 6, frequency = 48000, bits_per_sample = 32, format = PyWave.WAVE_FORMAT_IEEE_FLOAT, channel_mask = 0x3F) as wf:
+        wf.write_frames(frames)
+
+    # only the container changes, so the data is copied as it is
+    result = PyWave.convert(source, str(tmp_path / "rf64.wav"), rf64 = True)
+    assert result["copied"] and result["frames"] == [1000, 1000]
+    with PyWave.open(str(tmp_path / "rf64.wav")) as wf, PyWave.open(source) as original:
+        assert wf.rf64 and wf.channel_mask == 0x3F
+        assert wf.read() == original.read()
+
+    result = PyWave.convert(source, str(tmp_path / "stereo.wav"), layout = "stereo", format = PyWave.WAVE_FORMAT_PCM, bits_per_sample = 24)
+    assert not result["copied"]
+    with PyWave.open(str(tmp_path / "stereo.wav")) as wf, PyWave.open(source) as original:
+        assert (wf.channels, wf.bits_per_sample, wf.subformat, wf.channel_mask) == (2, 24, PyWave.WAVE_FORMAT_PCM, 0x3)
+        assert np.abs(wf.read_frames(dtype = "float64") - original.read_remixed("stereo")).max() < 1e-6
+
+    # compressed files can't have a channel mask, the 5.1 speakers are the defaults of 6 channels
+    for format_ in (PyWave.WAVE_FORMAT_ALAW, PyWave.WAVE_FORMAT_DVI_ADPCM):
+        PyWave.convert(source, str(tmp_path / "compressed.wav"), format = format_)
+        with PyWave.open(str(tmp_path / "compressed.wav")) as wf:
+            assert (wf.format, wf.channels, wf.samples) == (format_, 6, 1000)
+            assert PyWave.get_speakers(getattr(wf, "channel_mask", 0), wf.channels) == PyWave.get_speakers(0x3F, 6)
+
+
+def test_convert_pcm_to_float(tmp_path):
+    np = pytest.importorskip("numpy")
+    source = str(tmp_path / "pcm16.wav")
+    with PyWave.open(source, mode = "w", channels = 2, frequency = 8000, bits_per_sample = 16) as wf:
+        wf.write(b"\x00\x40\x00\xc0" * 100)
+
+    # the float writer defaults to 32 bits per sample
+    assert not PyWave.convert(source, str(tmp_path / "float.wav"), format = PyWave.WAVE_FORMAT_IEEE_FLOAT)["copied"]
+    assert PyWave.main(["convert", source, str(tmp_path / "cli.wav"), "--format", "float"]) == 0
+    for name in ("float.wav", "cli.wav"):
+        with PyWave.open(str(tmp_path / name)) as wf:
+            assert (wf.format, wf.bits_per_sample) == (PyWave.WAVE_FORMAT_IEEE_FLOAT, 32)
+            assert wf.read_frames().tolist() == [[0.5, -0.5]] * 100
+
+
+def test_command_line(tmp_path, capsys):
+    import json
+    pytest.importorskip("numpy")
+    (tmp_path / "sub").mkdir()
+    with PyWave.open(str(tmp_path / "sub" / "a.wav"), mode = "w", channels = 1, frequency = 8000, bits_per_sample = 16) as wf:
+        wf.write(b"\x00\x40" * 800)
+    (tmp_path / "notes.txt").write_text("not a wave file")
+
+    assert PyWave.main(["scan", str(tmp_path), "--workers", "1"]) == 0
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(record["channels"], record["frames"], record["error"]) for record in records] == [(1, 800, None)]
+
+    assert PyWave.main(["stats", str(tmp_path / "sub" / "a.wav"), str(tmp_path / "notes.txt")]) == 1
+    ok, failed = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert ok["peak"] == [0.5] and ok["error"] is None
+    assert failed["error"].startswith("PyWaveError")
+
+    assert PyWave.main(["info", str(tmp_path / "notes.txt"), str(tmp_path / "sub" / "a.wav")]) == 1
+    assert [json.loads(line)["error"] is None for line in capsys.readouterr().out.splitlines()] == [False, True]
+
+    # the modules of the command line and the scan outputs are only imported when they are used
+    import subprocess
+    import sys
+    code = "import sys, PyWave; print(sorted(set(sys.modules) & {'argparse', 'asyncio', 'json', 'sqlite3'}))"
+    assert subprocess.run([sys.executable, "-c", code], capture_output = True, text = True, check = True).stdout.strip() == "[]"
+
+
+def test_corpus(tmp_path):
+    np = pytest.importorskip("numpy")
+    import wave_corpus
+    corpus = wave_corpus.generate_corpus(str(tmp_path), wave_corpus.corpus_specs(sizes = ("empty", "tiny", "small"), channels = (1, 2, 6)))
+    for spec in corpus:
+        with PyWave.open(spec["path"]) as wf:
+            assert (wf.channels, wf.frequency, wf.samples) == (spec["channels"], spec["frequency"], spec["frames"]), spec["name"]
+            assert wf._get_sample_format() == spec["format"], spec["name"]
+            frames = wf.read_frames(dtype = "float32")
+            assert frames.shape == (spec["frames"], spec["channels"]) and np.isfinite(frames).all(), spec["name"]
+            if spec["layout"] in ("metadata", "misaligned_list", "trailing"):
+                assert wf.metadata["INFO"]["ISFT"] == "wave_corpus", spec["name"]
+
+
+def test_benchmarks(tmp_path):
+    pytest.importorskip("numpy")
+    import bench_pywave
+    report = bench_pywave.run(str(tmp_path), repeats = 1, size = "small")
+    names = {entry["name"] for entry in report["results"]}
+    assert {"open", "open_lazy", "metadata", "probe", "scan", "read", "read_frames", "random_read", "random_read_frames", "write_frames"} <= names
+    assert all(entry["value"] > 0 for entry in report["results"])
+
+    slower = {"results": [dict(entry, value = entry["value"] * (0.5 if entry["unit"].endswith("/s") else 2)) for entry in report["results"]]}
+    assert bench_pywave.compare(report, report, 0.1) == []
+    assert len(bench_pywave.compare(slower, report, 0.1)) == len(report["results"])
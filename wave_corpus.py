@@ -0,0 +1,266 @@
+"""Generates a corpus of synthetic wave files for tests and benchmarks.
+
+Every supported format, bit depth, channel count and size is covered, plus
+files with unusual chunk layouts (odd sized chunks with pad bytes, a
+misaligned LIST chunk, large unknown chunks, chunks after the data chunk,
+RF64). The files are built byte by byte with the standard library only, so
+they don't depend on the writer of PyWave. The data is deterministic noise
+(seeded with the file name), which is valid for every format.
+
+    python wave_corpus.py DIRECTORY [--sizes empty,tiny,small,medium]
+
+writes the files and a manifest (corpus.json) with the spec of every file.
+"""
+
+import argparse
+import array
+import json
+import os
+import random
+import struct
+import sys
+import zlib
+
+
+WAVE_FORMAT_PCM             = 0x0001
+WAVE_FORMAT_ADPCM           = 0x0002
+WAVE_FORMAT_IEEE_FLOAT      = 0x0003
+WAVE_FORMAT_ALAW            = 0x0006
+WAVE_FORMAT_MULAW           = 0x0007
+WAVE_FORMAT_DVI_ADPCM       = 0x0011
+WAVE_FORMAT_EXTENSIBLE      = 0xFFFE
+
+# name: (format, bits per sample, valid bits per sample, extensible)
+FORMATS = {
+    "pcm8":         (WAVE_FORMAT_PCM,        8,  8,  False),
+    "pcm16":        (WAVE_FORMAT_PCM,        16, 16, False),
+    "pcm24":        (WAVE_FORMAT_PCM,        24, 24, False),
+    "pcm32":        (WAVE_FORMAT_PCM,        32, 32, False),
+    "float32":      (WAVE_FORMAT_IEEE_FLOAT, 32, 32, False),
+    "float64":      (WAVE_FORMAT_IEEE_FLOAT, 64, 64, False),
+    "ext_pcm24_20": (WAVE_FORMAT_PCM,        24, 20, True),
+    "ext_float32":  (WAVE_FORMAT_IEEE_FLOAT, 32, 32, True),
+    "alaw":         (WAVE_FORMAT_ALAW,       8,  8,  False),
+    "mulaw":        (WAVE_FORMAT_MULAW,      8,  8,  False),
+    "ima_adpcm":    (WAVE_FORMAT_DVI_ADPCM,  4,  4,  False),
+    "ms_adpcm":     (WAVE_FORMAT_ADPCM,      4,  4,  False),
+}
+
+# name: number of frames (at 48 kHz)
+SIZES = {
+    "empty":    0,
+    "tiny":     1,
+    "small":    4800,
+    "medium":   48000,
+    "large":    48000 * 60,
+}
+
+CHANNELS = (1, 2, 6, 8)
+
+# channel masks for the files with more than 2 channels (5.1 and 7.1)
+CHANNEL_MASKS = {1: 0x4, 2: 0x3, 6: 0x3F, 8: 0x63F}
+
+# plain:            fmt, (fact,) data
+# metadata:         fmt, bext, LIST INFO with odd sized strings, (fact,) data
+# padded:           an odd sized unknown chunk with its pad byte and a JUNK chunk in front of the data
+# misaligned_list:  a LIST chunk with a stray null byte in front of the INFO tag
+# large_unknown:    an unknown chunk of UNKNOWN_CHUNK_SIZE bytes in front of the data (written as a sparse file)
+# trailing:         the data chunk comes right after fmt, a LIST chunk and an unknown chunk follow it
+# rf64:             RF64 container with a ds64 chunk
+LAYOUTS = ("plain", "metadata", "padded", "misaligned_list", "large_unknown", "trailing", "rf64")
+
+UNKNOWN_CHUNK_SIZE = 16 << 20
+
+DEFAULT_SIZES = ("empty", "tiny", "small", "medium")
+
+_MS_ADPCM_COEFFICIENTS = ((256, 0), (512, -256), (0, 0), (192, 64), (240, 0), (460, -208), (392, -232))
+_SUBFORMAT_GUID_TAIL = b"\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+
+
+def block_layout(format_name, channels, frequency = 48000):
+    """Returns (block_align, samples_per_block) of a format."""
+    format_, bits_per_sample, _, _ = FORMATS[format_name]
+    if format_ in (WAVE_FORMAT_DVI_ADPCM, WAVE_FORMAT_ADPCM):
+        block_align = 256 * channels * max(1, frequency // 11025)
+        header = 4 if format_ == WAVE_FORMAT_DVI_ADPCM else 7
+        return block_align, (block_align - header * channels) * 8 // (4 * channels) + (1 if format_ == WAVE_FORMAT_DVI_ADPCM else 2)
+    return channels * bits_per_sample // 8, 1
+
+
+def _chunk(fourcc, data):
+    return fourcc + struct.pack("<I", len(data)) + data + b"\x00" * (len(data) % 2)
+
+
+def _fmt_chunk(format_name, channels, frequency):
+    format_, bits_per_sample, valid_bits, extensible = FORMATS[format_name]
+    block_align, samples_per_block = block_layout(format_name, channels, frequency)
+    average_bytes_per_sec = frequency * block_align // samples_per_block
+    extensible = extensible or (channels > 2 and format_ in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT))
+    tag = WAVE_FORMAT_EXTENSIBLE if extensible else format_
+    data = struct.pack("<HHIIHH", tag, channels, frequency, average_bytes_per_sec, block_align, bits_per_sample)
+    if extensible:
+        data += struct.pack("<HHI", 22, valid_bits, CHANNEL_MASKS.get(channels, 0)) + struct.pack("<I", format_) + _SUBFORMAT_GUID_TAIL
+    elif format_ == WAVE_FORMAT_DVI_ADPCM:
+        data += struct.pack("<HH", 2, samples_per_block)
+    elif format_ == WAVE_FORMAT_ADPCM:
+        data += struct.pack("<HHH", 32, samples_per_block, len(_MS_ADPCM_COEFFICIENTS))
+        data += b"".join(struct.pack("<hh", *pair) for pair in _MS_ADPCM_COEFFICIENTS)
+    elif format_ != WAVE_FORMAT_PCM:
+        data += struct.pack("<H", 0)
+    return _chunk(b"fmt ", data)
+
+
+def _tile(format_name, channels, frequency, rng, size):
+    """Returns about <size> bytes of valid data (whole blocks), which is repeated to fill the data chunk."""
+    format_, bits_per_sample, valid_bits, _ = FORMATS[format_name]
+    block_align, _ = block_layout(format_name, channels, frequency)
+    blocks = max(1, size // block_align)
+    if format_ == WAVE_FORMAT_IEEE_FLOAT:
+        values = array.array("f" if bits_per_sample == 32 else "d", (rng.uniform(-1.0, 1.0) for _ in range(blocks * channels)))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tobytes()
+    if format_ == WAVE_FORMAT_PCM and valid_bits < bits_per_sample:
+        # the unused low bits are zero
+        mask = (1 << bits_per_sample) - (1 << (bits_per_sample - valid_bits))
+        return b"".join((rng.getrandbits(bits_per_sample) & mask).to_bytes(bits_per_sample // 8, "little") for _ in range(blocks * channels))
+    if format_ == WAVE_FORMAT_DVI_ADPCM:
+        # per channel: the first sample, the step index (0 to 88) and a reserved byte
+        return b"".join(
+            b"".join(struct.pack("<hBB", rng.randint(-32768, 32767), rng.randint(0, 88), 0) for _ in range(channels)) + rng.randbytes(block_align - 4 * channels)
+            for _ in range(blocks))
+    if format_ == WAVE_FORMAT_ADPCM:
+        # the predictor index per channel, then the delta, the second and the first sample per channel
+        return b"".join(
+            bytes(rng.randint(0, 6) for _ in range(channels))
+            + struct.pack("<{}h".format(channels), *(rng.randint(16, 1024) for _ in range(channels)))
+            + struct.pack("<{}h".format(2 * channels), *(rng.randint(-32768, 32767) for _ in range(2 * channels)))
+            + rng.randbytes(block_align - 7 * channels)
+            for _ in range(blocks))
+    return rng.randbytes(blocks * block_align)
+
+
+def _info_list(misaligned = False):
+    # odd sized strings (with the null terminator) get a pad byte
+    entries = b"".join(_chunk(tag, value.encode() + b"\x00") for tag, value in ((b"INAM", "Synthetic"), (b"ISFT", "wave_corpus"), (b"ICMT", "odd")))
+    return _chunk(b"LIST", (b"\x00" if misaligned else b"") + b"INFO" + entries)
+
+
+def _bext_chunk(name):
+    description = "Synthetic test file {}".format(name).encode()[:256]
+    data = description.ljust(256, b"\x00") + b"wave_corpus".ljust(32, b"\x00") + name.encode()[:32].ljust(32, b"\x00")
+    data += b"2024-01-01" + b"12:00:00" + struct.pack("<IIH", 48000, 0, 1) + bytes(64) + bytes(10) + bytes(180)
+    return _chunk(b"bext", data + b"CodingHistory\r\n")
+
+
+def spec(format_name, channels, size_name, layout = "plain", frequency = 48000):
+    """Returns the spec (dict) of a corpus file, see write_wave()."""
+    format_, bits_per_sample, valid_bits, _ = FORMATS[format_name]
+    return {
+        "name": "{}_{}ch_{}_{}.wav".format(format_name, channels, size_name, layout),
+        "format_name": format_name,
+        "format": format_,
+        "bits_per_sample": bits_per_sample,
+        "valid_bits_per_sample": valid_bits,
+        "channels": channels,
+        "frequency": frequency,
+        "size": size_name,
+        "frames": SIZES[size_name],
+        "layout": layout,
+    }
+
+
+def write_wave(path, spec_):
+    """Writes the wave file described by <spec_> (see spec()) to <path>
+and returns the number of bytes written."""
+    name, format_name, channels, frequency, frames, layout = (spec_[key] for key in ("name", "format_name", "channels", "frequency", "frames", "layout"))
+    format_ = FORMATS[format_name][0]
+    block_align, samples_per_block = block_layout(format_name, channels, frequency)
+    data_size = -(-frames // samples_per_block) * block_align
+    rng = random.Random(zlib.crc32(name.encode()))
+    tile = _tile(format_name, channels, frequency, rng, min(data_size, 1 << 20)) if data_size else b""
+
+    header = [b"WAVE"]
+    if layout == "rf64":
+        header.append(b"ds64" + struct.pack("<I", 28) + bytes(28))       # filled in below
+    header.append(_fmt_chunk(format_name, channels, frequency))
+    if format_ not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        header.append(_chunk(b"fact", struct.pack("<I", frames)))
+    if layout == "metadata":
+        header.append(_bext_chunk(name))
+        header.append(_info_list())
+    elif layout == "padded":
+        header.append(_chunk(b"xtra", b"odd"))
+        header.append(_chunk(b"JUNK", bytes(26)))
+    elif layout == "misaligned_list":
+        header.append(_info_list(misaligned = True))
+    trailer = b""
+    if layout == "trailing":
+        trailer = _info_list() + _chunk(b"xtra", b"after the data")
+    header = b"".join(header)
+    unknown_size = UNKNOWN_CHUNK_SIZE if layout == "large_unknown" else 0
+
+    riff_size = len(header) + (8 + unknown_size if unknown_size else 0) + 8 + data_size + data_size % 2 + len(trailer)
+    with open(path, "wb") as f:
+        if layout == "rf64":
+            f.write(b"RF64" + struct.pack("<I", 0xFFFFFFFF))
+            header = header[:12] + struct.pack("<QQQI", riff_size, data_size, frames, 0) + header[40:]
+        else:
+            f.write(b"RIFF" + struct.pack("<I", riff_size))
+        f.write(header)
+        if unknown_size:
+            f.write(b"ukwn" + struct.pack("<I", unknown_size))
+            f.seek(unknown_size, os.SEEK_CUR)       # left as a hole, reads as zeros
+        f.write(b"data" + struct.pack("<I", 0xFFFFFFFF if layout == "rf64" else data_size))
+        written = 0
+        while written < data_size:
+            part = tile[:data_size - written]
+            f.write(part)
+            written += len(part)
+        if data_size % 2:
+            f.write(b"\x00")
+        f.write(trailer)
+        return f.tell()
+
+
+def corpus_specs(sizes = DEFAULT_SIZES, formats = tuple(FORMATS), channels = CHANNELS, layouts = LAYOUTS):
+    """Returns the specs of the corpus: every format with every channel
+count and size (in the plain layout), and every other layout with
+16 bit PCM and IMA ADPCM (stereo) in every size."""
+    specs = [spec(format_name, count, size) for size in sizes for format_name in formats for count in channels]
+    specs += [spec(format_name, 2, size, layout) for size in sizes for layout in layouts if layout != "plain" for format_name in ("pcm16", "ima_adpcm") if format_name in formats]
+    return specs
+
+
+def generate_corpus(directory, specs = None):
+    """Writes the files of <specs> (corpus_specs() by default) and the
+manifest 'corpus.json' to <directory> and returns the list of specs,
+each with the 'path' and the 'bytes' of the file."""
+    os.makedirs(directory, exist_ok = True)
+    specs = corpus_specs() if specs is None else specs
+    result = []
+    for spec_ in specs:
+        path = os.path.join(directory, spec_["name"])
+        result.append(dict(spec_, path = path, bytes = write_wave(path, spec_)))
+    with open(os.path.join(directory, "corpus.json"), "w", encoding = "utf-8") as f:
+        json.dump(result, f, indent = 1)
+    return result
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Generate a corpus of synthetic wave files.")
+    parser.add_argument("directory")
+    parser.add_argument("--sizes", default = ",".join(DEFAULT_SIZES), help = "comma separated sizes of {} (default: %(default)s)".format(", ".join(SIZES)))
+    parser.add_argument("--formats", default = ",".join(FORMATS), help = "comma separated formats (default: all)")
+    parser.add_argument("--channels", default = ",".join(map(str, CHANNELS)), help = "comma separated channel counts (default: %(default)s)")
+    parser.add_argument("--layouts", default = ",".join(LAYOUTS), help = "comma separated chunk layouts (default: all)")
+    args = parser.parse_args(argv)
+
+    specs = corpus_specs(args.sizes.split(","), args.formats.split(","), [int(count) for count in args.channels.split(",")], args.layouts.split(","))
+    corpus = generate_corpus(args.directory, specs)
+    print("{} files, {} bytes written to '{}'".format(len(corpus), sum(spec_["bytes"] for spec_ in corpus), args.directory))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())